@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+import logging
+from typing import Awaitable, Callable, Optional
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 最后一次触发后静默多久才刷新（秒）
+ACCOUNT_REFRESH_DEBOUNCE = float(os.getenv("ACCOUNT_REFRESH_DEBOUNCE", "1"))
+# 持续有触发时，距第一次触发最多等待多久必须刷新（秒）
+ACCOUNT_REFRESH_MAX_STALENESS = float(os.getenv("ACCOUNT_REFRESH_MAX_STALENESS", "5"))
+
+
+class AccountSummaryRefresher:
+    """
+    账户摘要合并刷新
+    - trigger()：标记需要刷新，窗口内的任意多次触发只产生一次上游请求和一次写入
+    - 最后一次触发后静默 debounce 秒即刷新；持续触发时最迟 max_staleness 秒刷新一次
+    - refresh_now()：立即刷新（手动同步），同时取消等待中的合并刷新
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[AsyncSession], Awaitable[None]],
+        debounce: float = ACCOUNT_REFRESH_DEBOUNCE,
+        max_staleness: float = ACCOUNT_REFRESH_MAX_STALENESS,
+    ):
+        self.refresh = refresh
+        self.debounce = debounce
+        self.max_staleness = max_staleness
+        self._first_trigger: Optional[float] = None
+        self._last_trigger = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.triggers = 0
+        self.refreshes = 0
+
+    def trigger(self):
+        now = time.monotonic()
+        self.triggers += 1
+        self._last_trigger = now
+        if self._first_trigger is None:
+            self._first_trigger = now
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._debounced())
+
+    async def refresh_now(self):
+        """立即刷新，异常向上抛出"""
+        self._first_trigger = None
+        await self._refresh()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _debounced(self):
+        while self._first_trigger is not None:
+            deadline = min(
+                self._last_trigger + self.debounce,
+                self._first_trigger + self.max_staleness
+            )
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self._first_trigger = None
+            try:
+                await self._refresh()
+            except Exception as e:
+                logger.error(f"合并刷新账户摘要失败: {e}")
+
+    async def _refresh(self):
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                await self.refresh(db)
+            self.refreshes += 1
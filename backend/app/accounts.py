@@ -0,0 +1,52 @@
+import asyncio
+import os
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from app.models import Trade
+from app.oanda import default_account_id, oanda_clients
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 后台同步 / 对账时全局最多同时处理的账户数（所有账户、所有任务共用）
+ACCOUNT_SYNC_CONCURRENCY = int(os.getenv("ACCOUNT_SYNC_CONCURRENCY", "5"))
+
+_account_slots = asyncio.Semaphore(ACCOUNT_SYNC_CONCURRENCY)
+
+
+def resolve_account_id(account_id: Optional[str]) -> str:
+    """未指定账户时使用默认账户"""
+    return account_id or default_account_id()
+
+
+def account_clause(account_id: str):
+    """
+    按账户过滤 trades
+    N8N 写入的行可能没有 account_id，这些行归属默认账户
+    """
+    if account_id == default_account_id():
+        return or_(Trade.account_id == account_id, Trade.account_id.is_(None))
+    return Trade.account_id == account_id
+
+
+async def for_each_account(
+    run: Callable[[str], Awaitable[Any]],
+    account_ids: Optional[Iterable[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    对每个账户并发执行 run(account_id)，全局同时执行数不超过 ACCOUNT_SYNC_CONCURRENCY
+    单个账户失败不影响其他账户，返回 {account_id: {"result": ...} 或 {"error": ...}}
+    """
+    async def one(account_id: str):
+        async with _account_slots:
+            try:
+                return account_id, {"result": await run(account_id)}
+            except Exception as e:
+                logger.error(f"账户 {account_id} 处理失败: {e}")
+                return account_id, {"error": str(e)}
+
+    ids = list(account_ids) if account_ids is not None else oanda_clients.account_ids()
+    return dict(await asyncio.gather(*(one(account_id) for account_id in ids)))
@@ -0,0 +1,137 @@
+import os
+import re
+import html
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from app.models import Trade, TradeArticle
+
+load_dotenv()
+
+# 带版本号的报告 URL 内容不会变化，浏览器可长期缓存（秒）
+ARTICLE_CACHE_MAX_AGE = int(os.getenv("ARTICLE_CACHE_MAX_AGE", "31536000"))
+# 渲染后 HTML 的缓存条数
+ARTICLE_HTML_CACHE_SIZE = int(os.getenv("ARTICLE_HTML_CACHE_SIZE", "256"))
+
+# 迁移前或 intent_id 为空的交易，报告仍在 trades.ai_article 中，统一回退读取
+_version = func.coalesce(TradeArticle.content_hash, func.md5(Trade.ai_article))
+_length = func.coalesce(TradeArticle.content_length, func.length(Trade.ai_article))
+_content = func.coalesce(TradeArticle.content, Trade.ai_article)
+
+
+def _from_trades(stmt: Select) -> Select:
+    return stmt.select_from(Trade).outerjoin(TradeArticle, TradeArticle.intent_id == Trade.intent_id)
+
+
+def trade_with_article_stmt(*where) -> Select:
+    """详情查询：交易行 + 报告的版本号和长度，不读取报告内容"""
+    return _from_trades(
+        select(Trade, _version.label("article_version"), _length.label("article_length"))
+    ).where(*where)
+
+
+def article_ref(intent_id: str, version: Optional[str], length: Optional[int]) -> Optional[Dict]:
+    """详情接口中的报告引用；URL 带版本号，报告更新后 URL 随之变化"""
+    if not version:
+        return None
+    url = f"/api/trades/{quote(intent_id, safe='')}/article?v={version}"
+    return {
+        "url": url,
+        "html_url": f"{url}&format=html",
+        "version": version,
+        "length": length or 0
+    }
+
+
+async def get_article_version(db: AsyncSession, intent_id: str) -> Optional[str]:
+    """只查版本号，用于 ETag 比较和 HTML 缓存命中判断"""
+    result = await db.execute(_from_trades(select(_version)).where(Trade.intent_id == intent_id))
+    return result.scalar_one_or_none()
+
+
+async def load_article(db: AsyncSession, intent_id: str) -> Optional[Tuple[str, str]]:
+    """读取报告内容，返回 (content, version)"""
+    result = await db.execute(_from_trades(select(_content, _version)).where(Trade.intent_id == intent_id))
+    row = result.first()
+    if row is None or row[0] is None:
+        return None
+    return row[0], row[1]
+
+
+# 渲染后的链接 / 图片只允许这些协议；无协议的相对地址和锚点保留
+SAFE_URL_SCHEMES = {"http", "https", "mailto"}
+# 浏览器解析协议时忽略空白和控制字符（"java\tscript:" 等同于 "javascript:"）
+_URL_IGNORED_CHARS = re.compile(r"[\x00-\x20\x7f]+")
+_URL_SCHEME = re.compile(r"^([a-z][a-z0-9+.\-]*):")
+
+
+def is_safe_url(url: str) -> bool:
+    """先解码 HTML 实体（&#58; 等）并去掉空白，再按白名单检查协议"""
+    normalized = _URL_IGNORED_CHARS.sub("", html.unescape(url)).lower()
+    match = _URL_SCHEME.match(normalized)
+    return match is None or match.group(1) in SAFE_URL_SCHEMES
+
+
+class _SafeUrlTreeprocessor:
+    """Markdown treeprocessor：删除协议不在白名单内的 href / src（如 javascript:、data:）"""
+
+    def run(self, root):
+        for element in root.iter():
+            for attribute in ("href", "src"):
+                value = element.get(attribute)
+                if value is not None and not is_safe_url(value):
+                    del element.attrib[attribute]
+
+
+def render_markdown(content: str) -> str:
+    """
+    Markdown 渲染为 HTML（按需导入 markdown 库）
+    报告由 AI 生成，不可信：移除 HTML 解析规则，原始 HTML 按文本转义输出；
+    链接和图片地址只保留白名单协议，在反转义（unescape，优先级 0）之后检查
+    """
+    import markdown
+
+    md = markdown.Markdown(extensions=["tables", "fenced_code", "sane_lists"])
+    md.preprocessors.deregister("html_block")
+    md.inlinePatterns.deregister("html")
+    md.treeprocessors.register(_SafeUrlTreeprocessor(), "safe_url", -10)
+    return md.convert(content)
+
+
+class ArticleHtmlCache:
+    """
+    渲染后的报告 HTML 缓存
+    - 每个 intent_id 保存最近一次渲染结果和对应版本号
+    - 版本号变化（报告被更新）时重新渲染
+    """
+
+    def __init__(self, max_entries: int = ARTICLE_HTML_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+
+    def get(self, intent_id: str, version: str) -> Optional[bytes]:
+        entry = self._entries.get(intent_id)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(intent_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, intent_id: str, version: str, html: bytes):
+        self.renders += 1
+        self._entries[intent_id] = (version, html)
+        self._entries.move_to_end(intent_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "renders": self.renders}
+
+
+article_html_cache = ArticleHtmlCache()
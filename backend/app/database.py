@@ -1,21 +1,112 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import event
 from sqlalchemy.orm import declarative_base
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
 import os
+import time
+import logging
 from dotenv import load_dotenv
+from app.metrics import TimedQueuePool, instrument_engine
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# 主库连接池（写入、Webhook、后台同步）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+# 只读连接池（分析、列表等 GET 接口）：未配置 READ_DATABASE_URL 时同样连主库，但使用独立的连接池，
+# 大查询占满的是只读池，不会让写入等待连接
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or DATABASE_URL
+READ_DB_POOL_SIZE = int(os.getenv("READ_DB_POOL_SIZE", "5"))
+READ_DB_MAX_OVERFLOW = int(os.getenv("READ_DB_MAX_OVERFLOW", "10"))
+READ_DB_POOL_TIMEOUT = float(os.getenv("READ_DB_POOL_TIMEOUT", "10"))  # 只读池等待连接的最长时间（秒）
+# 只读副本连接失败时回退到主库，之后每隔 READ_DB_RETRY_AFTER 秒在后台探测副本是否恢复
+READ_DB_FALLBACK = os.getenv("READ_DB_FALLBACK", "true").lower() in ("1", "true", "yes")
+READ_DB_RETRY_AFTER = float(os.getenv("READ_DB_RETRY_AFTER", "30"))
+
+# SQL 日志：false 不输出；true 输出全部语句（sqlalchemy.engine 的 INFO 日志，经日志队列异步写出）；
+# slow 只输出耗时超过 DB_SLOW_QUERY_MS 毫秒的语句（WARNING）
+DB_ECHO = os.getenv("DB_ECHO", "false").lower()
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+# 慢查询日志中语句的最大长度
+DB_SLOW_QUERY_MAX_LENGTH = 1000
+
 # 创建异步引擎
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,
+    echo=False,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    poolclass=TimedQueuePool,
+    pool_logging_name="write"
 )
 
+
+def _create_read_engine(url: str, name: str):
+    """只读引擎：会话默认只读事务，误写会直接报错"""
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_pre_ping=True,
+        pool_size=READ_DB_POOL_SIZE,
+        max_overflow=READ_DB_MAX_OVERFLOW,
+        pool_timeout=READ_DB_POOL_TIMEOUT,
+        poolclass=TimedQueuePool,
+        pool_logging_name=name,
+        connect_args={"server_settings": {"default_transaction_read_only": "on"}}
+    )
+
+
+read_engine = _create_read_engine(READ_DATABASE_URL, "read")
+# 副本不可用时回退到主库，但仍使用独立的只读连接池，不占用写入连接
+if READ_DATABASE_URL != DATABASE_URL:
+    fallback_read_engine = _create_read_engine(DATABASE_URL, "read_fallback")
+    instrument_engine(fallback_read_engine, "read_fallback")
+else:
+    fallback_read_engine = read_engine
+
+# SQL 执行耗时与连接池等待时间（/metrics）
+instrument_engine(engine, "write")
+instrument_engine(read_engine, "read")
+
+
+def log_slow_queries(engine, threshold_ms: float):
+    """耗时超过阈值的语句记录为 WARNING（不带参数值）"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+        if elapsed_ms >= threshold_ms:
+            logger.warning(
+                "慢查询 %.1fms: %s", elapsed_ms, statement[:DB_SLOW_QUERY_MAX_LENGTH],
+                extra={"duration_ms": round(elapsed_ms, 1), "executemany": executemany}
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("slow_query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+if DB_ECHO in ("1", "true", "yes"):
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+elif DB_ECHO == "slow":
+    for _engine in {engine, read_engine, fallback_read_engine}:
+        log_slow_queries(_engine, DB_SLOW_QUERY_MS)
+
 # 创建异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -25,8 +116,99 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
+FallbackReadSessionLocal = async_sessionmaker(
+    fallback_read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
 Base = declarative_base()
 
+# 只读副本不可用时，在该时间点（monotonic）之前直接使用主库；0 表示副本正常
+_replica_down_until = 0.0
+_replica_probe: Optional[asyncio.Task] = None
+
+
+def read_replica_configured() -> bool:
+    return READ_DATABASE_URL != DATABASE_URL
+
+
+def _mark_replica_down(error: Exception):
+    global _replica_down_until
+    if time.monotonic() >= _replica_down_until:
+        logger.warning(f"只读副本不可用，{READ_DB_RETRY_AFTER:.0f} 秒内回退到主库: {error}")
+    _replica_down_until = time.monotonic() + READ_DB_RETRY_AFTER
+
+
+if read_replica_configured():
+    @event.listens_for(read_engine.sync_engine, "do_connect")
+    def _connect_replica(dialect, conn_rec, cargs, cparams):
+        """副本建立连接失败时标记为不可用，之后的只读会话直接走主库"""
+        try:
+            return dialect.connect(*cargs, **cparams)
+        except Exception as e:
+            _mark_replica_down(e)
+            raise
+
+
+async def _probe_replica():
+    """后台探测副本是否恢复；恢复前只读请求仍走主库"""
+    global _replica_down_until
+    try:
+        async with read_engine.connect() as conn:
+            await conn.exec_driver_sql("SELECT 1")
+    except Exception as e:
+        _mark_replica_down(e)
+        return
+    _replica_down_until = 0.0
+    logger.info("只读副本已恢复")
+
+
+def _read_sessionmaker() -> async_sessionmaker:
+    """
+    选择只读会话工厂，不建立连接：副本的连接在会话第一次执行查询时才取得，
+    命中响应缓存的请求不占用连接
+    """
+    global _replica_probe
+    if not read_replica_configured() or not READ_DB_FALLBACK or _replica_down_until == 0.0:
+        return ReadSessionLocal
+    if time.monotonic() >= _replica_down_until and (_replica_probe is None or _replica_probe.done()):
+        _replica_probe = asyncio.create_task(_probe_replica())
+    return FallbackReadSessionLocal
+
+
+def pool_stats() -> dict:
+    """连接池状态（/health 使用）"""
+    return {
+        "write_pool": engine.pool.status(),
+        "read_pool": read_engine.pool.status(),
+        "read_replica": read_replica_configured(),
+        "replica_fallback": _replica_down_until != 0.0
+    }
+
+
+@asynccontextmanager
+async def read_session():
+    """
+    只读会话
+    配置了只读副本时，副本建连失败即标记为不可用，之后的会话回退到主库上独立的只读连接池（READ_DB_FALLBACK），
+    每隔 READ_DB_RETRY_AFTER 秒在后台探测一次，恢复后切回副本；
+    发现故障的那次请求本身不重试。只读池等待超时不回退
+    """
+    async with _read_sessionmaker()() as session:
+        yield session
+
+
 # 依赖注入：获取数据库会话
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -35,3 +217,8 @@ async def get_db():
         finally:
             await session.close()
 
+
+# 依赖注入：获取只读数据库会话（GET 接口使用）
+async def get_read_db():
+    async with read_session() as session:
+        yield session
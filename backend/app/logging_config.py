@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import orjson
+from dotenv import load_dotenv
+from app.metrics import Counter, register
+
+load_dotenv()
+
+# 非阻塞日志：事件循环中只把记录放入队列，格式化和写出由后台线程完成
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json 或 text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 队列满时丢弃新记录，不阻塞事件循环
+# 按 logger 采样（只作用于 WARNING 以下）：app.routers.webhook=0.1,sqlalchemy.engine=0.01
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+# 按 logger 限速，每秒最多条数（只作用于 WARNING 以下）：app.price_stream=5
+LOG_RATE_LIMIT = os.getenv("LOG_RATE_LIMIT", "")
+# uvicorn 自带的日志同样经过队列输出
+LOG_CAPTURE_UVICORN = os.getenv("LOG_CAPTURE_UVICORN", "true").lower() in ("1", "true", "yes")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+log_records_dropped = Counter(
+    "log_records_dropped_total", "未输出的日志记录数", ("reason",)
+)
+register(log_records_dropped)
+
+# LogRecord 的标准属性，其余属性（logger.info(..., extra={...})）作为结构化字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def parse_logger_settings(value: str) -> Dict[str, float]:
+    """"a=0.1,b.c=5" -> {"a": 0.1, "b.c": 5.0}，忽略格式错误的项"""
+    settings = {}
+    for item in value.split(","):
+        name, _, number = item.strip().partition("=")
+        try:
+            settings[name.strip()] = float(number)
+        except ValueError:
+            continue
+    return settings
+
+
+def _lookup(settings: Dict[str, float], name: str) -> Optional[float]:
+    """按 logger 层级查找最具体的配置（app.routers.webhook -> app.routers -> app）"""
+    while True:
+        if name in settings:
+            return settings[name]
+        if "." not in name:
+            return settings.get("")
+        name = name.rsplit(".", 1)[0]
+
+
+class SamplingRateLimitFilter(logging.Filter):
+    """
+    按 logger 采样和限速，在入队之前丢弃，被丢弃的记录不产生任何格式化开销
+    WARNING 及以上的记录始终保留
+    """
+
+    def __init__(self, sample: Dict[str, float], rate_limit: Dict[str, float]):
+        super().__init__()
+        self.sample = sample
+        self.rate_limit = rate_limit
+        # logger 名 -> (采样率, 每秒条数)，首次出现时解析
+        self._resolved: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        # logger 名 -> [令牌数, 上次补充时间]
+        self._buckets: Dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        settings = self._resolved.get(record.name)
+        if settings is None:
+            settings = self._resolved[record.name] = (
+                _lookup(self.sample, record.name), _lookup(self.rate_limit, record.name)
+            )
+        sample, rate = settings
+
+        if sample is not None and random.random() >= sample:
+            log_records_dropped.inc("sampled")
+            return False
+
+        if rate is not None:
+            now = time.monotonic()
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [rate, now]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                log_records_dropped.inc("rate_limited")
+                return False
+            bucket[0] -= 1
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数，不阻塞、不打印异常"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并 msg 与 args，异常堆栈留给后台线程格式化
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc("queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行 JSON：ts、level、logger、message，以及 extra 字段和异常堆栈"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return orjson.dumps(payload, default=str).decode()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """替换根 logger 的处理器为队列 + 后台线程输出（重复调用无副作用）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingRateLimitFilter(
+        parse_logger_settings(LOG_SAMPLE), parse_logger_settings(LOG_RATE_LIMIT)
+    ))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    if LOG_CAPTURE_UVICORN:
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """写出队列中剩余的记录并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
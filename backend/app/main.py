@@ -1,19 +1,64 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import orders, positions, analytics, webhook, api_config
+from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+from app.routers import orders, positions, analytics, webhook, api_config, trades
+from app.articles import article_html_cache
+from app.database import engine, read_engine, pool_stats
+from app.logging_config import setup_logging
+from app.metrics import Gauge, MetricsMiddleware, register, render_metrics
+from app.oanda import init_oanda_client, close_oanda_client, default_account_id, oanda_clients
+from app.pricing import price_cache
+from app.response_cache import response_cache, bump_version
+from app.price_stream import price_streamer, start_price_stream, stop_price_stream, on_oanda_config_changed
+from app.webhook_dedup import transaction_dedup
+from app.webhook_inbox import InboxWorkerPool
 import os
-import logging
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 响应压缩：超过该字节数的响应使用 gzip（SSE 推送不压缩）
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+
+# 配置日志：队列 + 后台线程输出（LOG_FORMAT、LOG_SAMPLE、LOG_RATE_LIMIT）
+setup_logging()
+
+
+# Webhook 收件箱 worker 池
+inbox_workers = InboxWorkerPool(webhook.handle_oanda_event)
+
+
+async def on_api_config_changed():
+    """账户集合或默认账户变化：切换价格流、启动增量同步，未指定账户的分析缓存失效"""
+    await on_oanda_config_changed()
+    await webhook.transaction_syncer.start()
+    bump_version("account", "trades")
+
+
+oanda_clients.on_change(on_api_config_changed)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动：创建共享的 OANDA 连接池，开启后台价格流、Webhook worker 和增量同步
+    await init_oanda_client()
+    await start_price_stream()
+    await inbox_workers.start()
+    await webhook.transaction_syncer.start()
+    yield
+    # 关闭：停止后台任务，释放连接池
+    await webhook.transaction_syncer.stop()
+    await inbox_workers.stop()
+    await webhook.stop_account_refreshers()
+    await stop_price_stream()
+    await close_oanda_client()
+
 
 app = FastAPI(
     title="量化交易分析 API",
     description="用于同步和分析 OANDA 交易所订单数据的 API（双层数据同步架构）",
-    version="2.1.0"
+    version="2.1.0",
+    lifespan=lifespan
 )
 
 # CORS 配置
@@ -25,11 +70,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 大响应（收益曲线、历史记录、列表）压缩传输
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
+
+# 请求耗时统计（最外层，包含压缩耗时）
+app.add_middleware(MetricsMiddleware)
+
+# 连接池占用（/metrics 输出时读取）
+register(Gauge(
+    "db_pool_checked_out", "连接池中已借出的连接数", ("pool",),
+    lambda: {("write",): engine.pool.checkedout(), ("read",): read_engine.pool.checkedout()}
+))
+
 # 注册路由
 app.include_router(orders.router)
 app.include_router(positions.router)
 app.include_router(analytics.router)
 app.include_router(webhook.router)
+app.include_router(trades.router)
 app.include_router(api_config.router)  # 新增 API配置 路由
 
 @app.get("/")
@@ -42,14 +100,42 @@ async def root():
             "实时价格更新",
             "账户摘要同步",
             "历史交易记录",
-            "API配置管理（支持多交易所切换）"
+            "API配置管理（支持多交易所切换）",
+            "多账户并发同步"
         ],
         "docs": "/docs"
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "version": "2.1.0"}
+    return {
+        "status": "healthy",
+        "version": "2.1.0",
+        "accounts": {
+            "configured": oanda_clients.account_ids(),
+            "default": default_account_id()
+        },
+        "database": pool_stats(),
+        "price_cache": price_cache.stats(),
+        "price_stream": {
+            "running": price_streamer.running,
+            "live": price_streamer.book.live,
+            "symbols": len(price_streamer.symbols),
+            "reconnects": price_streamer.reconnects
+        },
+        "response_cache": response_cache.stats(),
+        "article_html_cache": article_html_cache.stats(),
+        "webhook_dedup": transaction_dedup.stats(),
+        "transaction_sync": {
+            "running": webhook.transaction_syncer.running,
+            "last_result": webhook.transaction_syncer.last_result
+        }
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式指标"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,237 @@
+import os
+import re
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+load_dotenv()
+
+# Prometheus 文本格式的进程内指标（/metrics）
+# 指标只在事件循环线程中更新，计数为普通的 int / float 累加，不加锁；多 worker 部署时每个进程各自暴露
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 延迟直方图的桶（秒），与 Prometheus 客户端的默认值一致
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """按标签计数"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values, total in list(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {total}")
+        return lines
+
+
+class Histogram:
+    """
+    按标签的直方图：每组标签一个桶计数数组
+    observe 只做一次二分查找和两次累加，累计值在输出时计算
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # 标签 -> [各桶计数..., +Inf 桶计数, 总和]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """输出时调用回调取值"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for values, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {value}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（按路由模板）", ("method", "route", "status")
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQL 语句执行耗时", ("pool", "statement")
+)
+db_pool_checkout_duration = Histogram(
+    "db_pool_checkout_seconds", "从连接池取得连接的等待时间（含新建连接）", ("pool",)
+)
+oanda_request_duration = Histogram(
+    "oanda_request_duration_seconds", "OANDA REST 调用耗时（按接口）", ("endpoint", "status")
+)
+webhook_events = Counter(
+    "webhook_events_total", "收到的 OANDA Webhook 事件数", ("type", "result")
+)
+
+_registry: List = [
+    http_request_duration,
+    db_query_duration,
+    db_pool_checkout_duration,
+    oanda_request_duration,
+    webhook_events,
+]
+
+
+def register(metric):
+    """注册额外的指标（如连接池状态 Gauge）"""
+    _registry.append(metric)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# OANDA 路径中的 ID 段归并为 {id}，避免标签基数随订单数增长
+_ID_SEGMENT = re.compile(r"/[0-9][^/]*")
+
+
+def oanda_endpoint(path: str) -> str:
+    """/orders/1234 -> /orders/{id}"""
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """记录连接池 checkout 等待时间的连接池（按 pool_logging_name 区分主库 / 只读池）"""
+
+    def _do_get(self):
+        if not METRICS_ENABLED:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_duration.observe(time.perf_counter() - started, self.logging_name or "default")
+
+
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def instrument_engine(engine, pool: str):
+    """在引擎上挂载 SQL 执行耗时统计（按语句类型）"""
+    if not METRICS_ENABLED:
+        return
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        kind = statement.lstrip()[:6].upper()
+        db_query_duration.observe(time.perf_counter() - started, pool, kind if kind in STATEMENT_KINDS else "OTHER")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：记录每个 HTTP 请求的耗时
+    路由标签取路由模板（/api/orders/pending/{intent_id}），未匹配的请求记为 unmatched
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict] = None
+
+    def _route_for(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].routes if hasattr(route, "path")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], self._route_for(scope), status
+            )
@@ -1,13 +1,34 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Numeric
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text, Numeric, Index, literal_column
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, validates
 from app.database import Base
 from datetime import datetime
 
+
+def normalize_status(status):
+    """状态值统一为去空格的小写（"OPEN " -> "open"），保证查询可以直接使用索引"""
+    if status is None:
+        return None
+    return str(status).strip().lower()
+
+
+def status_is(column, *values: str):
+    """
+    按状态过滤，状态值作为常量写入 SQL：status = 'open'、status IN ('pending', 'processing')
+    asyncpg 会缓存预编译语句，参数化的 status = $1 在通用执行计划下无法匹配部分索引的 WHERE 条件
+    所有按状态取值的过滤都使用本函数；status != 'closed' 这类否定条件本身用不上部分索引，仍用普通比较
+    """
+    constants = [literal_column(f"'{value}'") for value in values]
+    if len(constants) == 1:
+        return column == constants[0]
+    return column.in_(constants)
+
 class Trade(Base):
     __tablename__ = "trades"
 
     id = Column(Integer, primary_key=True, index=True)
     intent_id = Column(Text, index=True, unique=True)
+    account_id = Column(Text, index=True)  # OANDA 账户；为空时属于默认账户
     symbol = Column(Text)
     direction = Column(Text)  # "long" 或 "short"
     units = Column(Float)
@@ -18,7 +39,9 @@ class Trade(Base):
     stop_loss = Column(Float)
     take_profit = Column(Float)
     status = Column(Text, index=True)  # "pending", "open", "closed"
-    ai_article = Column(Text)  # Markdown 格式的分析报告
+    # Markdown 格式的分析报告：已迁移到 trade_articles，由触发器转存，这里只作兼容保留
+    # deferred：查询 Trade 时默认不加载
+    ai_article = deferred(Column(Text))
     analysisJson = Column(JSONB)  # JSON 格式的分析数据
     confidence = Column(Float)
     oanda_order_id = Column(Text, index=True)
@@ -33,6 +56,55 @@ class Trade(Base):
     close_time = Column(DateTime(timezone=True))  # 平仓时间
     close_reason = Column(Text)  # 平仓原因
 
+    @validates("status")
+    def _normalize_status(self, key, value):
+        return normalize_status(value)
+
+
+# 挂单 / 持仓列表：按状态的部分索引，按创建时间倒序
+Index(
+    "idx_trades_pending_created",
+    Trade.created_at.desc(),
+    postgresql_where=Trade.status == "pending"
+)
+Index(
+    "idx_trades_open_created",
+    Trade.created_at.desc(),
+    postgresql_where=Trade.status == "open"
+)
+
+# 历史记录游标分页：已平仓交易按 (close_time desc, id desc) 的部分索引
+# INCLUDE 历史列表所需的列，支持仅索引扫描
+Index(
+    "idx_trades_closed_history",
+    Trade.close_time.desc().nulls_last(),
+    Trade.id.desc(),
+    postgresql_where=Trade.status == "closed",
+    postgresql_include=[
+        "intent_id", "symbol", "direction", "units", "entry_price", "exit_price",
+        "realized_pl", "financing", "commission", "created_at", "close_reason", "account_id"
+    ]
+)
+
+# 按 analysisJson 信号筛选：jsonb_path_ops 支持 @>、@?、@@，索引体积小于默认的 jsonb_ops
+Index(
+    "idx_trades_analysis",
+    Trade.analysisJson,
+    postgresql_using="gin",
+    postgresql_ops={"analysisJson": "jsonb_path_ops"}
+)
+
+
+class TradeArticle(Base):
+    """AI 分析报告 - 大文本从 trades 拆出，详情接口只返回引用"""
+    __tablename__ = "trade_articles"
+
+    intent_id = Column(Text, primary_key=True)
+    content = Column(Text, nullable=False)  # Markdown 原文
+    content_hash = Column(Text, nullable=False)  # md5(content)，作为版本号和 ETag
+    content_length = Column(Integer)  # 字符数
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class AccountSummary(Base):
     __tablename__ = "account_summary"
@@ -70,3 +142,64 @@ class ApiConfig(Base):
     extra_config = Column(JSONB)  # 额外配置 (JSON格式)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TradeStats(Base):
+    """交易统计聚合表 - 平仓时增量更新，避免每次请求全表扫描"""
+    __tablename__ = "trade_stats"
+
+    account_id = Column(Text, primary_key=True)
+    starting_balance = Column(Float, default=0)  # 起始资金（用于计算回撤）
+    total_trades = Column(Integer, default=0)
+    winning_trades = Column(Integer, default=0)
+    losing_trades = Column(Integer, default=0)
+    total_profit = Column(Float, default=0)  # 盈利交易的盈利总额
+    total_loss = Column(Float, default=0)  # 亏损交易的亏损总额（正数）
+    long_total = Column(Integer, default=0)
+    long_wins = Column(Integer, default=0)
+    short_total = Column(Integer, default=0)
+    short_wins = Column(Integer, default=0)
+    cumulative_profit = Column(Float, default=0)  # 累计盈亏
+    peak_equity = Column(Float, default=0)  # 权益峰值
+    max_drawdown = Column(Float, default=0)  # 最大回撤（%）
+    current_win_streak = Column(Integer, default=0)
+    current_loss_streak = Column(Integer, default=0)
+    max_win_streak = Column(Integer, default=0)
+    max_loss_streak = Column(Integer, default=0)
+    total_holding_hours = Column(Float, default=0)  # 持仓时间总和（小时）
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WebhookInbox(Base):
+    """Webhook 收件箱 - 先落库再由后台 worker 异步处理"""
+    __tablename__ = "webhook_inbox"
+
+    id = Column(BigInteger, primary_key=True)
+    event_type = Column(Text)  # ORDER_FILL, ORDER_CANCEL, TRADE_CLOSE, etc.
+    trade_key = Column(Text)  # 顺序键：同一交易 / 订单的事件按 id 顺序处理
+    payload = Column(JSONB, nullable=False)  # 原始 Webhook 请求体
+    status = Column(Text, default="pending")  # "pending", "processing", "done", "dead"
+    attempts = Column(Integer, default=0)  # 已尝试次数
+    last_error = Column(Text)
+    available_at = Column(DateTime(timezone=True), default=datetime.utcnow)  # 重试前不可领取
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    processed_at = Column(DateTime(timezone=True))
+
+
+# worker 领取任务：只扫描未完成的事件
+Index(
+    "idx_webhook_inbox_unfinished",
+    WebhookInbox.trade_key,
+    WebhookInbox.id,
+    postgresql_where=WebhookInbox.status.in_(["pending", "processing"])
+)
+
+
+class ProcessedTransaction(Base):
+    """已接收的 OANDA 交易 ID - Webhook 重复投递去重"""
+    __tablename__ = "processed_transactions"
+
+    transaction_id = Column(Text, primary_key=True)
+    event_type = Column(Text)
+    inbox_id = Column(BigInteger)  # 对应的收件箱事件
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
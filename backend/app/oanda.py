@@ -0,0 +1,261 @@
+import asyncio
+import httpx
+import os
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
+from app.metrics import oanda_endpoint, oanda_request_duration
+from app.models import ApiConfig
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OANDA_API_KEY = os.getenv("OANDA_API_KEY", "")
+OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID", "")
+OANDA_API_URL = os.getenv("OANDA_API_URL", "https://api-fxpractice.oanda.com")
+OANDA_STREAM_URL = os.getenv("OANDA_STREAM_URL", "https://stream-fxpractice.oanda.com")
+
+# 连接池配置
+OANDA_HTTP2 = os.getenv("OANDA_HTTP2", "false").lower() in ("1", "true", "yes")
+OANDA_TIMEOUT = float(os.getenv("OANDA_TIMEOUT", "10"))
+OANDA_MAX_CONNECTIONS = int(os.getenv("OANDA_MAX_CONNECTIONS", "20"))
+OANDA_MAX_KEEPALIVE = int(os.getenv("OANDA_MAX_KEEPALIVE", "10"))
+OANDA_KEEPALIVE_EXPIRY = float(os.getenv("OANDA_KEEPALIVE_EXPIRY", "30"))
+
+# api_config 定期重新加载的间隔（秒），多 worker 部署或直接改库时兜底；0 表示只在配置接口写入后重新加载
+API_CONFIG_RELOAD_INTERVAL = float(os.getenv("API_CONFIG_RELOAD_INTERVAL", "60"))
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要安装 h2（pip install httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class OandaClient:
+    """
+    OANDA REST 客户端
+    所有路由共享同一个 httpx.AsyncClient，复用 keep-alive 连接，避免每次请求重新握手
+    """
+
+    def __init__(
+        self,
+        api_url: str = OANDA_API_URL,
+        api_key: str = OANDA_API_KEY,
+        account_id: str = OANDA_ACCOUNT_ID,
+        stream_url: str = OANDA_STREAM_URL,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.account_id = account_id
+        self.stream_url = stream_url.rstrip("/")
+
+        http2 = OANDA_HTTP2
+        if http2 and not _http2_available():
+            logger.warning("未安装 h2，OANDA 客户端回退到 HTTP/1.1")
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            base_url=self.api_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=OANDA_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OANDA_MAX_CONNECTIONS,
+                max_keepalive_connections=OANDA_MAX_KEEPALIVE,
+                keepalive_expiry=OANDA_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+        )
+
+    @property
+    def configured(self) -> bool:
+        """是否配置了 API Key 和账户 ID"""
+        return bool(self.api_key and self.account_id)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """请求账户级接口，path 相对于 /v3/accounts/{account_id}；按接口记录耗时"""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._client.get(f"/v3/accounts/{self.account_id}{path}", **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            oanda_request_duration.observe(time.perf_counter() - started, oanda_endpoint(path), status)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class OandaClientRegistry:
+    """
+    多账户客户端注册表：每个账户一个 OandaClient（各自的连接池）
+    - 启动时一次读取 api_config 表，之后全部从内存读取，热路径上不查数据库
+    - 账户来自 OANDA 的配置行（需要 account_id 和 access_token / api_key）
+    - 表中没有可用配置、或首次加载时读取失败，回退到环境变量 OANDA_API_KEY / OANDA_ACCOUNT_ID；
+      之后的重新加载读取失败时保留当前客户端不变
+    - 默认账户：is_active 的配置行，其次 OANDA_ACCOUNT_ID，再其次第一个账户
+    - 配置接口写入后调用 reload()：凭据变化的账户换新客户端，旧连接池延迟关闭，
+      账户集合或默认账户变化时通知 on_change 注册的回调
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, OandaClient] = {}
+        self._listeners: List[Callable[[], Awaitable[None]]] = []
+        self._lock = asyncio.Lock()
+        self._reload_task: Optional[asyncio.Task] = None
+        self._close_tasks: Set[asyncio.Task] = set()
+        self._loaded = False
+        self.default_account_id: Optional[str] = None
+        self.active_config: Optional[ApiConfig] = None
+
+    @staticmethod
+    async def _load_configs() -> List[ApiConfig]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ApiConfig).order_by(ApiConfig.is_active.desc(), ApiConfig.id)
+            )
+            return list(result.scalars().all())
+
+    def on_change(self, callback: Callable[[], Awaitable[None]]):
+        """注册账户集合 / 默认账户变化时的回调"""
+        self._listeners.append(callback)
+
+    async def reload(self):
+        """重新读取 api_config 并热替换客户端（并发调用按顺序执行）"""
+        async with self._lock:
+            changed = await self.load()
+        if changed:
+            for callback in self._listeners:
+                try:
+                    await callback()
+                except Exception as e:
+                    logger.error(f"API 配置变更回调失败: {e}")
+
+    async def load(self) -> bool:
+        """从 api_config 加载；凭据未变化的账户沿用原客户端（连接池不重建）。返回账户集合或默认账户是否变化"""
+        try:
+            configs = await self._load_configs()
+        except Exception as e:
+            if self._loaded:
+                # 数据库暂时不可用：不能据此关闭已配置账户的客户端或改变默认账户
+                logger.error(f"重新加载 api_config 失败，保留当前配置: {e}")
+                return False
+            logger.warning(f"读取 api_config 失败，使用环境变量配置: {e}")
+            configs = []
+        self._loaded = True
+        self.active_config = next((c for c in configs if c.is_active == 1), None)
+
+        wanted: Dict[str, tuple] = {}
+        default_account_id = None
+        for config in configs:
+            if (config.exchange_name or "").upper() != "OANDA" or not config.account_id:
+                continue
+            if not (config.access_token or config.api_key):
+                continue
+            stream_url = (config.extra_config or {}).get("stream_url") or OANDA_STREAM_URL
+            wanted.setdefault(config.account_id, (
+                config.api_url.rstrip("/"), config.access_token or config.api_key, stream_url.rstrip("/")
+            ))
+            if config.is_active == 1 and default_account_id is None:
+                default_account_id = config.account_id
+        if not wanted:
+            wanted[OANDA_ACCOUNT_ID] = (OANDA_API_URL.rstrip("/"), OANDA_API_KEY, OANDA_STREAM_URL.rstrip("/"))
+
+        before = (tuple(self._clients.items()), self.default_account_id)
+        stale = []
+        for account_id, client in list(self._clients.items()):
+            if wanted.get(account_id) != (client.api_url, client.api_key, client.stream_url):
+                stale.append(self._clients.pop(account_id))
+        for account_id, (api_url, api_key, stream_url) in wanted.items():
+            if account_id not in self._clients:
+                self._clients[account_id] = OandaClient(api_url, api_key, account_id, stream_url)
+
+        if default_account_id is None:
+            default_account_id = OANDA_ACCOUNT_ID if OANDA_ACCOUNT_ID in self._clients else next(iter(self._clients))
+        self.default_account_id = default_account_id
+
+        if stale:
+            # 进行中的请求仍持有旧客户端，等其超时后再关闭连接池
+            # 保留任务引用，避免关闭过程中被垃圾回收
+            task = asyncio.create_task(self._close_later(stale))
+            self._close_tasks.add(task)
+            task.add_done_callback(self._close_tasks.discard)
+        changed = before != (tuple(self._clients.items()), self.default_account_id)
+        if changed:
+            logger.info(f"已加载 {len(self._clients)} 个 OANDA 账户，默认账户 {self.default_account_id}")
+        return changed
+
+    @staticmethod
+    async def _close_later(clients: List[OandaClient]):
+        await asyncio.sleep(OANDA_TIMEOUT)
+        for client in clients:
+            await client.aclose()
+
+    def start_reload_loop(self):
+        if API_CONFIG_RELOAD_INTERVAL > 0 and self._reload_task is None:
+            self._reload_task = asyncio.create_task(self._reload_loop())
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(API_CONFIG_RELOAD_INTERVAL)
+            await self.reload()
+
+    def get(self, account_id: Optional[str] = None) -> OandaClient:
+        """获取账户的客户端；未指定时为默认账户"""
+        if not self._clients:
+            # 未通过 lifespan 加载（脚本、测试）：按环境变量创建
+            self._clients[OANDA_ACCOUNT_ID] = OandaClient()
+            self.default_account_id = OANDA_ACCOUNT_ID
+        client = self._clients.get(account_id or self.default_account_id)
+        if client is None:
+            raise LookupError(f"未配置的 OANDA 账户: {account_id}")
+        return client
+
+    def account_ids(self) -> List[str]:
+        """全部已配置凭据的账户"""
+        return [account_id for account_id, client in self._clients.items() if client.configured]
+
+    async def aclose(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+        clients, self._clients = list(self._clients.values()), {}
+        self._loaded = False
+        for client in clients:
+            await client.aclose()
+
+
+oanda_clients = OandaClientRegistry()
+
+
+def get_oanda_client(account_id: Optional[str] = None) -> OandaClient:
+    """获取账户的共享 OANDA 客户端（未指定账户时为默认账户）"""
+    return oanda_clients.get(account_id)
+
+
+def default_account_id() -> str:
+    """默认账户 ID"""
+    return get_oanda_client().account_id
+
+
+async def init_oanda_client():
+    """应用启动时加载全部账户的客户端，并开启定期重新加载"""
+    await oanda_clients.load()
+    oanda_clients.start_reload_loop()
+
+
+async def close_oanda_client():
+    """应用关闭时释放全部连接池"""
+    await oanda_clients.aclose()
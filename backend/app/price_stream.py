@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import random
+import time
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
+from app.models import Trade, status_is
+from app.oanda import get_oanda_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRICE_STREAM_ENABLED = os.getenv("PRICE_STREAM_ENABLED", "true").lower() in ("1", "true", "yes")
+# 超过该时间（秒）未收到任何消息（含心跳）即认为价格簿失效，回退到 REST 查询
+PRICE_STREAM_STALE_AFTER = float(os.getenv("PRICE_STREAM_STALE_AFTER", "15"))
+# 定期从数据库刷新订阅品种（兜底 N8N 直接写库的情况）
+PRICE_STREAM_REFRESH_INTERVAL = float(os.getenv("PRICE_STREAM_REFRESH_INTERVAL", "60"))
+PRICE_STREAM_BACKOFF_MIN = float(os.getenv("PRICE_STREAM_BACKOFF_MIN", "1"))
+PRICE_STREAM_BACKOFF_MAX = float(os.getenv("PRICE_STREAM_BACKOFF_MAX", "60"))
+# 两次订阅刷新之间的最小间隔（秒）
+PRICE_STREAM_MIN_REFRESH_GAP = 5.0
+
+
+class Quote(NamedTuple):
+    bid: float
+    ask: float
+    mid: float
+    time: str  # OANDA 报价时间
+
+
+class PriceBook:
+    """内存价格簿：symbol -> 最新报价，读取为 O(1)"""
+
+    def __init__(self):
+        self._quotes: Dict[str, Quote] = {}
+        self._live_until = 0.0
+        self._listeners: Set[asyncio.Event] = set()
+
+    def update(self, instrument: str, bid: float, ask: float, quote_time: str = ""):
+        self._quotes[instrument] = Quote(bid, ask, (bid + ask) / 2, quote_time)
+        for listener in self._listeners:
+            listener.set()
+
+    def subscribe(self) -> asyncio.Event:
+        """注册价格变动通知；多次变动在被消费前合并为一次"""
+        listener = asyncio.Event()
+        self._listeners.add(listener)
+        return listener
+
+    def unsubscribe(self, listener: asyncio.Event):
+        self._listeners.discard(listener)
+
+    def touch(self):
+        """收到任意流消息（含心跳）时续期"""
+        self._live_until = time.monotonic() + PRICE_STREAM_STALE_AFTER
+
+    def mark_down(self):
+        self._live_until = 0.0
+
+    @property
+    def live(self) -> bool:
+        return time.monotonic() < self._live_until
+
+    def get(self, instrument: str) -> Optional[Quote]:
+        if not self.live:
+            return None
+        return self._quotes.get(instrument)
+
+    def mids(self, instruments: Iterable[str]) -> Dict[str, float]:
+        """批量读取中间价，价格簿失效时返回空"""
+        if not self.live:
+            return {}
+        quotes = self._quotes
+        return {i: quotes[i].mid for i in instruments if i in quotes}
+
+    def retain(self, instruments: Set[str]):
+        """移除已不再订阅的品种"""
+        for instrument in list(self._quotes):
+            if instrument not in instruments:
+                del self._quotes[instrument]
+
+
+async def load_active_symbols() -> Set[str]:
+    """持仓和挂单涉及的全部品种"""
+    async with AsyncSessionLocal() as session:
+        stmt = select(Trade.symbol).where(
+            status_is(Trade.status, "open", "pending"),
+            Trade.symbol.isnot(None)
+        ).distinct()
+        result = await session.execute(stmt)
+        return {row[0] for row in result.all()}
+
+
+class PriceStreamer:
+    """
+    后台订阅 OANDA 价格流并写入价格簿
+    - 订阅集合来自数据库中 open / pending 的交易，交易变动时调用 notify_trades_changed()
+    - 断线后指数退避重连
+    - 默认使用默认账户客户端的 stream_url，默认账户切换后调用 reconnect()
+    - stream_url 与 symbols_loader 可替换，便于对接本地桩服务
+    """
+
+    def __init__(
+        self,
+        book: PriceBook,
+        stream_url: Optional[str] = None,
+        symbols_loader: Callable[[], Awaitable[Set[str]]] = load_active_symbols,
+    ):
+        self.book = book
+        self.stream_url = stream_url.rstrip("/") if stream_url else None
+        self.symbols_loader = symbols_loader
+        self._symbols: Set[str] = set()
+        self._changed = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._last_refresh = 0.0
+        self._backoff = PRICE_STREAM_BACKOFF_MIN
+        self.reconnects = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def symbols(self) -> Set[str]:
+        return set(self._symbols)
+
+    async def start(self):
+        if self.running:
+            return
+        await self.refresh_subscriptions()
+        self._tasks = [
+            asyncio.create_task(self._run()),
+            asyncio.create_task(self._refresh_loop()),
+        ]
+
+    async def stop(self):
+        tasks = self._tasks
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+        self._tasks = []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.book.mark_down()
+
+    async def refresh_subscriptions(self):
+        """重新加载订阅品种，集合变化时触发重连"""
+        self._last_refresh = time.monotonic()
+        try:
+            symbols = await self.symbols_loader()
+        except Exception as e:
+            logger.error(f"加载订阅品种失败: {e}")
+            return
+        if symbols != self._symbols:
+            logger.info(f"价格流订阅更新: {sorted(symbols)}")
+            self._symbols = symbols
+            self.book.retain(symbols)
+            self._changed.set()
+
+    def notify_trades_changed(self):
+        """交易开平仓后调用：在后台刷新订阅（短时间内多次调用只刷新一次）"""
+        if not self.running:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        delay = max(0.0, self._last_refresh + PRICE_STREAM_MIN_REFRESH_GAP - time.monotonic())
+        self._refresh_task = asyncio.create_task(self._delayed_refresh(delay))
+
+    def reconnect(self):
+        """凭据或默认账户变化：按当前订阅集合重新连接"""
+        self._changed.set()
+
+    async def _delayed_refresh(self, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        await self.refresh_subscriptions()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(PRICE_STREAM_REFRESH_INTERVAL)
+            await self.refresh_subscriptions()
+
+    async def _run(self):
+        while True:
+            symbols = sorted(self._symbols)
+            self._changed.clear()
+            if not symbols:
+                self.book.mark_down()
+                await self._changed.wait()
+                continue
+
+            consume = asyncio.create_task(self._consume(symbols))
+            changed = asyncio.create_task(self._changed.wait())
+            try:
+                done, _ = await asyncio.wait({consume, changed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                # asyncio.wait 不会取消子任务：_run 被取消（stop）或订阅变化时都要结束流连接和等待任务
+                for task in (consume, changed):
+                    task.cancel()
+                await asyncio.gather(consume, changed, return_exceptions=True)
+
+            if changed in done:
+                # 订阅集合变化，立即按新集合重连
+                continue
+
+            self.book.mark_down()
+            error = consume.exception()
+            if error is not None:
+                logger.warning(f"价格流断开: {error!r}")
+            self.reconnects += 1
+            delay = self._backoff * (0.5 + random.random() / 2)
+            self._backoff = min(self._backoff * 2, PRICE_STREAM_BACKOFF_MAX)
+            logger.info(f"{delay:.1f} 秒后重连价格流")
+            await asyncio.sleep(delay)
+
+    async def _consume(self, symbols: List[str]):
+        """读取分块 JSON 流，每行一个 PRICE 或 HEARTBEAT 消息"""
+        client = get_oanda_client()
+        async with httpx.AsyncClient(
+            base_url=self.stream_url or client.stream_url,
+            headers={"Authorization": f"Bearer {client.api_key}"},
+            timeout=httpx.Timeout(10.0, read=PRICE_STREAM_STALE_AFTER * 2),
+        ) as http:
+            async with http.stream(
+                "GET",
+                f"/v3/accounts/{client.account_id}/pricing/stream",
+                params={"instruments": ",".join(symbols)},
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    self.book.touch()
+                    self._backoff = PRICE_STREAM_BACKOFF_MIN
+                    if message.get("type") == "PRICE":
+                        try:
+                            bid = float(message["bids"][0]["price"])
+                            ask = float(message["asks"][0]["price"])
+                        except (KeyError, IndexError, TypeError, ValueError):
+                            continue
+                        self.book.update(message["instrument"], bid, ask, message.get("time", ""))
+
+
+price_book = PriceBook()
+price_streamer = PriceStreamer(price_book)
+
+
+async def start_price_stream():
+    """应用启动时开启价格流（未配置 OANDA 或已禁用时跳过）"""
+    if PRICE_STREAM_ENABLED and get_oanda_client().configured:
+        await price_streamer.start()
+
+
+async def stop_price_stream():
+    await price_streamer.stop()
+
+
+async def on_oanda_config_changed():
+    """API 配置变化：价格流改用新的默认账户，原先未配置时现在启动"""
+    if price_streamer.running:
+        price_streamer.reconnect()
+    else:
+        await start_price_stream()
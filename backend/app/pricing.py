@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.oanda import get_oanda_client
+from app.price_stream import price_book, price_streamer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 单次 /pricing 请求最多携带的品种数，超出则拆分为多个并发请求
+OANDA_PRICING_CHUNK_SIZE = int(os.getenv("OANDA_PRICING_CHUNK_SIZE", "50"))
+
+# 价格缓存：新鲜度（秒）与最大品种数
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "2"))
+PRICE_CACHE_MAX_SIZE = int(os.getenv("PRICE_CACHE_MAX_SIZE", "1000"))
+
+
+class PriceCache:
+    """
+    进程内价格缓存
+    - 按品种缓存中间价，超过 ttl 秒视为过期
+    - 超过 max_size 时淘汰最久未使用的品种
+    - 同一品种的并发未命中合并为一次上游请求（single-flight）
+    """
+
+    def __init__(self, ttl: float = PRICE_CACHE_TTL, max_size: int = PRICE_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # symbol -> (price, 写入时间)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_fresh(self, symbol: str, now: float) -> Optional[float]:
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        price, stored_at = entry
+        if now - stored_at > self.ttl:
+            return None
+        self._entries.move_to_end(symbol)
+        return price
+
+    def _store(self, symbol: str, price: float, now: float):
+        self._entries[symbol] = (price, now)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_many(
+        self,
+        symbols: List[str],
+        fetcher: Callable[[List[str]], Awaitable[Dict[str, float]]],
+    ) -> Dict[str, float]:
+        """返回命中的价格；未命中的品种通过 fetcher 一次性获取"""
+        now = time.monotonic()
+        prices: Dict[str, float] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+
+        for symbol in symbols:
+            price = self._get_fresh(symbol, now)
+            if price is not None:
+                self.hits += 1
+                prices[symbol] = price
+            elif symbol in self._inflight:
+                # 已有请求在途，直接等待其结果
+                self.coalesced += 1
+                waiting[symbol] = self._inflight[symbol]
+            else:
+                self.misses += 1
+                missing.append(symbol)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {symbol: loop.create_future() for symbol in missing}
+            self._inflight.update(futures)
+            fetched: Dict[str, float] = {}
+            try:
+                fetched = await fetcher(missing)
+            finally:
+                stored_at = time.monotonic()
+                for symbol, future in futures.items():
+                    self._inflight.pop(symbol, None)
+                    price = fetched.get(symbol)
+                    if price is not None:
+                        self._store(symbol, price, stored_at)
+                        prices[symbol] = price
+                    if not future.done():
+                        future.set_result(price)
+
+        if waiting:
+            # shield：单个调用方被取消时不影响其他等待者
+            results = await asyncio.gather(*(asyncio.shield(f) for f in waiting.values()))
+            for symbol, price in zip(waiting.keys(), results):
+                if price is not None:
+                    prices[symbol] = price
+
+        return prices
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+price_cache = PriceCache()
+
+
+def _unique_symbols(symbols: Iterable[Optional[str]]) -> List[str]:
+    """去重并过滤空值，保持原有顺序"""
+    return list(dict.fromkeys(s for s in symbols if s))
+
+
+async def _fetch_chunk(instruments: List[str]) -> Dict[str, float]:
+    """一次请求获取一组品种的中间价"""
+    client = get_oanda_client()
+    prices: Dict[str, float] = {}
+    try:
+        response = await client.get("/pricing", params={"instruments": ",".join(instruments)})
+        if response.status_code == 200:
+            for price_data in response.json().get("prices", []):
+                try:
+                    bid = float(price_data["bids"][0]["price"])
+                    ask = float(price_data["asks"][0]["price"])
+                except (KeyError, IndexError, TypeError, ValueError):
+                    continue
+                prices[price_data.get("instrument")] = (bid + ask) / 2
+    except Exception as e:
+        logger.error(f"获取 OANDA 价格失败: {e}")
+    return prices
+
+
+async def _fetch_prices(instruments: List[str]) -> Dict[str, float]:
+    """按 OANDA_PRICING_CHUNK_SIZE 分批并发请求"""
+    chunks = [
+        instruments[i:i + OANDA_PRICING_CHUNK_SIZE]
+        for i in range(0, len(instruments), OANDA_PRICING_CHUNK_SIZE)
+    ]
+    results = await asyncio.gather(*(_fetch_chunk(chunk) for chunk in chunks))
+
+    prices: Dict[str, float] = {}
+    for chunk_prices in results:
+        prices.update(chunk_prices)
+    return prices
+
+
+async def get_oanda_prices(symbols: Iterable[Optional[str]]) -> Dict[str, float]:
+    """
+    批量获取实时价格，返回 {symbol: mid}
+    品种去重后优先读取价格流维护的价格簿，其次读取缓存，未命中的品种合并为批量请求
+    获取失败的品种不会出现在结果中
+    """
+    client = get_oanda_client()
+    instruments = _unique_symbols(symbols)
+    if not instruments or not client.configured:
+        return {}
+
+    prices = price_book.mids(instruments)
+    missing = [i for i in instruments if i not in prices]
+    if missing:
+        if price_streamer.running:
+            # 价格簿中缺少该品种，可能是新开的交易尚未订阅
+            price_streamer.notify_trades_changed()
+        prices.update(await price_cache.get_many(missing, _fetch_prices))
+    return prices
+
+
+async def get_oanda_price(symbol: str) -> Optional[float]:
+    """获取单个品种的实时价格"""
+    prices = await get_oanda_prices([symbol])
+    return prices.get(symbol)
@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.sql import Select
+from app.accounts import account_clause
+from app.models import Trade, status_is
+
+# 只读列表查询：按各列表 schema 精确选择需要的列，返回普通 Row（元组）
+# 不创建 ORM 实例，不进入会话的 identity map，也没有变更跟踪开销
+
+# 挂单列表（PendingOrderList）
+PENDING_ORDER_COLUMNS = (
+    Trade.id,
+    Trade.intent_id,
+    Trade.symbol,
+    Trade.units,
+    Trade.entry_price,
+    Trade.stop_loss,
+    Trade.take_profit,
+    Trade.current_price,
+    Trade.created_at
+)
+
+# 持仓列表（PositionList），current_price 用于价格缺失时的回退
+OPEN_POSITION_COLUMNS = (
+    Trade.id,
+    Trade.intent_id,
+    Trade.symbol,
+    Trade.direction,
+    Trade.units,
+    Trade.entry_price,
+    Trade.stop_loss,
+    Trade.take_profit,
+    Trade.current_price,
+    Trade.created_at
+)
+
+# 历史记录列表（TradeHistory），与 idx_trades_closed_history 的 INCLUDE 列一致
+HISTORY_COLUMNS = (
+    Trade.id,
+    Trade.intent_id,
+    Trade.symbol,
+    Trade.direction,
+    Trade.units,
+    Trade.entry_price,
+    Trade.exit_price,
+    Trade.realized_pl,
+    Trade.financing,
+    Trade.commission,
+    Trade.created_at,
+    Trade.close_time,
+    Trade.close_reason
+)
+
+
+def _for_account(stmt: Select, account_id: Optional[str]) -> Select:
+    """指定账户时只查该账户，否则查询全部账户"""
+    return stmt.where(account_clause(account_id)) if account_id else stmt
+
+
+def pending_orders_stmt(account_id: Optional[str] = None) -> Select:
+    """挂单列表，走 idx_trades_pending_created"""
+    return _for_account(select(*PENDING_ORDER_COLUMNS).where(
+        status_is(Trade.status, "pending"),
+        Trade.symbol.isnot(None)
+    ), account_id).order_by(Trade.created_at.desc())
+
+
+def open_positions_stmt(account_id: Optional[str] = None) -> Select:
+    """持仓列表，走 idx_trades_open_created"""
+    return _for_account(select(*OPEN_POSITION_COLUMNS).where(
+        status_is(Trade.status, "open"),
+        Trade.symbol.isnot(None)
+    ), account_id).order_by(Trade.created_at.desc())
+
+
+def closed_history_stmt(account_id: Optional[str] = None) -> Select:
+    """已平仓历史（排序与游标条件由调用方添加）"""
+    return _for_account(select(*HISTORY_COLUMNS).where(status_is(Trade.status, "closed")), account_id)
+
+
+def closed_history_page_stmt(
+    account_id: Optional[str],
+    limit: int,
+    after: Optional[Tuple[Optional[datetime], int]] = None,
+    null_close_time: bool = False
+) -> Select:
+    """
+    历史记录的一页，按 idx_trades_closed_history 的顺序分两段查询：
+    先 close_time 非 NULL 的行，再 close_time 为 NULL 的行（按 id 倒序）
+    after 为上一页最后一行的 (close_time, id)；每段都是单一范围条件，可直接在索引上定位
+    """
+    stmt = closed_history_stmt(account_id)
+    if null_close_time:
+        stmt = stmt.where(Trade.close_time.is_(None))
+        if after is not None and after[0] is None:
+            stmt = stmt.where(Trade.id < after[1])
+    else:
+        stmt = stmt.where(Trade.close_time.isnot(None))
+        if after is not None:
+            # 游标时间按列类型（timestamptz）绑定，与带时区的 datetime 匹配
+            stmt = stmt.where(
+                tuple_(Trade.close_time, Trade.id) < tuple_(literal(after[0], Trade.close_time.type), after[1])
+            )
+    return stmt.order_by(Trade.close_time.desc().nulls_last(), Trade.id.desc()).limit(limit)
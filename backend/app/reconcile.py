@@ -0,0 +1,307 @@
+import asyncio
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, or_, func, cast, values, column, literal_column, Integer, Text, Float
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Trade, status_is
+from app.accounts import account_clause
+from app.oanda import OandaClient, default_account_id, get_oanda_client
+from app.response_cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+# 入场挂单类型（止盈止损等依附于交易的订单不单独入库）
+ENTRY_ORDER_TYPES = {"MARKET", "LIMIT", "STOP", "MARKET_IF_TOUCHED"}
+
+# 对账时比较和写回的列
+RECONCILE_COLUMNS: List[Tuple[str, Any]] = [
+    ("account_id", Text),
+    ("status", Text),
+    ("symbol", Text),
+    ("direction", Text),
+    ("units", Float),
+    ("entry_price", Float),
+    ("stop_loss", Float),
+    ("take_profit", Float),
+    ("financing", Float),
+    ("oanda_order_id", Text),
+    ("oanda_trade_id", Text),
+]
+
+# 孤立行最多返回的 intent_id 数量
+ORPHAN_SAMPLE_SIZE = 50
+
+
+def safe_float(value, default=None):
+    """安全转换为 float"""
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _client_id(*extensions: Optional[Dict[str, Any]]) -> Optional[str]:
+    for ext in extensions:
+        if ext and ext.get("id"):
+            return ext["id"]
+    return None
+
+
+def _fallback_prefix(account_id: Optional[str]) -> str:
+    """OANDA ID 只在账户内唯一，非默认账户生成的 intent_id 带上账户 ID"""
+    if not account_id or account_id == default_account_id():
+        return "oanda"
+    return f"oanda-{account_id}"
+
+
+def trade_intent_id(trade: Dict[str, Any], account_id: Optional[str] = None) -> str:
+    """N8N 下单时把 intent_id 写入 clientExtensions.id；没有时按 OANDA ID 生成"""
+    return _client_id(trade.get("clientExtensions")) or f"{_fallback_prefix(account_id)}-trade-{trade['id']}"
+
+
+def order_intent_id(order: Dict[str, Any], account_id: Optional[str] = None) -> str:
+    return (
+        _client_id(order.get("clientExtensions"), order.get("tradeClientExtensions"))
+        or f"{_fallback_prefix(account_id)}-order-{order['id']}"
+    )
+
+
+def trade_fields(trade: Dict[str, Any], account_id: Optional[str] = None) -> Dict[str, Any]:
+    """OANDA openTrades 中的一笔交易 -> Trade 列"""
+    units = safe_float(trade.get("currentUnits"), 0.0)
+    return {
+        "account_id": account_id,
+        "status": "open",
+        "symbol": trade.get("instrument"),
+        "direction": "long" if units >= 0 else "short",
+        "units": abs(units),
+        "entry_price": safe_float(trade.get("price")),
+        "stop_loss": safe_float((trade.get("stopLossOrder") or {}).get("price")),
+        "take_profit": safe_float((trade.get("takeProfitOrder") or {}).get("price")),
+        "financing": safe_float(trade.get("financing"), 0.0),
+        "oanda_trade_id": trade.get("id"),
+    }
+
+
+def order_fields(order: Dict[str, Any], account_id: Optional[str] = None) -> Dict[str, Any]:
+    """OANDA pendingOrders 中的一个入场挂单 -> Trade 列"""
+    units = safe_float(order.get("units"), 0.0)
+    return {
+        "account_id": account_id,
+        "status": "pending",
+        "symbol": order.get("instrument"),
+        "direction": "long" if units >= 0 else "short",
+        "units": abs(units),
+        "entry_price": safe_float(order.get("price")),
+        "stop_loss": safe_float((order.get("stopLossOnFill") or {}).get("price")),
+        "take_profit": safe_float((order.get("takeProfitOnFill") or {}).get("price")),
+        "oanda_order_id": order.get("id"),
+    }
+
+
+async def fetch_account_state(client: OandaClient) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """并发获取账户的全部持仓和挂单（各一次请求）"""
+    trades_response, orders_response = await asyncio.gather(
+        client.get("/openTrades"),
+        client.get("/pendingOrders"),
+    )
+    trades_response.raise_for_status()
+    orders_response.raise_for_status()
+    orders = [
+        o for o in orders_response.json().get("orders", [])
+        if o.get("type") in ENTRY_ORDER_TYPES
+    ]
+    return trades_response.json().get("trades", []), orders
+
+
+async def _load_candidates(
+    db: AsyncSession,
+    account_id: str,
+    trade_ids: List[str],
+    order_ids: List[str],
+    intent_ids: List[str],
+) -> List[Dict[str, Any]]:
+    """一次查询取出该账户可能参与对账的全部行（只取对账所需的列）"""
+    conditions = [status_is(Trade.status, "open", "pending")]
+    if trade_ids:
+        conditions.append(Trade.oanda_trade_id.in_(trade_ids))
+    if order_ids:
+        conditions.append(Trade.oanda_order_id.in_(order_ids))
+    if intent_ids:
+        conditions.append(Trade.intent_id.in_(intent_ids))
+    columns = [Trade.id, Trade.intent_id] + [getattr(Trade, name) for name, _ in RECONCILE_COLUMNS]
+    result = await db.execute(select(*columns).where(account_clause(account_id), or_(*conditions)))
+    return [dict(row._mapping) for row in result.all()]
+
+
+def _normalized(row: Dict[str, Any]) -> Tuple:
+    """用于比较的列值（数值统一为 float）"""
+    return tuple(
+        safe_float(row.get(name)) if type_ is Float else row.get(name)
+        for name, type_ in RECONCILE_COLUMNS
+    )
+
+
+def diff_account_state(
+    rows: List[Dict[str, Any]],
+    trades: List[Dict[str, Any]],
+    orders: List[Dict[str, Any]],
+    account_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    内存中对比 OANDA 与数据库
+    - updates：已存在且有变化的行（完整的目标值）
+    - inserts：数据库中没有的交易 / 挂单
+    - orphans：数据库中 open / pending，但 OANDA 已不存在的行
+    """
+    by_trade = {r["oanda_trade_id"]: r for r in rows if r["oanda_trade_id"]}
+    by_order = {r["oanda_order_id"]: r for r in rows if r["oanda_order_id"]}
+    by_intent = {r["intent_id"]: r for r in rows if r["intent_id"]}
+
+    updates: Dict[int, Dict[str, Any]] = {}
+    inserts: Dict[str, Dict[str, Any]] = {}
+    matched = set()
+
+    def merge(row: Optional[Dict[str, Any]], intent_id: str, fields: Dict[str, Any]):
+        if row is None:
+            inserts[intent_id] = {"intent_id": intent_id, **fields}
+            return
+        matched.add(row["id"])
+        target = {**row, **fields}
+        if _normalized(target) != _normalized(row):
+            updates[row["id"]] = target
+
+    for trade in trades:
+        intent_id = trade_intent_id(trade, account_id)
+        row = by_trade.get(trade["id"]) or by_intent.get(intent_id)
+        merge(row, intent_id, trade_fields(trade, account_id))
+
+    for order in orders:
+        intent_id = order_intent_id(order, account_id)
+        row = by_order.get(order["id"]) or by_intent.get(intent_id)
+        if row is not None and row["id"] in matched:
+            # 同一行已按持仓处理
+            continue
+        merge(row, intent_id, order_fields(order, account_id))
+
+    # 只把带有 OANDA ID 的行判定为孤立，尚未提交到 OANDA 的行不受影响
+    orphans = [
+        r for r in rows
+        if r["id"] not in matched and (
+            (r["status"] == "open" and r["oanda_trade_id"])
+            or (r["status"] == "pending" and r["oanda_order_id"])
+        )
+    ]
+    return {"updates": list(updates.values()), "inserts": list(inserts.values()), "orphans": orphans}
+
+
+async def _bulk_update(db: AsyncSession, rows: List[Dict[str, Any]], now: datetime) -> int:
+    """UPDATE trades SET ... FROM (VALUES ...) AS v WHERE trades.id = v.id，一条语句写回全部变更"""
+    if not rows:
+        return 0
+    v = values(
+        column("id", Integer),
+        *(column(name, type_) for name, type_ in RECONCILE_COLUMNS),
+        name="v",
+    ).data([
+        (row["id"], *(row.get(name) for name, _ in RECONCILE_COLUMNS))
+        for row in rows
+    ])
+    table = Trade.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == v.c.id)
+        # 整列都是 NULL 时 VALUES 推断为 text，显式转换回列类型
+        .values(updated_at=now, **{name: cast(v.c[name], type_) for name, type_ in RECONCILE_COLUMNS})
+    )
+    result = await db.execute(stmt)
+    return max(result.rowcount, 0)
+
+
+async def _bulk_upsert(
+    db: AsyncSession, account_id: str, rows: List[Dict[str, Any]], now: datetime
+) -> Tuple[int, int, List[str]]:
+    """
+    INSERT ... ON CONFLICT (intent_id) DO UPDATE；返回 (新增数, 冲突后更新数, 未写入的 intent_id)
+    冲突行属于其他账户时不更新（不会把其他账户的交易改到本账户），这些 intent_id 原样返回供报告
+    """
+    if not rows:
+        return 0, 0, []
+    names = [name for name, _ in RECONCILE_COLUMNS]
+    payload = [
+        {"intent_id": row["intent_id"], "created_at": now, "updated_at": now,
+         **{name: row.get(name) for name in names}}
+        for row in rows
+    ]
+    table = Trade.__table__
+    stmt = insert(table).values(payload)
+    # 没有 account_id 的历史行归属默认账户，只有对账默认账户时才补上
+    same_account = table.c.account_id == stmt.excluded.account_id
+    if account_id == default_account_id():
+        same_account = or_(same_account, table.c.account_id.is_(None))
+    # 冲突时只覆盖 OANDA 提供了值的列
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["intent_id"],
+        set_={"updated_at": now, **{name: func.coalesce(stmt.excluded[name], table.c[name]) for name in names}},
+        where=same_account,
+    ).returning(table.c.intent_id, literal_column("xmax = 0"))
+    result = await db.execute(stmt)
+    written = result.all()
+    inserted = sum(1 for _, is_insert in written if is_insert)
+    conflicts = sorted({row["intent_id"] for row in payload} - {intent_id for intent_id, _ in written})
+    return inserted, len(written) - inserted, conflicts
+
+
+async def reconcile_account(db: AsyncSession, account_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    全账户对账（未指定时为默认账户）：一次拉取、内存比对、单事务批量写入
+    没有 account_id 的历史行在对账时补上账户
+    """
+    started = time.perf_counter()
+    client = get_oanda_client(account_id)
+    account_id = client.account_id
+    trades, orders = await fetch_account_state(client)
+
+    rows = await _load_candidates(
+        db,
+        account_id,
+        [t["id"] for t in trades],
+        [o["id"] for o in orders],
+        [trade_intent_id(t, account_id) for t in trades] + [order_intent_id(o, account_id) for o in orders],
+    )
+    diff = diff_account_state(rows, trades, orders, account_id)
+
+    now = datetime.utcnow()
+    updated = await _bulk_update(db, diff["updates"], now)
+    inserted, upserted, conflicts = await _bulk_upsert(db, account_id, diff["inserts"], now)
+    await db.commit()
+    if inserted or updated or upserted:
+        bump_version("trades")
+
+    report = {
+        "account_id": account_id,
+        "oanda_trades": len(trades),
+        "oanda_orders": len(orders),
+        "inserted": inserted,
+        "updated": updated + upserted,
+        "orphaned": len(diff["orphans"]),
+        "orphan_intent_ids": [r["intent_id"] for r in diff["orphans"][:ORPHAN_SAMPLE_SIZE]],
+        "conflicts": len(conflicts),
+        "conflict_intent_ids": conflicts[:ORPHAN_SAMPLE_SIZE],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info(
+        f"账户 {account_id} 对账完成: 新增 {report['inserted']}，更新 {report['updated']}，"
+        f"孤立 {report['orphaned']}，耗时 {report['elapsed_ms']}ms"
+    )
+    if conflicts:
+        logger.warning(
+            f"账户 {account_id} 对账: {len(conflicts)} 个 intent_id 已属于其他账户，未写入: "
+            f"{conflicts[:ORPHAN_SAMPLE_SIZE]}"
+        )
+    return report
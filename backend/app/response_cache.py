@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Tuple
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from app.responses import dumps
+
+load_dotenv()
+
+# 兜底过期时间（秒）：N8N 直接写库不会递增版本号，超过该时间后重新计算
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+# 数据版本号：写入路径在提交后递增，缓存条目记录计算时的版本
+# - trades：交易开平仓、撤单、统计重建
+# - account：账户摘要
+_versions: Dict[str, int] = {"trades": 0, "account": 0}
+
+
+def bump_version(*scopes: str):
+    """数据已变化，使依赖这些范围的缓存失效"""
+    for scope in scopes:
+        _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def current_versions(scopes: Iterable[str]) -> Tuple[int, ...]:
+    return tuple(_versions.get(scope, 0) for scope in scopes)
+
+
+class CacheEntry(NamedTuple):
+    versions: Tuple[int, ...]
+    stored_at: float
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """
+    分析接口的响应缓存
+    - 按路径 + 查询参数缓存序列化后的 JSON
+    - 版本号变化或超过 ttl 即视为失效
+    - 强 ETag 取响应内容的哈希，客户端带 If-None-Match 且未变化时返回 304
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def key_for(request: Request) -> str:
+        query = sorted(request.query_params.multi_items())
+        return f"{request.url.path}?{query}"
+
+    def _get(self, key: str, versions: Tuple[int, ...]):
+        entry = self._entries.get(key)
+        if entry is None or entry.versions != versions or time.monotonic() - entry.stored_at > self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def respond(
+        self,
+        request: Request,
+        scopes: Tuple[str, ...],
+        build: Callable[[], Awaitable[Any]],
+    ) -> Response:
+        """命中时不访问数据库；未命中时调用 build() 计算并缓存"""
+        key = self.key_for(request)
+        # 先取版本号再计算：计算期间有写入时，下次请求会因版本不同而重新计算
+        versions = current_versions(scopes)
+        entry = self._get(key, versions)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            body = dumps(await build())
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            entry = CacheEntry(versions, time.monotonic(), body, etag)
+            self._store(key, entry)
+
+        # 每次都让客户端重新验证，未变化时只返回 304
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "versions": dict(_versions),
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,45 @@
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时回退到标准库
+    orjson = None
+    logger.warning("未安装 orjson，FastJSONResponse 回退到标准库 json")
+
+
+def _default(value: Any):
+    """orjson / json 不能直接序列化的类型"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为 JSON 字节串（优先使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    快速 JSON 响应
+    - 路由直接返回 FastJSONResponse(content) 时跳过 response_model 的重复校验，
+      只用于我们自己构建、结构已确定的数据
+    - 作为 default_response_class 时，对常规返回值只替换最后的编码步骤
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,19 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import get_db
-from app.models import Trade, AccountSummary
-from app.schemas import AccountStats, EquityCurveResponse, EquityCurvePoint
-from typing import List
-from datetime import datetime
-import os
-from dotenv import load_dotenv
+from sqlalchemy import select, func, or_
+from app.accounts import account_clause, resolve_account_id
+from app.database import get_db, get_read_db
+from app.models import Trade, AccountSummary, status_is
+from app.schemas import AccountStats, EquityCurveResponse, TradeHistoryPage, SignalQuery, SignalStatsResponse
+from app.responses import FastJSONResponse
+from app.trade_stats import get_trade_stats, rebuild_trade_stats, effective_pl, effective_pl_expr
+from app.response_cache import response_cache, bump_version
+from app.queries import closed_history_page_stmt
+from app.signals import signal_filters, signal_stats_stmt, summarize
+from sqlalchemy.exc import DBAPIError
+from typing import Any, Dict, Optional, Tuple
+from datetime import datetime, timezone
+import base64
+import json
 
-load_dotenv()
-
-router = APIRouter(prefix="/api/analytics", tags=["analytics"])
-
-OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID", "")
+router = APIRouter(prefix="/api/analytics", tags=["analytics"], default_response_class=FastJSONResponse)
 
 
 def safe_float(value, default=0.0) -> float:
@@ -44,16 +47,28 @@ def safe_str(value, default="") -> str:
 
 
 @router.get("/stats", response_model=AccountStats)
-async def get_account_stats(db: AsyncSession = Depends(get_db)):
+async def get_account_stats(
+    request: Request,
+    account_id: Optional[str] = Query(None, description="不指定时为默认账户"),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
     获取账户统计数据
     - 账户数据从 account_summary 表获取
-    - 交易统计从 trades 表计算
+    - 交易统计从 trade_stats 聚合表获取
+    - 响应按数据版本缓存，带 If-None-Match 且未变化时返回 304
     容错处理：所有 NULL 值显示为 0
     """
+    return await response_cache.respond(
+        request, ("trades", "account"),
+        lambda: _account_stats(db, resolve_account_id(account_id))
+    )
+
+
+async def _account_stats(db: AsyncSession, account_id: str) -> AccountStats:
     try:
         # 1. 从 account_summary 表获取账户数据
-        stmt = select(AccountSummary).where(AccountSummary.account_id == OANDA_ACCOUNT_ID)
+        stmt = select(AccountSummary).where(AccountSummary.account_id == account_id)
         result = await db.execute(stmt)
         account = result.scalar_one_or_none()
         
@@ -80,95 +95,17 @@ async def get_account_stats(db: AsyncSession = Depends(get_db)):
                 "open_order_count": safe_int(account.open_order_count, 0),
             }
         
-        # 2. 从 trades 表计算交易统计
-        stmt = select(Trade).where(Trade.status == "closed")
-        result = await db.execute(stmt)
-        closed_trades = result.scalars().all()
-        
-        total_trades = len(closed_trades)
-        winning_trades = 0
-        losing_trades = 0
-        total_profit = 0.0
-        total_loss = 0.0
-        long_wins = 0
-        long_total = 0
-        short_wins = 0
-        short_total = 0
-        max_drawdown = 0.0
-        consecutive_wins = 0
-        consecutive_losses = 0
-        max_consecutive_wins = 0
-        max_consecutive_losses = 0
-        total_holding_time = 0.0
-        
-        # 计算统计指标
-        cumulative_profit = 0.0
-        peak_balance = account_data["total_balance"]
-        
-        for trade in closed_trades:
-            # 容错处理：realized_pl 可能为 NULL
-            pl = safe_float(trade.realized_pl, 0.0)
-            
-            # 如果 realized_pl 为 NULL，尝试从 entry_price 和 exit_price 计算
-            if pl == 0.0 and trade.entry_price and trade.exit_price:
-                direction = safe_str(trade.direction, "long")
-                if direction == "long":
-                    pl = (safe_float(trade.exit_price, 0.0) - safe_float(trade.entry_price, 0.0)) * safe_float(trade.units, 0.0)
-                else:
-                    pl = (safe_float(trade.entry_price, 0.0) - safe_float(trade.exit_price, 0.0)) * safe_float(trade.units, 0.0)
-            
-            # 统计方向
-            direction = safe_str(trade.direction, "long")
-            if direction == "long":
-                long_total += 1
-                if pl > 0:
-                    long_wins += 1
-            else:
-                short_total += 1
-                if pl > 0:
-                    short_wins += 1
-            
-            cumulative_profit += pl
-            current_balance = peak_balance + cumulative_profit
-            
-            # 计算回撤
-            if current_balance > peak_balance:
-                peak_balance = current_balance
-            drawdown = (peak_balance - current_balance) / peak_balance * 100 if peak_balance > 0 else 0
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-            
-            # 统计盈亏
-            if pl > 0:
-                winning_trades += 1
-                total_profit += pl
-                consecutive_wins += 1
-                consecutive_losses = 0
-                if consecutive_wins > max_consecutive_wins:
-                    max_consecutive_wins = consecutive_wins
-            elif pl < 0:
-                losing_trades += 1
-                total_loss += abs(pl)
-                consecutive_losses += 1
-                consecutive_wins = 0
-                if consecutive_losses > max_consecutive_losses:
-                    max_consecutive_losses = consecutive_losses
-            
-            # 计算持仓时间（容错处理）
-            if trade.close_time and trade.created_at:
-                try:
-                    holding_time = (trade.close_time - trade.created_at).total_seconds() / 3600
-                    total_holding_time += holding_time
-                except Exception:
-                    pass
+        # 2. 从 trade_stats 聚合表读取交易统计（平仓时增量更新）
+        stats = await get_trade_stats(db, account_id)
         
         # 计算最终指标（容错处理除零错误）
-        win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0.0
-        long_win_rate = (long_wins / long_total * 100) if long_total > 0 else 0.0
-        short_win_rate = (short_wins / short_total * 100) if short_total > 0 else 0.0
-        profit_loss_ratio = (total_profit / total_loss) if total_loss > 0 else 0.0
-        profit_factor = (total_profit / total_loss) if total_loss > 0 else 0.0
-        avg_holding_time = (total_holding_time / total_trades) if total_trades > 0 else 0.0
+        total_trades = stats.total_trades
+        win_rate = (stats.winning_trades / total_trades * 100) if total_trades > 0 else 0.0
+        long_win_rate = (stats.long_wins / stats.long_total * 100) if stats.long_total > 0 else 0.0
+        short_win_rate = (stats.short_wins / stats.short_total * 100) if stats.short_total > 0 else 0.0
+        profit_loss_ratio = (stats.total_profit / stats.total_loss) if stats.total_loss > 0 else 0.0
+        profit_factor = (stats.total_profit / stats.total_loss) if stats.total_loss > 0 else 0.0
+        avg_holding_time = (stats.total_holding_hours / total_trades) if total_trades > 0 else 0.0
         
         return AccountStats(
             # 从 account_summary 获取
@@ -179,111 +116,234 @@ async def get_account_stats(db: AsyncSession = Depends(get_db)):
             margin_available=round(account_data["margin_available"], 2),
             open_trade_count=account_data["open_trade_count"],
             open_order_count=account_data["open_order_count"],
-            # 从 trades 计算
+            # 从 trade_stats 获取
             win_rate=round(win_rate, 2),
             profit_loss_ratio=round(profit_loss_ratio, 2),
             long_win_rate=round(long_win_rate, 2),
             short_win_rate=round(short_win_rate, 2),
-            max_drawdown=round(max_drawdown, 2),
+            max_drawdown=round(safe_float(stats.max_drawdown), 2),
             profit_factor=round(profit_factor, 2),
-            consecutive_losses=max_consecutive_losses,
-            consecutive_wins=max_consecutive_wins,
+            consecutive_losses=safe_int(stats.max_loss_streak),
+            consecutive_wins=safe_int(stats.max_win_streak),
             avg_holding_time=round(avg_holding_time, 2)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取账户统计失败: {str(e)}")
 
 
+@router.post("/stats/rebuild")
+async def rebuild_account_stats(
+    account_id: Optional[str] = Query(None, description="不指定时为默认账户"),
+    db: AsyncSession = Depends(get_db)
+):
+    """从 trades 表全量重建交易统计聚合"""
+    try:
+        stats = await rebuild_trade_stats(db, resolve_account_id(account_id))
+        bump_version("trades")
+        return {"status": "success", "total_trades": stats.total_trades}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重建交易统计失败: {str(e)}")
+
+
+def equity_curve_stmt(
+    account_id: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    max_points: int
+):
+    """
+    收益曲线查询（全部在数据库端完成）
+    1. 窗口函数按平仓时间累加盈亏
+    2. 按 from / to 截取区间（累计值仍包含区间之前的交易）
+    3. 将区间内的点按时间均分为若干桶，每桶保留累计盈亏最小和最大的点，
+       并始终保留首尾两点，返回的点数不超过 max_points
+       （未指定 from 时接口会在最前面补一个起始点，这里预留一个名额）
+    """
+    trade_time = func.coalesce(Trade.close_time, Trade.updated_at)
+    curve = select(
+        Trade.id.label("id"),
+        trade_time.label("date"),
+        func.sum(effective_pl_expr()).over(order_by=(trade_time, Trade.id)).label("cumulative_profit")
+    ).where(status_is(Trade.status, "closed"), account_clause(account_id)).subquery("curve")
+    
+    windowed = select(curve)
+    if date_from is not None:
+        windowed = windowed.where(curve.c.date >= date_from)
+    if date_to is not None:
+        windowed = windowed.where(curve.c.date <= date_to)
+    windowed = windowed.subquery("windowed")
+    
+    order = (windowed.c.date, windowed.c.id)
+    reserved = 2 if date_from is not None else 3  # 首尾两点 + 起始点
+    buckets = max(1, (max_points - reserved) // 2)
+    bucketed = select(
+        windowed,
+        func.ntile(buckets).over(order_by=order).label("bucket")
+    ).subquery("bucketed")
+    
+    ranked = select(
+        bucketed.c.id,
+        bucketed.c.date,
+        bucketed.c.cumulative_profit,
+        func.row_number().over(
+            partition_by=bucketed.c.bucket,
+            order_by=(bucketed.c.cumulative_profit.asc(), bucketed.c.id)
+        ).label("rank_min"),
+        func.row_number().over(
+            partition_by=bucketed.c.bucket,
+            order_by=(bucketed.c.cumulative_profit.desc(), bucketed.c.id)
+        ).label("rank_max"),
+        func.row_number().over(order_by=(bucketed.c.date, bucketed.c.id)).label("rank_first"),
+        func.row_number().over(order_by=(bucketed.c.date.desc(), bucketed.c.id.desc())).label("rank_last")
+    ).subquery("ranked")
+    
+    return select(
+        ranked.c.date,
+        ranked.c.cumulative_profit
+    ).where(
+        or_(
+            ranked.c.rank_min == 1,
+            ranked.c.rank_max == 1,
+            ranked.c.rank_first == 1,
+            ranked.c.rank_last == 1
+        )
+    ).order_by(ranked.c.date, ranked.c.id)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """未带时区的查询参数按 UTC 处理"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
 @router.get("/equity-curve", response_model=EquityCurveResponse)
-async def get_equity_curve(db: AsyncSession = Depends(get_db)):
+async def get_equity_curve(
+    request: Request,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    max_points: int = Query(1000, ge=10, le=10000),
+    account_id: Optional[str] = Query(None, description="不指定时为默认账户"),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
-    获取收益曲线数据（从 trades 表计算，仅统计已平仓订单）
+    获取收益曲线数据（仅统计已平仓订单）
+    - 累计收益由数据库窗口函数计算
+    - from / to 限定时间区间，max_points 限定返回点数（按桶保留极值点降采样）
+    - 响应按数据版本缓存，带 If-None-Match 且未变化时返回 304
     容错处理：NULL 值显示为 0
     """
+    return await response_cache.respond(
+        request, ("trades", "account"),
+        lambda: _equity_curve(db, resolve_account_id(account_id), date_from, date_to, max_points)
+    )
+
+
+async def _equity_curve(
+    db: AsyncSession,
+    account_id: str,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    max_points: int
+) -> Dict[str, Any]:
     try:
-        # 获取所有已平仓的订单，按时间排序
-        stmt = select(Trade).where(Trade.status == "closed").order_by(Trade.close_time)
-        result = await db.execute(stmt)
-        closed_trades = result.scalars().all()
-        
         # 获取初始余额
-        stmt = select(AccountSummary).where(AccountSummary.account_id == OANDA_ACCOUNT_ID)
+        stmt = select(AccountSummary.balance).where(AccountSummary.account_id == account_id)
         result = await db.execute(stmt)
-        account = result.scalar_one_or_none()
+        initial_balance = safe_float(result.scalar_one_or_none(), 100000.0)
+        
+        result = await db.execute(equity_curve_stmt(account_id, _as_utc(date_from), _as_utc(date_to), max_points))
+        rows = result.all()
         
-        initial_balance = safe_float(account.balance if account else None, 100000.0)
-        cumulative_profit = 0.0
         equity_data = []
         
-        # 添加起始点
-        if closed_trades:
-            first_trade_time = closed_trades[0].created_at
-            equity_data.append(EquityCurvePoint(
-                date=first_trade_time,
-                cumulative_profit=0.0,
-                balance=initial_balance
-            ))
+        # 未指定起始时间时，以第一笔交易的开仓时间作为起始点
+        if rows and date_from is None:
+            trade_time = func.coalesce(Trade.close_time, Trade.updated_at)
+            result = await db.execute(
+                select(Trade.created_at).where(
+                    status_is(Trade.status, "closed"),
+                    account_clause(account_id)
+                ).order_by(trade_time, Trade.id).limit(1)
+            )
+            equity_data.append({
+                "date": result.scalar_one_or_none() or rows[0].date,
+                "cumulative_profit": 0.0,
+                "balance": initial_balance
+            })
         
-        # 计算每笔交易后的累计收益
-        for trade in closed_trades:
-            # 容错处理：realized_pl 可能为 NULL
-            pl = safe_float(trade.realized_pl, 0.0)
-            
-            # 如果 realized_pl 为 NULL，尝试从 entry_price 和 exit_price 计算
-            if pl == 0.0 and trade.entry_price and trade.exit_price:
-                direction = safe_str(trade.direction, "long")
-                if direction == "long":
-                    pl = (safe_float(trade.exit_price, 0.0) - safe_float(trade.entry_price, 0.0)) * safe_float(trade.units, 0.0)
-                else:
-                    pl = (safe_float(trade.entry_price, 0.0) - safe_float(trade.exit_price, 0.0)) * safe_float(trade.units, 0.0)
-            
-            cumulative_profit += pl
-            current_balance = initial_balance + cumulative_profit
-            
-            # 使用 close_time，如果为 NULL 则使用 updated_at
-            trade_time = trade.close_time or trade.updated_at
-            
-            equity_data.append(EquityCurvePoint(
-                date=trade_time,
-                cumulative_profit=round(cumulative_profit, 2),
-                balance=round(current_balance, 2)
-            ))
+        # 字段同 EquityCurvePoint；由缓存层直接序列化，不逐点构建模型
+        for row in rows:
+            cumulative_profit = safe_float(row.cumulative_profit, 0.0)
+            equity_data.append({
+                "date": row.date,
+                "cumulative_profit": round(cumulative_profit, 2),
+                "balance": round(initial_balance + cumulative_profit, 2)
+            })
         
-        return EquityCurveResponse(data=equity_data)
+        return {"data": equity_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取收益曲线失败: {str(e)}")
 
 
-@router.get("/history", response_model=List[dict])
+def encode_history_cursor(close_time: Optional[datetime], trade_id: int) -> str:
+    """游标 = 上一页最后一行的 (close_time, id)，对客户端不透明"""
+    payload = json.dumps({"t": close_time.isoformat() if close_time else None, "id": trade_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        close_time = _as_utc(datetime.fromisoformat(payload["t"])) if payload["t"] else None
+        return close_time, int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+@router.get("/history", response_model=TradeHistoryPage)
 async def get_trade_history(
-    limit: int = 50,
-    offset: int = 0,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    account_id: Optional[str] = Query(None, description="不指定时为默认账户"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     获取历史交易记录（从 trades 表获取）
+    - 按 (close_time desc, id desc) 游标分页，翻到任意深度的代价与第一页相同
+    - 将返回的 next_cursor 作为下一次请求的 cursor 参数，为 null 时表示没有更多数据
+    - 响应按数据版本缓存，带 If-None-Match 且未变化时返回 304
     容错处理：NULL 值显示为 0 或空字符串
     """
+    return await response_cache.respond(request, ("trades",), lambda: _trade_history(db, resolve_account_id(account_id), limit, cursor))
+
+
+async def _trade_history(db: AsyncSession, account_id: str, limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    after = decode_history_cursor(cursor) if cursor else None
+    
     try:
-        stmt = select(Trade).where(
-            Trade.status == "closed"
-        ).order_by(
-            Trade.close_time.desc()
-        ).limit(limit).offset(offset)
+        # 多取一行用于判断是否还有下一页；close_time 非 NULL 的行取完后再接着取 NULL 的行
+        rows = []
+        if after is None or after[0] is not None:
+            result = await db.execute(closed_history_page_stmt(account_id, limit + 1, after))
+            rows = result.all()
+        if len(rows) <= limit:
+            result = await db.execute(closed_history_page_stmt(
+                account_id, limit + 1 - len(rows), after, null_close_time=True
+            ))
+            rows += result.all()
         
-        result = await db.execute(stmt)
-        trades = result.scalars().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1].close_time, rows[-1].id)
         
         history = []
-        for trade in trades:
+        for trade in rows:
             # 容错处理：计算 realized_pl
-            realized_pl = safe_float(trade.realized_pl, 0.0)
-            if realized_pl == 0.0 and trade.entry_price and trade.exit_price:
-                direction = safe_str(trade.direction, "long")
-                if direction == "long":
-                    realized_pl = (safe_float(trade.exit_price, 0.0) - safe_float(trade.entry_price, 0.0)) * safe_float(trade.units, 0.0)
-                else:
-                    realized_pl = (safe_float(trade.entry_price, 0.0) - safe_float(trade.exit_price, 0.0)) * safe_float(trade.units, 0.0)
+            realized_pl = effective_pl(trade.realized_pl, trade.entry_price, trade.exit_price, trade.units, trade.direction)
             
             history.append({
                 "id": trade.id,
@@ -301,6 +361,39 @@ async def get_trade_history(
                 "close_reason": safe_str(trade.close_reason, "")
             })
         
-        return history
+        # 字段同 TradeHistoryPage；由缓存层直接序列化，不逐行构建模型
+        return {"items": history, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取历史记录失败: {str(e)}")
+
+
+@router.post("/signals", response_model=SignalStatsResponse)
+async def get_signal_stats(query: SignalQuery, db: AsyncSession = Depends(get_read_db)):
+    """
+    按 AI 记录的信号（analysisJson）筛选已平仓交易并汇总
+    - contains / exists / match 条件下推到 SQL，由 GIN 索引 idx_trades_analysis 过滤
+    - 只返回聚合结果，不读取 analysisJson 内容
+    - group_by 指定时额外返回按该字段分组的统计（按交易数降序）
+    """
+    try:
+        filters = signal_filters(query.contains, query.exists, query.match)
+        filters.append(account_clause(resolve_account_id(query.account_id)))
+        result = await db.execute(signal_stats_stmt(filters))
+        total = summarize(result.one())
+        
+        groups = []
+        if query.group_by:
+            result = await db.execute(signal_stats_stmt(filters, query.group_by, query.max_groups))
+            groups = [{"key": row.key, **summarize(row)} for row in result.all()]
+        
+        return {"total": total, "groups": groups}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DBAPIError as e:
+        # jsonpath 语法错误（42xxx）、数据错误（22xxx）由数据库报出，属于请求参数问题
+        sqlstate = str(getattr(e.orig, "sqlstate", "") or "")
+        if sqlstate[:2] in ("42", "22"):
+            raise HTTPException(status_code=400, detail=f"信号筛选条件无效: {str(e.orig)}")
+        raise HTTPException(status_code=500, detail=f"信号统计失败: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"信号统计失败: {str(e)}")
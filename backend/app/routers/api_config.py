@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete
 from app.database import get_db
 from app.models import ApiConfig
+from app.oanda import oanda_clients
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from datetime import datetime
@@ -61,12 +62,9 @@ async def get_all_configs(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/active", response_model=ApiConfigResponse)
-async def get_active_config(db: AsyncSession = Depends(get_db)):
-    """获取当前激活的API配置"""
-    result = await db.execute(
-        select(ApiConfig).where(ApiConfig.is_active == 1).limit(1)
-    )
-    config = result.scalar_one_or_none()
+async def get_active_config():
+    """获取当前激活的API配置（从内存读取，配置写入后自动刷新）"""
+    config = oanda_clients.active_config
     
     if not config:
         raise HTTPException(status_code=404, detail="未找到激活的API配置")
@@ -105,6 +103,7 @@ async def create_config(
     db.add(new_config)
     await db.commit()
     await db.refresh(new_config)
+    await oanda_clients.reload()
     
     return new_config
 
@@ -138,6 +137,7 @@ async def update_config(
     config.updated_at = datetime.utcnow()
     await db.commit()
     await db.refresh(config)
+    await oanda_clients.reload()
     
     return config
 
@@ -155,6 +155,7 @@ async def delete_config(config_id: int, db: AsyncSession = Depends(get_db)):
     
     await db.execute(delete(ApiConfig).where(ApiConfig.id == config_id))
     await db.commit()
+    await oanda_clients.reload()
     
     return {"message": "配置已删除", "id": config_id}
 
@@ -178,6 +179,7 @@ async def activate_config(config_id: int, db: AsyncSession = Depends(get_db)):
     config.updated_at = datetime.utcnow()
     await db.commit()
     await db.refresh(config)
+    await oanda_clients.reload()
     
     return {"message": "配置已激活", "config": config}
 
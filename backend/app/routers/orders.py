@@ -1,51 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import defer
-from app.database import get_db
-from app.models import Trade
+from app.articles import article_ref, trade_with_article_stmt
+from app.database import get_read_db
+from app.models import Trade, status_is
+from app.queries import pending_orders_stmt
+from app.responses import FastJSONResponse
+from app.pricing import get_oanda_price, get_oanda_prices
 from app.schemas import PendingOrderList, OrderDetail
 from typing import List, Optional
-import httpx
-import os
-from dotenv import load_dotenv
 
-# 加载环境变量
-load_dotenv()
-
-router = APIRouter(prefix="/api/orders", tags=["orders"])
-
-OANDA_API_KEY = os.getenv("OANDA_API_KEY", "")
-OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID", "")
-OANDA_API_URL = os.getenv("OANDA_API_URL", "https://api-fxpractice.oanda.com")
-
-# 获取 OANDA 当前价格
-async def get_oanda_price(symbol: str) -> Optional[float]:
-    """从 OANDA 获取实时价格"""
-    if not OANDA_API_KEY or not OANDA_ACCOUNT_ID:
-        return None
-    
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "Authorization": f"Bearer {OANDA_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            response = await client.get(
-                f"{OANDA_API_URL}/v3/accounts/{OANDA_ACCOUNT_ID}/pricing",
-                headers=headers,
-                params={"instruments": symbol}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("prices"):
-                    price_data = data["prices"][0]
-                    bid = float(price_data["bids"][0]["price"])
-                    ask = float(price_data["asks"][0]["price"])
-                    return (bid + ask) / 2
-    except Exception as e:
-        print(f"获取 OANDA 价格失败: {e}")
-    return None
+router = APIRouter(prefix="/api/orders", tags=["orders"], default_response_class=FastJSONResponse)
 
 
 def safe_float(value, default=0.0) -> float:
@@ -66,76 +30,60 @@ def safe_str(value, default="") -> str:
 
 
 @router.get("/pending", response_model=List[PendingOrderList])
-async def get_pending_orders(db: AsyncSession = Depends(get_db)):
+async def get_pending_orders(
+    account_id: Optional[str] = Query(None, description="不指定时返回全部账户"),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
     获取挂单列表（未成交的限价单）
-    使用 defer 延迟加载 ai_article 字段
-    容错处理：NULL 值显示为 0 或空字符串
-    支持大小写状态值：pending, PENDING
+    只查询列表需要的列，结果为普通行，不创建 ORM 实例
+    容错处理：NULL 值显示为 0 或空字符串；symbol 为 NULL 的订单在查询中排除
+    状态值在写入时已统一为小写，可直接走部分索引
     """
     try:
-        # 查询状态为 pending 的订单（支持大小写）
-        stmt = select(Trade).where(
-            or_(
-                func.lower(Trade.status) == 'pending',
-                Trade.status == 'pending',
-                Trade.status == 'PENDING'
-            )
-        ).options(
-            defer(Trade.ai_article),
-            defer(Trade.analysisJson)
-        ).order_by(Trade.created_at.desc())
+        result = await db.execute(pending_orders_stmt(account_id))
+        rows = result.all()
         
-        result = await db.execute(stmt)
-        trades = result.scalars().all()
+        # 一次批量获取所有品种的实时价格（按品种去重）
+        prices = await get_oanda_prices(row.symbol for row in rows)
         
-        # 获取实时价格并构建响应
-        orders = []
-        for trade in trades:
-            # 容错处理：如果 symbol 为 NULL，跳过该订单
-            if not trade.symbol:
-                continue
-            
-            current_price = await get_oanda_price(trade.symbol)
-            
-            orders.append(PendingOrderList(
-                id=trade.id,
-                intent_id=safe_str(trade.intent_id, f"manual-{trade.id}"),  # NULL 时生成默认 ID
-                symbol=safe_str(trade.symbol, "UNKNOWN"),
-                units=safe_float(trade.units, 0.0),
-                entry_price=safe_float(trade.entry_price, 0.0),
-                stop_loss=safe_float(trade.stop_loss),
-                take_profit=safe_float(trade.take_profit),
-                current_price=safe_float(current_price or trade.current_price, 0.0),
-                created_at=trade.created_at
-            ))
-        
-        return orders
+        # 数据由我们自己构建（字段同 PendingOrderList），直接序列化，跳过 response_model 校验
+        return FastJSONResponse([
+            {
+                "id": row.id,
+                "intent_id": safe_str(row.intent_id, f"manual-{row.id}"),  # NULL 时生成默认 ID
+                "symbol": row.symbol,
+                "units": safe_float(row.units, 0.0),
+                "entry_price": safe_float(row.entry_price, 0.0),
+                "stop_loss": safe_float(row.stop_loss),
+                "take_profit": safe_float(row.take_profit),
+                "current_price": safe_float(prices.get(row.symbol) or row.current_price, 0.0),
+                "created_at": row.created_at
+            }
+            for row in rows
+        ])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取挂单列表失败: {str(e)}")
 
 
 @router.get("/pending/{intent_id}", response_model=OrderDetail)
-async def get_pending_order_detail(intent_id: str, db: AsyncSession = Depends(get_db)):
+async def get_pending_order_detail(intent_id: str, db: AsyncSession = Depends(get_read_db)):
     """
-    获取挂单详情（包含完整数据和 AI 分析报告）
+    获取挂单详情（包含完整数据和 AI 分析报告的引用）
     容错处理：NULL 值显示为 0 或空字符串
-    支持大小写状态值
     """
     try:
-        stmt = select(Trade).where(
+        # 报告内容不随详情返回，只查询版本号和长度用于生成引用
+        stmt = trade_with_article_stmt(
             Trade.intent_id == intent_id,
-            or_(
-                func.lower(Trade.status) == 'pending',
-                Trade.status == 'pending',
-                Trade.status == 'PENDING'
-            )
+            status_is(Trade.status, "pending")
         )
         result = await db.execute(stmt)
-        trade = result.scalar_one_or_none()
+        row = result.one_or_none()
         
-        if not trade:
+        if not row:
             raise HTTPException(status_code=404, detail="挂单不存在")
+        trade = row.Trade
         
         # 获取实时价格
         if trade.symbol:
@@ -157,7 +105,7 @@ async def get_pending_order_detail(intent_id: str, db: AsyncSession = Depends(ge
             stop_loss=safe_float(trade.stop_loss),
             take_profit=safe_float(trade.take_profit),
             status=safe_str(trade.status, "pending"),
-            ai_article=safe_str(trade.ai_article),
+            article=article_ref(trade.intent_id, row.article_version, row.article_length),
             analysisJson=trade.analysisJson,
             confidence=safe_float(trade.confidence),
             oanda_order_id=safe_str(trade.oanda_order_id),
@@ -1,51 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import defer
-from app.database import get_db
-from app.models import Trade
+from sqlalchemy.engine import Row
+from app.articles import article_ref, trade_with_article_stmt
+from app.database import get_read_db, read_session
+from app.models import Trade, status_is
+from app.queries import open_positions_stmt
+from app.responses import FastJSONResponse, dumps
+from app.price_stream import price_book
+from app.pricing import get_oanda_price, get_oanda_prices
 from app.schemas import PositionList, OrderDetail
-from typing import List, Optional
-import httpx
+from typing import Any, Dict, List, Optional
+import asyncio
 import os
-from dotenv import load_dotenv
+import time
 
-# 加载环境变量
-load_dotenv()
+router = APIRouter(prefix="/api/positions", tags=["positions"], default_response_class=FastJSONResponse)
 
-router = APIRouter(prefix="/api/positions", tags=["positions"])
-
-OANDA_API_KEY = os.getenv("OANDA_API_KEY", "")
-OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID", "")
-OANDA_API_URL = os.getenv("OANDA_API_URL", "https://api-fxpractice.oanda.com")
-
-
-async def get_oanda_price(symbol: str) -> Optional[float]:
-    """从 OANDA 获取实时价格"""
-    if not OANDA_API_KEY or not OANDA_ACCOUNT_ID:
-        return None
-    
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "Authorization": f"Bearer {OANDA_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            response = await client.get(
-                f"{OANDA_API_URL}/v3/accounts/{OANDA_ACCOUNT_ID}/pricing",
-                headers=headers,
-                params={"instruments": symbol}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("prices"):
-                    price_data = data["prices"][0]
-                    bid = float(price_data["bids"][0]["price"])
-                    ask = float(price_data["asks"][0]["price"])
-                    return (bid + ask) / 2
-    except Exception as e:
-        print(f"获取 OANDA 价格失败: {e}")
-    return None
+# 持仓推送：单连接最小推送间隔、心跳间隔、持仓集合重新加载间隔、无价格流时的刷新间隔（秒）
+POSITION_STREAM_MIN_INTERVAL = float(os.getenv("POSITION_STREAM_MIN_INTERVAL", "1"))
+POSITION_STREAM_HEARTBEAT = float(os.getenv("POSITION_STREAM_HEARTBEAT", "15"))
+POSITION_STREAM_RELOAD_INTERVAL = float(os.getenv("POSITION_STREAM_RELOAD_INTERVAL", "10"))
+POSITION_STREAM_POLL_INTERVAL = float(os.getenv("POSITION_STREAM_POLL_INTERVAL", "3"))
 
 
 def safe_float(value, default=0.0) -> float:
@@ -97,91 +73,174 @@ def calculate_margin(units: float, current_price: float, leverage: float = 50) -
         return 0.0
 
 
+def build_position(row: Row, prices: Dict[str, float]) -> Dict[str, Any]:
+    """使用实时价格构建持仓行（字段同 PositionList）并计算盈亏"""
+    current_price = prices.get(row.symbol)
+    if not current_price:
+        current_price = safe_float(row.current_price, row.entry_price)
+    
+    unrealized_pl = calculate_unrealized_pl(
+        row.entry_price,
+        current_price,
+        row.units,
+        safe_str(row.direction, "long")
+    )
+    
+    margin = calculate_margin(row.units, current_price)
+    
+    return {
+        "id": row.id,
+        "intent_id": safe_str(row.intent_id, f"manual-{row.id}"),
+        "symbol": row.symbol,
+        "direction": safe_str(row.direction, "long"),
+        "units": safe_float(row.units, 0.0),
+        "entry_price": safe_float(row.entry_price, 0.0),
+        "stop_loss": safe_float(row.stop_loss),
+        "take_profit": safe_float(row.take_profit),
+        "current_price": safe_float(current_price, 0.0),
+        "unrealized_pl": unrealized_pl,
+        "margin": margin,
+        "created_at": row.created_at
+    }
+
+
 @router.get("/open", response_model=List[PositionList])
-async def get_open_positions(db: AsyncSession = Depends(get_db)):
+async def get_open_positions(
+    account_id: Optional[str] = Query(None, description="不指定时返回全部账户"),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
     获取持仓列表（已成交的订单）
-    使用 defer 延迟加载 ai_article 字段
-    容错处理：NULL 值显示为 0 或空字符串
-    支持大小写状态值：open, OPEN
+    只查询列表需要的列，结果为普通行，不创建 ORM 实例
+    容错处理：NULL 值显示为 0 或空字符串；symbol 为 NULL 的订单在查询中排除
+    状态值在写入时已统一为小写，可直接走部分索引
     """
     try:
-        # 查询状态为 open 的订单（支持大小写）
-        stmt = select(Trade).where(
-            or_(
-                func.lower(Trade.status) == 'open',
-                Trade.status == 'open',
-                Trade.status == 'OPEN'
-            )
-        ).options(
-            defer(Trade.ai_article),
-            defer(Trade.analysisJson)
-        ).order_by(Trade.created_at.desc())
+        result = await db.execute(open_positions_stmt(account_id))
+        rows = result.all()
         
-        result = await db.execute(stmt)
-        trades = result.scalars().all()
+        # 一次批量获取所有品种的实时价格（按品种去重）
+        prices = await get_oanda_prices(row.symbol for row in rows)
         
-        # 获取实时价格并计算盈亏
-        positions = []
-        for trade in trades:
-            # 容错处理：如果 symbol 为 NULL，跳过该订单
-            if not trade.symbol:
-                continue
-            
-            current_price = await get_oanda_price(trade.symbol)
-            if not current_price:
-                current_price = safe_float(trade.current_price, trade.entry_price)
-            
-            unrealized_pl = calculate_unrealized_pl(
-                trade.entry_price,
-                current_price,
-                trade.units,
-                safe_str(trade.direction, "long")
-            )
-            
-            margin = calculate_margin(trade.units, current_price)
-            
-            positions.append(PositionList(
-                id=trade.id,
-                intent_id=safe_str(trade.intent_id, f"manual-{trade.id}"),
-                symbol=safe_str(trade.symbol, "UNKNOWN"),
-                direction=safe_str(trade.direction, "long"),
-                units=safe_float(trade.units, 0.0),
-                entry_price=safe_float(trade.entry_price, 0.0),
-                stop_loss=safe_float(trade.stop_loss),
-                take_profit=safe_float(trade.take_profit),
-                current_price=safe_float(current_price, 0.0),
-                unrealized_pl=unrealized_pl,
-                margin=margin,
-                created_at=trade.created_at
-            ))
-        
-        return positions
+        # 数据由我们自己构建（字段同 PositionList），直接序列化，跳过 response_model 校验
+        return FastJSONResponse([build_position(row, prices) for row in rows])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取持仓列表失败: {str(e)}")
 
 
+def _sse(event: str, data) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def _load_open_trades(account_id: Optional[str] = None) -> List[Row]:
+    async with read_session() as session:
+        result = await session.execute(open_positions_stmt(account_id))
+        return result.all()
+
+
+@router.get("/stream")
+async def stream_open_positions(
+    request: Request,
+    account_id: Optional[str] = Query(None, description="不指定时推送全部账户")
+):
+    """
+    持仓盈亏推送（Server-Sent Events）
+    - 连接建立后先推送 snapshot（完整持仓列表）
+    - 价格变动时推送 delta（仅包含市价 / 盈亏 / 保证金有变化的持仓）
+    - 每个连接最多每 POSITION_STREAM_MIN_INTERVAL 秒推送一次，期间的变动合并
+    - 客户端消费慢时发送会阻塞，生成器随之暂停，积压的变动合并为最新状态
+    - 持仓集合每 POSITION_STREAM_RELOAD_INTERVAL 秒从数据库重新加载，变化时重新推送 snapshot
+    """
+    async def event_stream():
+        changed = price_book.subscribe()
+        try:
+            trades: List[Row] = []
+            sent: Dict[int, tuple] = {}
+            need_snapshot = True
+            loaded_at = 0.0
+            last_sent_at = time.monotonic()
+            
+            while True:
+                if await request.is_disconnected():
+                    break
+                
+                now = time.monotonic()
+                reload = now - loaded_at >= POSITION_STREAM_RELOAD_INTERVAL
+                if reload:
+                    loaded_at = now
+                    reloaded = await _load_open_trades(account_id)
+                    if [t.id for t in reloaded] != [t.id for t in trades]:
+                        need_snapshot = True
+                    trades = reloaded
+                
+                prices = await get_oanda_prices(trade.symbol for trade in trades)
+                rows = [build_position(trade, prices) for trade in trades]
+                
+                if need_snapshot:
+                    # 首次连接或持仓集合变化：推送完整列表
+                    yield _sse("snapshot", rows)
+                    sent = {row["id"]: (row["current_price"], row["unrealized_pl"], row["margin"]) for row in rows}
+                    need_snapshot = False
+                    last_sent_at = time.monotonic()
+                else:
+                    deltas = []
+                    for row in rows:
+                        state = (row["current_price"], row["unrealized_pl"], row["margin"])
+                        if sent.get(row["id"]) != state:
+                            sent[row["id"]] = state
+                            deltas.append({
+                                "id": row["id"],
+                                "current_price": row["current_price"],
+                                "unrealized_pl": row["unrealized_pl"],
+                                "margin": row["margin"]
+                            })
+                    if deltas:
+                        yield _sse("delta", deltas)
+                        last_sent_at = time.monotonic()
+                    elif time.monotonic() - last_sent_at >= POSITION_STREAM_HEARTBEAT:
+                        # 心跳注释，保持连接不被代理断开
+                        yield ": ping\n\n"
+                        last_sent_at = time.monotonic()
+                
+                # 节流：两次推送之间至少间隔 POSITION_STREAM_MIN_INTERVAL 秒
+                await asyncio.sleep(POSITION_STREAM_MIN_INTERVAL)
+                # 价格流不可用时没有变动通知，退化为按 POSITION_STREAM_POLL_INTERVAL 定时刷新
+                timeout = POSITION_STREAM_RELOAD_INTERVAL if price_book.live else POSITION_STREAM_POLL_INTERVAL
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+        finally:
+            price_book.unsubscribe(changed)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Content-Encoding: identity 使 GZip 中间件跳过该响应，避免事件被压缩缓冲
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+    )
+
+
 @router.get("/open/{intent_id}", response_model=OrderDetail)
-async def get_position_detail(intent_id: str, db: AsyncSession = Depends(get_db)):
+async def get_position_detail(intent_id: str, db: AsyncSession = Depends(get_read_db)):
     """
-    获取持仓详情（包含完整数据和 AI 分析报告）
+    获取持仓详情（包含完整数据和 AI 分析报告的引用）
     容错处理：NULL 值显示为 0 或空字符串
-    支持大小写状态值
     """
     try:
-        stmt = select(Trade).where(
+        # 报告内容不随详情返回，只查询版本号和长度用于生成引用
+        stmt = trade_with_article_stmt(
             Trade.intent_id == intent_id,
-            or_(
-                func.lower(Trade.status) == 'open',
-                Trade.status == 'open',
-                Trade.status == 'OPEN'
-            )
+            status_is(Trade.status, "open")
         )
         result = await db.execute(stmt)
-        trade = result.scalar_one_or_none()
+        row = result.one_or_none()
         
-        if not trade:
+        if not row:
             raise HTTPException(status_code=404, detail="持仓不存在")
+        trade = row.Trade
         
         # 获取实时价格
         if trade.symbol:
@@ -203,7 +262,7 @@ async def get_position_detail(intent_id: str, db: AsyncSession = Depends(get_db)
             stop_loss=safe_float(trade.stop_loss),
             take_profit=safe_float(trade.take_profit),
             status=safe_str(trade.status, "open"),
-            ai_article=safe_str(trade.ai_article),
+            article=article_ref(trade.intent_id, row.article_version, row.article_length),
             analysisJson=trade.analysisJson,
             confidence=safe_float(trade.confidence),
             oanda_order_id=safe_str(trade.oanda_order_id),
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.articles import (
+    ARTICLE_CACHE_MAX_AGE, article_html_cache, get_article_version, load_article, render_markdown
+)
+from app.database import get_read_db
+from typing import Dict, Optional
+
+router = APIRouter(prefix="/api/trades", tags=["trades"])
+
+# text/* 响应由 Starlette 自动附加 charset=utf-8
+MEDIA_TYPES = {"markdown": "text/markdown", "html": "text/html"}
+
+
+def article_headers(version: str, format: str, requested_version: Optional[str]) -> Dict[str, str]:
+    """
+    报告的缓存头
+    - ETag 取内容哈希，HTML 变体单独一个 ETag
+    - URL 中的版本号与当前一致时内容不会再变，允许长期缓存；否则每次重新验证
+    """
+    etag = f'"{version}"' if format == "markdown" else f'"{version}-html"'
+    if requested_version == version:
+        cache_control = f"public, max-age={ARTICLE_CACHE_MAX_AGE}, immutable"
+    else:
+        cache_control = "no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+@router.get("/{intent_id}/article")
+async def get_trade_article(
+    intent_id: str,
+    request: Request,
+    format: str = Query("markdown", pattern="^(markdown|html)$"),
+    v: Optional[str] = Query(None, description="报告版本号（详情接口返回的 URL 中已带上）"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    获取 AI 分析报告
+    - format=markdown 返回原文，format=html 返回渲染后的 HTML（首次渲染后缓存）
+    - 先只查版本号：客户端缓存仍有效时返回 304，HTML 已缓存时不读取报告内容
+    """
+    try:
+        version = await get_article_version(db, intent_id)
+        if not version:
+            raise HTTPException(status_code=404, detail="分析报告不存在")
+
+        headers = article_headers(version, format, v)
+        if_none_match = request.headers.get("if-none-match", "")
+        if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        body = article_html_cache.get(intent_id, version) if format == "html" else None
+        if body is None:
+            article = await load_article(db, intent_id)
+            if article is None:
+                raise HTTPException(status_code=404, detail="分析报告不存在")
+            content, loaded_version = article
+            if loaded_version != version:
+                # 两次查询之间报告被更新，以实际读到的内容为准
+                version = loaded_version
+                headers = article_headers(version, format, v)
+
+            if format == "html":
+                try:
+                    html = await run_in_threadpool(render_markdown, content)
+                except ImportError:
+                    raise HTTPException(status_code=503, detail="未安装 markdown，无法渲染 HTML")
+                body = html.encode()
+                article_html_cache.put(intent_id, version, body)
+            else:
+                body = content.encode()
+
+        return Response(content=body, media_type=MEDIA_TYPES[format], headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取分析报告失败: {str(e)}")
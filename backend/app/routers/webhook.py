@@ -1,241 +1,383 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
-from app.database import get_db
-from app.models import Trade, AccountSummary
+from app.accounts import account_clause, for_each_account
+from app.database import AsyncSessionLocal, get_db
+from app.metrics import webhook_events
+from app.models import Trade, AccountSummary, normalize_status
+from app.account_refresher import AccountSummaryRefresher
+from app.oanda import get_oanda_client
+from app.price_stream import price_streamer
+from app.reconcile import reconcile_account
+from app.response_cache import bump_version
+from app.trade_stats import record_closed_trade
+from app.transaction_sync import TransactionSyncer
+from app.webhook_dedup import transaction_dedup, transaction_id_for
+from app.webhook_inbox import enqueue_webhook_event, inbox_stats, retry_dead_event
 from app.schemas import OandaWebhookPayload
-from typing import Dict, Any
-import httpx
-import os
+from typing import Dict, Any, Optional
 from datetime import datetime
-from dotenv import load_dotenv
 import logging
 
-load_dotenv()
-
 router = APIRouter(prefix="/api/webhook", tags=["webhook"])
 logger = logging.getLogger(__name__)
 
-OANDA_API_KEY = os.getenv("OANDA_API_KEY", "")
-OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID", "")
-OANDA_API_URL = os.getenv("OANDA_API_URL", "https://api-fxpractice.oanda.com")
+
+def _oanda_found(response, what: str) -> bool:
+    """
+    检查 OANDA 响应：2xx 返回 True；404 视为终态（OANDA 上已不存在），记录后返回 False
+    其他状态（429、5xx 等）抛出 httpx.HTTPStatusError，由 Webhook 收件箱退避重试，超过次数转入死信
+    """
+    if response.status_code == 404:
+        logger.warning(f"OANDA 上不存在{what}，跳过同步")
+        return False
+    response.raise_for_status()
+    return True
 
 
-async def sync_order_from_oanda(order_id: str, db: AsyncSession):
+async def sync_order_from_oanda(order_id: str, db: AsyncSession, account_id: Optional[str] = None):
     """从 OANDA 同步单个订单数据到数据库"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "Authorization": f"Bearer {OANDA_API_KEY}",
-                "Content-Type": "application/json"
-            }
+        client = get_oanda_client(account_id)
+        
+        # 获取订单详情
+        response = await client.get(f"/orders/{order_id}")
+        
+        if _oanda_found(response, f"订单 {order_id}"):
+            order_data = response.json().get("order", {})
             
-            # 获取订单详情
-            response = await client.get(
-                f"{OANDA_API_URL}/v3/accounts/{OANDA_ACCOUNT_ID}/orders/{order_id}",
-                headers=headers
-            )
+            # 查找数据库中的订单
+            stmt = select(Trade).where(Trade.oanda_order_id == order_id, account_clause(client.account_id))
+            result = await db.execute(stmt)
+            trade = result.scalar_one_or_none()
             
-            if response.status_code == 200:
-                order_data = response.json().get("order", {})
-                
-                # 查找数据库中的订单
-                stmt = select(Trade).where(Trade.oanda_order_id == order_id)
-                result = await db.execute(stmt)
-                trade = result.scalar_one_or_none()
+            if trade:
+                # 更新订单状态
+                trade.status = normalize_status(order_data.get("state", ""))
+                trade.current_price = float(order_data.get("price", 0))
+                trade.updated_at = datetime.utcnow()
+                await db.commit()
+                logger.info(f"订单 {order_id} 已更新")
+            else:
+                logger.warning(f"数据库中未找到订单 {order_id}")
                 
-                if trade:
-                    # 更新订单状态
-                    trade.status = order_data.get("state", "").lower()
-                    trade.current_price = float(order_data.get("price", 0))
-                    trade.updated_at = datetime.utcnow()
-                    await db.commit()
-                    logger.info(f"订单 {order_id} 已更新")
-                else:
-                    logger.warning(f"数据库中未找到订单 {order_id}")
-                    
     except Exception as e:
         logger.error(f"同步订单失败: {e}")
+        raise
 
 
-async def sync_trade_from_oanda(trade_id: str, db: AsyncSession):
+async def sync_trade_from_oanda(trade_id: str, db: AsyncSession, account_id: Optional[str] = None):
     """从 OANDA 同步单个交易数据到数据库"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "Authorization": f"Bearer {OANDA_API_KEY}",
-                "Content-Type": "application/json"
-            }
+        client = get_oanda_client(account_id)
+        
+        # 获取交易详情
+        response = await client.get(f"/trades/{trade_id}")
+        
+        if _oanda_found(response, f"交易 {trade_id}"):
+            trade_data = response.json().get("trade", {})
             
-            # 获取交易详情
-            response = await client.get(
-                f"{OANDA_API_URL}/v3/accounts/{OANDA_ACCOUNT_ID}/trades/{trade_id}",
-                headers=headers
-            )
+            # 查找数据库中的交易（行锁：与 TRADE_CLOSE 事件和增量同步串行，平仓只计入一次统计；
+            # populate_existing 以加锁后读到的最新状态覆盖会话中已加载的对象）
+            stmt = select(Trade).where(
+                Trade.oanda_trade_id == trade_id, account_clause(client.account_id)
+            ).with_for_update().execution_options(populate_existing=True)
+            result = await db.execute(stmt)
+            trade = result.scalar_one_or_none()
             
-            if response.status_code == 200:
-                trade_data = response.json().get("trade", {})
+            if trade:
+                was_closed = trade.status == "closed"
+                
+                # 更新交易数据
+                trade.current_price = float(trade_data.get("price", 0))
+                trade.unrealized_pl = float(trade_data.get("unrealizedPL", 0))
+                trade.financing = float(trade_data.get("financing", 0))
+                trade.status = normalize_status(trade_data.get("state", ""))
+                trade.updated_at = datetime.utcnow()
+                
+                # 首次同步到平仓状态：补全平仓数据并计入交易统计
+                if trade.status == "closed" and not was_closed:
+                    if trade_data.get("averageClosePrice"):
+                        trade.exit_price = float(trade_data["averageClosePrice"])
+                    trade.realized_pl = float(trade_data.get("realizedPL", 0))
+                    trade.close_time = trade.close_time or datetime.utcnow()
+                    await record_closed_trade(db, trade, client.account_id)
                 
-                # 查找数据库中的交易
-                stmt = select(Trade).where(Trade.oanda_trade_id == trade_id)
-                result = await db.execute(stmt)
-                trade = result.scalar_one_or_none()
+                await db.commit()
+                logger.info(f"交易 {trade_id} 已更新")
+            else:
+                logger.warning(f"数据库中未找到交易 {trade_id}")
                 
-                if trade:
-                    # 更新交易数据
-                    trade.current_price = float(trade_data.get("price", 0))
-                    trade.unrealized_pl = float(trade_data.get("unrealizedPL", 0))
-                    trade.financing = float(trade_data.get("financing", 0))
-                    trade.status = trade_data.get("state", "").lower()
-                    trade.updated_at = datetime.utcnow()
-                    await db.commit()
-                    logger.info(f"交易 {trade_id} 已更新")
-                else:
-                    logger.warning(f"数据库中未找到交易 {trade_id}")
-                    
     except Exception as e:
         logger.error(f"同步交易失败: {e}")
+        raise
 
 
-async def sync_account_summary(db: AsyncSession):
-    """从 OANDA 同步账户摘要到数据库"""
+async def sync_account_summary(db: AsyncSession, account_id: Optional[str] = None):
+    """从 OANDA 同步账户摘要到数据库（未指定时为默认账户）"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            headers = {
-                "Authorization": f"Bearer {OANDA_API_KEY}",
-                "Content-Type": "application/json"
-            }
+        client = get_oanda_client(account_id)
+        account_id = client.account_id
+        
+        # 获取账户摘要
+        response = await client.get("/summary")
+        
+        if _oanda_found(response, f"账户 {account_id}"):
+            account_data = response.json().get("account", {})
             
-            # 获取账户摘要
-            response = await client.get(
-                f"{OANDA_API_URL}/v3/accounts/{OANDA_ACCOUNT_ID}/summary",
-                headers=headers
-            )
+            # 更新或插入账户摘要
+            stmt = select(AccountSummary).where(AccountSummary.account_id == account_id)
+            result = await db.execute(stmt)
+            account = result.scalar_one_or_none()
+            
+            if account:
+                # 更新现有记录
+                account.currency = account_data.get("currency")
+                account.balance = float(account_data.get("balance", 0))
+                account.nav = float(account_data.get("NAV", 0))
+                account.unrealized_pl = float(account_data.get("unrealizedPL", 0))
+                account.pl = float(account_data.get("pl", 0))
+                account.resettable_pl = float(account_data.get("resettablePL", 0))
+                account.margin_used = float(account_data.get("marginUsed", 0))
+                account.margin_available = float(account_data.get("marginAvailable", 0))
+                account.margin_call_percent = float(account_data.get("marginCallPercent", 0))
+                account.position_value = float(account_data.get("positionValue", 0))
+                account.open_trade_count = int(account_data.get("openTradeCount", 0))
+                account.open_order_count = int(account_data.get("openPositionCount", 0))
+                # last_transaction_id 是增量同步的游标，只由 transaction_sync 推进
+                account.updated_at = datetime.utcnow()
+            else:
+                # 插入新记录
+                account = AccountSummary(
+                    account_id=account_id,
+                    currency=account_data.get("currency"),
+                    balance=float(account_data.get("balance", 0)),
+                    nav=float(account_data.get("NAV", 0)),
+                    unrealized_pl=float(account_data.get("unrealizedPL", 0)),
+                    pl=float(account_data.get("pl", 0)),
+                    resettable_pl=float(account_data.get("resettablePL", 0)),
+                    margin_used=float(account_data.get("marginUsed", 0)),
+                    margin_available=float(account_data.get("marginAvailable", 0)),
+                    margin_call_percent=float(account_data.get("marginCallPercent", 0)),
+                    position_value=float(account_data.get("positionValue", 0)),
+                    open_trade_count=int(account_data.get("openTradeCount", 0)),
+                    open_order_count=int(account_data.get("openPositionCount", 0)),
+                    last_transaction_id=account_data.get("lastTransactionID", ""),
+                    updated_at=datetime.utcnow()
+                )
+                db.add(account)
+            
+            await db.commit()
+            bump_version("account")
+            logger.info(f"账户 {account_id} 摘要已更新")
             
-            if response.status_code == 200:
-                account_data = response.json().get("account", {})
-                
-                # 更新或插入账户摘要
-                stmt = select(AccountSummary).where(AccountSummary.account_id == OANDA_ACCOUNT_ID)
-                result = await db.execute(stmt)
-                account = result.scalar_one_or_none()
-                
-                if account:
-                    # 更新现有记录
-                    account.currency = account_data.get("currency")
-                    account.balance = float(account_data.get("balance", 0))
-                    account.nav = float(account_data.get("NAV", 0))
-                    account.unrealized_pl = float(account_data.get("unrealizedPL", 0))
-                    account.pl = float(account_data.get("pl", 0))
-                    account.resettable_pl = float(account_data.get("resettablePL", 0))
-                    account.margin_used = float(account_data.get("marginUsed", 0))
-                    account.margin_available = float(account_data.get("marginAvailable", 0))
-                    account.margin_call_percent = float(account_data.get("marginCallPercent", 0))
-                    account.position_value = float(account_data.get("positionValue", 0))
-                    account.open_trade_count = int(account_data.get("openTradeCount", 0))
-                    account.open_order_count = int(account_data.get("openPositionCount", 0))
-                    account.last_transaction_id = account_data.get("lastTransactionID", "")
-                    account.updated_at = datetime.utcnow()
-                else:
-                    # 插入新记录
-                    account = AccountSummary(
-                        account_id=OANDA_ACCOUNT_ID,
-                        currency=account_data.get("currency"),
-                        balance=float(account_data.get("balance", 0)),
-                        nav=float(account_data.get("NAV", 0)),
-                        unrealized_pl=float(account_data.get("unrealizedPL", 0)),
-                        pl=float(account_data.get("pl", 0)),
-                        resettable_pl=float(account_data.get("resettablePL", 0)),
-                        margin_used=float(account_data.get("marginUsed", 0)),
-                        margin_available=float(account_data.get("marginAvailable", 0)),
-                        margin_call_percent=float(account_data.get("marginCallPercent", 0)),
-                        position_value=float(account_data.get("positionValue", 0)),
-                        open_trade_count=int(account_data.get("openTradeCount", 0)),
-                        open_order_count=int(account_data.get("openPositionCount", 0)),
-                        last_transaction_id=account_data.get("lastTransactionID", ""),
-                        updated_at=datetime.utcnow()
-                    )
-                    db.add(account)
-                
-                await db.commit()
-                logger.info("账户摘要已更新")
-                
     except Exception as e:
         logger.error(f"同步账户摘要失败: {e}")
+        raise
+
+
+async def handle_oanda_event(body: Dict[str, Any], db: AsyncSession):
+    """
+    处理一条 OANDA 事件（由收件箱 worker 调用）
+    出错时抛出异常，由收件箱负责重试和死信
+    """
+    # 解析事件类型和所属账户（未带账户的事件归属默认账户）
+    event_type = body.get("type", "")
+    transaction = body.get("transaction", {})
+    account_id = get_oanda_client(body.get("accountID") or transaction.get("accountID")).account_id
+    
+    # 根据事件类型处理
+    if event_type == "ORDER_FILL":
+        # 订单成交
+        order_id = transaction.get("orderID")
+        trade_id = transaction.get("tradeOpened", {}).get("tradeID")
+        
+        if order_id:
+            await sync_order_from_oanda(order_id, db, account_id)
+        if trade_id:
+            await sync_trade_from_oanda(trade_id, db, account_id)
+            
+    elif event_type == "ORDER_CANCEL":
+        # 订单取消
+        order_id = transaction.get("orderID")
+        if order_id:
+            await sync_order_from_oanda(order_id, db, account_id)
+            
+    elif event_type == "TRADE_CLOSE":
+        # 交易平仓
+        trade_id = transaction.get("tradeID")
+        if trade_id:
+            # 更新交易为已平仓（行锁：与增量同步、单笔同步串行，平仓只计入一次统计）
+            stmt = select(Trade).where(
+                Trade.oanda_trade_id == trade_id, account_clause(account_id)
+            ).with_for_update().execution_options(populate_existing=True)
+            result = await db.execute(stmt)
+            trade = result.scalar_one_or_none()
+            
+            # 重复推送的平仓事件不再重复计入统计
+            if trade and trade.status != "closed":
+                trade.status = "closed"
+                trade.exit_price = float(transaction.get("price", 0))
+                trade.realized_pl = float(transaction.get("realizedPL", 0))
+                trade.financing = float(transaction.get("financing", 0))
+                trade.commission = float(transaction.get("commission", 0))
+                trade.close_time = datetime.utcnow()
+                trade.close_reason = transaction.get("reason", "")
+                trade.updated_at = datetime.utcnow()
+                await record_closed_trade(db, trade, account_id)
+                await db.commit()
+                logger.info(f"交易 {trade_id} 已平仓")
+    
+    # 开平仓 / 撤单会改变价格流的订阅品种和分析接口的结果
+    if event_type in ("ORDER_FILL", "ORDER_CANCEL", "TRADE_CLOSE"):
+        price_streamer.notify_trades_changed()
+        bump_version("trades")
+    
+    # 账户摘要合并刷新：短时间内的多个事件只同步一次
+    account_refresher(account_id).trigger()
 
 
-@router.post("/oanda")
+# 账户摘要合并刷新器（每个账户一个，按需创建）
+_account_refreshers: Dict[str, AccountSummaryRefresher] = {}
+
+
+def account_refresher(account_id: str) -> AccountSummaryRefresher:
+    refresher = _account_refreshers.get(account_id)
+    if refresher is None:
+        refresher = AccountSummaryRefresher(lambda db: sync_account_summary(db, account_id))
+        _account_refreshers[account_id] = refresher
+    return refresher
+
+
+async def stop_account_refreshers():
+    for refresher in _account_refreshers.values():
+        await refresher.stop()
+
+
+def _on_transactions_applied(account_id: str):
+    """增量同步写入了交易变动"""
+    price_streamer.notify_trades_changed()
+    account_refresher(account_id).trigger()
+
+
+# 基于 last_transaction_id 的增量同步（lifespan 中启动定时任务）
+transaction_syncer = TransactionSyncer(_on_transactions_applied)
+
+
+@router.post("/oanda", status_code=202)
 async def oanda_webhook(
     request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     OANDA Webhook 端点
-    接收 OANDA 推送的订单变动通知，实时同步到数据库
+    只把原始事件写入收件箱并立即返回 202，同步 OANDA 数据由后台 worker 完成
+    按 OANDA 交易 ID 去重：重复投递直接返回，不入库、不触发同步
     """
+    event_type = "unknown"
     try:
         # 获取原始请求体
         body = await request.json()
-        logger.info(f"收到 OANDA Webhook: {body}")
+        event_type = str(body.get("type") or "unknown")
+        transaction_id = transaction_id_for(body)
         
-        # 解析事件类型
-        event_type = body.get("type", "")
-        transaction = body.get("transaction", {})
+        # 内存 LRU 命中：不做任何数据库或 HTTP 操作
+        if transaction_dedup.seen(transaction_id):
+            webhook_events.inc(event_type, "duplicate")
+            return {"status": "duplicate", "message": "重复事件已忽略", "transaction_id": transaction_id}
         
-        # 根据事件类型处理
-        if event_type == "ORDER_FILL":
-            # 订单成交
-            order_id = transaction.get("orderID")
-            trade_id = transaction.get("tradeOpened", {}).get("tradeID")
-            
-            if order_id:
-                await sync_order_from_oanda(order_id, db)
-            if trade_id:
-                await sync_trade_from_oanda(trade_id, db)
-                
-        elif event_type == "ORDER_CANCEL":
-            # 订单取消
-            order_id = transaction.get("orderID")
-            if order_id:
-                await sync_order_from_oanda(order_id, db)
-                
-        elif event_type == "TRADE_CLOSE":
-            # 交易平仓
-            trade_id = transaction.get("tradeID")
-            if trade_id:
-                # 更新交易为已平仓
-                stmt = select(Trade).where(Trade.oanda_trade_id == trade_id)
-                result = await db.execute(stmt)
-                trade = result.scalar_one_or_none()
-                
-                if trade:
-                    trade.status = "closed"
-                    trade.exit_price = float(transaction.get("price", 0))
-                    trade.realized_pl = float(transaction.get("realizedPL", 0))
-                    trade.financing = float(transaction.get("financing", 0))
-                    trade.commission = float(transaction.get("commission", 0))
-                    trade.close_time = datetime.utcnow()
-                    trade.close_reason = transaction.get("reason", "")
-                    trade.updated_at = datetime.utcnow()
-                    await db.commit()
-                    logger.info(f"交易 {trade_id} 已平仓")
+        # 完整内容只在 DEBUG 级别输出，且只在启用时才格式化
+        logger.info("收到 OANDA Webhook: type=%s transaction=%s", event_type, transaction_id)
+        logger.debug("Webhook 内容: %s", body)
         
-        # 每次有变动都同步账户摘要
-        await sync_account_summary(db)
+        inbox_id = await enqueue_webhook_event(db, body)
+        if inbox_id is None:
+            # 数据库判定为重复（其他进程或重启前已接收）
+            transaction_dedup.record_db_duplicate(transaction_id)
+            webhook_events.inc(event_type, "duplicate")
+            return {"status": "duplicate", "message": "重复事件已忽略", "transaction_id": transaction_id}
         
-        return {"status": "success", "message": "Webhook 处理成功"}
+        transaction_dedup.remember(transaction_id)
+        webhook_events.inc(event_type, "accepted")
+        return {"status": "accepted", "message": "Webhook 已接收", "inbox_id": inbox_id}
         
     except Exception as e:
-        logger.error(f"Webhook 处理失败: {e}")
+        webhook_events.inc(event_type, "error")
+        logger.error(f"Webhook 入队失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stats")
+async def get_webhook_stats():
+    """Webhook 接收与去重计数（进程内，重启后清零）"""
+    return transaction_dedup.stats()
+
+
+@router.get("/inbox")
+async def get_inbox_stats(db: AsyncSession = Depends(get_db)):
+    """收件箱积压情况（pending / processing / dead 数量）"""
+    return await inbox_stats(db)
+
+
+@router.post("/inbox/{event_id}/retry")
+async def retry_inbox_event(event_id: int, db: AsyncSession = Depends(get_db)):
+    """把死信事件重新入队"""
+    if not await retry_dead_event(db, event_id):
+        raise HTTPException(status_code=404, detail="死信事件不存在")
+    return {"status": "success", "message": "事件已重新入队"}
+
+
 @router.post("/sync/account")
-async def manual_sync_account(db: AsyncSession = Depends(get_db)):
-    """手动触发账户摘要同步"""
+async def manual_sync_account(account_id: Optional[str] = Query(None, description="不指定时同步全部账户")):
+    """手动触发账户摘要同步（立即执行，不参与合并）"""
     try:
-        await sync_account_summary(db)
-        return {"status": "success", "message": "账户摘要同步成功"}
+        if account_id:
+            await account_refresher(get_oanda_client(account_id).account_id).refresh_now()
+            return {"status": "success", "message": "账户摘要同步成功"}
+        results = await for_each_account(lambda account: account_refresher(account).refresh_now())
+        errors = {account: r["error"] for account, r in results.items() if "error" in r}
+        return {"status": "success", "message": "账户摘要同步完成", "accounts": len(results), "errors": errors}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"同步失败: {str(e)}")
 
+
+@router.post("/sync/transactions")
+async def manual_sync_transactions(account_id: Optional[str] = Query(None, description="不指定时同步全部账户")):
+    """手动触发增量同步：从 last_transaction_id 拉取之后的全部交易记录"""
+    try:
+        result = await transaction_syncer.run_once(account_id)
+        return {"status": "success", "message": "增量同步完成", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"增量同步失败: {str(e)}")
+
+
+async def _reconcile(account_id: str) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as db:
+        report = await reconcile_account(db, account_id)
+    if report["inserted"] or report["updated"]:
+        price_streamer.notify_trades_changed()
+    return report
+
+
+@router.post("/sync/reconcile")
+async def manual_reconcile(account_id: Optional[str] = Query(None, description="不指定时对账全部账户")):
+    """
+    全账户对账：一次拉取 OANDA 全部持仓和挂单，与数据库比对后单事务批量写入
+    孤立行（数据库中 open / pending 但 OANDA 已不存在）只报告，不修改，由增量同步处理平仓
+    不指定账户时各账户并发对账（受 ACCOUNT_SYNC_CONCURRENCY 限制）
+    """
+    try:
+        if account_id:
+            report = await _reconcile(get_oanda_client(account_id).account_id)
+            return {"status": "success", "message": "对账完成", **report}
+        results = await for_each_account(_reconcile)
+        return {
+            "status": "success",
+            "message": "对账完成",
+            "accounts": {account: r["result"] for account, r in results.items() if "result" in r},
+            "errors": {account: r["error"] for account, r in results.items() if "error" in r}
+        }
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"对账失败: {str(e)}")
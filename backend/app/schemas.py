@@ -38,7 +38,14 @@ class PositionList(BaseModel):
     class Config:
         from_attributes = True
 
-# 订单详情响应（完整数据，包含大文本）
+# AI 分析报告引用（报告内容通过 /api/trades/{intent_id}/article 单独获取）
+class ArticleRef(BaseModel):
+    url: str  # Markdown 原文，带版本号，可长期缓存
+    html_url: str  # 渲染后的 HTML
+    version: str  # 内容哈希
+    length: int  # 字符数
+
+# 订单详情响应（完整数据，报告只返回引用）
 class OrderDetail(BaseModel):
     id: int
     intent_id: str
@@ -52,7 +59,7 @@ class OrderDetail(BaseModel):
     stop_loss: Optional[float] = None
     take_profit: Optional[float] = None
     status: str
-    ai_article: Optional[str] = None  # Markdown 分析报告
+    article: Optional[ArticleRef] = None  # AI 分析报告引用
     analysisJson: Optional[Any] = None
     confidence: Optional[float] = None
     oanda_order_id: Optional[str] = None
@@ -87,6 +94,11 @@ class TradeHistory(BaseModel):
     class Config:
         from_attributes = True
 
+# 历史交易记录分页（游标分页）
+class TradeHistoryPage(BaseModel):
+    items: list[dict]
+    next_cursor: Optional[str] = None  # 为 None 时表示没有更多数据
+
 # ==================== 账户相关 ====================
 
 # 账户摘要
@@ -144,6 +156,35 @@ class EquityCurvePoint(BaseModel):
 class EquityCurveResponse(BaseModel):
     data: list[EquityCurvePoint]
 
+# 信号筛选请求（条件作用于 analysisJson，仅统计已平仓交易）
+class SignalQuery(BaseModel):
+    contains: Optional[dict] = None  # 包含匹配：{"timeframe": "H1", "setup": {"type": "breakout"}}
+    exists: list[str] = Field(default_factory=list, max_length=10)  # jsonpath 存在匹配：'$.indicators ? (@.rsi < 30)'
+    match: list[str] = Field(default_factory=list, max_length=10)  # jsonpath 谓词：'$.confidence > 0.7'
+    group_by: Optional[str] = None  # 分组字段路径：'timeframe'、'setup.type'
+    max_groups: int = Field(50, ge=1, le=500)
+    account_id: Optional[str] = None  # 不指定时为默认账户
+
+# 信号筛选的汇总统计
+class SignalStats(BaseModel):
+    total_trades: int
+    winning_trades: int
+    losing_trades: int
+    long_trades: int
+    short_trades: int
+    win_rate: float
+    total_pl: float
+    avg_pl: float
+    profit_factor: float
+    avg_holding_hours: float
+
+class SignalGroupStats(SignalStats):
+    key: Optional[str] = None  # 分组字段的值，字段缺失时为 null
+
+class SignalStatsResponse(BaseModel):
+    total: SignalStats
+    groups: list[SignalGroupStats] = []
+
 # ==================== Webhook 相关 ====================
 
 # OANDA Webhook 请求
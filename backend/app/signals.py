@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Float, and_, cast, func, literal, select
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
+from sqlalchemy.sql import Select
+from app.models import Trade, status_is
+from app.trade_stats import effective_pl_expr
+
+# 按 analysisJson 中的信号筛选已平仓交易并汇总，全部在数据库端完成
+# 条件均为 jsonb_path_ops 支持的运算符（@> / @? / @@），可以走 idx_trades_analysis
+
+
+def json_path(key: str) -> List[str]:
+    """"setup.type" -> ["setup", "type"]"""
+    parts = key.split(".")
+    if not all(parts):
+        raise ValueError(f"无效的字段路径: {key}")
+    return parts
+
+
+def signal_filters(
+    contains: Optional[Dict[str, Any]],
+    exists: List[str],
+    match: List[str]
+) -> list:
+    """
+    - contains：analysisJson @> contains，如 {"timeframe": "H1"}
+    - exists：analysisJson @? jsonpath，路径有结果即匹配，如 $.indicators ? (@.rsi < 30)
+    - match：analysisJson @@ jsonpath 谓词，如 $.confidence > 0.7
+    """
+    filters = [status_is(Trade.status, "closed")]
+    if contains:
+        filters.append(Trade.analysisJson.op("@>")(cast(contains, JSONB)))
+    for path in exists:
+        filters.append(Trade.analysisJson.op("@?")(cast(literal(path), JSONPATH)))
+    for predicate in match:
+        filters.append(Trade.analysisJson.op("@@")(cast(literal(predicate), JSONPATH)))
+    return filters
+
+
+def _stats_columns(t) -> tuple:
+    """与 AccountStats 口径一致的汇总列"""
+    return (
+        func.count().label("total_trades"),
+        func.count().filter(t.c.pl > 0).label("winning_trades"),
+        func.count().filter(t.c.pl < 0).label("losing_trades"),
+        func.count().filter(t.c.direction == "long").label("long_trades"),
+        func.count().filter(t.c.direction == "short").label("short_trades"),
+        func.coalesce(func.sum(t.c.pl), 0).label("total_pl"),
+        func.coalesce(func.sum(t.c.pl).filter(t.c.pl > 0), 0).label("gross_profit"),
+        func.coalesce(-func.sum(t.c.pl).filter(t.c.pl < 0), 0).label("gross_loss"),
+        cast(func.avg(t.c.hours), Float).label("avg_holding_hours"),
+    )
+
+
+def signal_stats_stmt(filters: list, group_by: Optional[str] = None, max_groups: int = 50) -> Select:
+    """
+    汇总语句：子查询先按条件筛出交易并计算每笔盈亏、持仓时间（只取所需的列和字段），外层聚合
+    指定 group_by 时按该字段的文本值分组，按交易数降序取前 max_groups 组
+    """
+    hours = func.extract("epoch", func.timezone("UTC", Trade.close_time) - Trade.created_at) / 3600
+    columns = [
+        effective_pl_expr().label("pl"),
+        func.coalesce(Trade.direction, "long").label("direction"),
+        func.greatest(hours, 0).label("hours"),
+    ]
+    if group_by is not None:
+        columns.append(Trade.analysisJson[json_path(group_by)].astext.label("key"))
+    matched = select(*columns).where(and_(*filters)).subquery("matched")
+    
+    if group_by is None:
+        return select(*_stats_columns(matched))
+    return select(matched.c.key, *_stats_columns(matched)).group_by(matched.c.key).order_by(
+        func.count().desc(), matched.c.key
+    ).limit(max_groups)
+
+
+def summarize(row) -> Dict[str, Any]:
+    """汇总行 -> 响应字典，比率在 Python 端计算（除零时为 0）"""
+    total = row.total_trades or 0
+    gross_profit = float(row.gross_profit or 0)
+    gross_loss = float(row.gross_loss or 0)
+    return {
+        "total_trades": total,
+        "winning_trades": row.winning_trades or 0,
+        "losing_trades": row.losing_trades or 0,
+        "long_trades": row.long_trades or 0,
+        "short_trades": row.short_trades or 0,
+        "win_rate": round(row.winning_trades / total * 100, 2) if total else 0.0,
+        "total_pl": round(float(row.total_pl or 0), 2),
+        "avg_pl": round(float(row.total_pl or 0) / total, 2) if total else 0.0,
+        "profit_factor": round(gross_profit / gross_loss, 2) if gross_loss > 0 else 0.0,
+        "avg_holding_hours": round(row.avg_holding_hours or 0.0, 2),
+    }
@@ -0,0 +1,275 @@
+import asyncio
+import sys
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import select, func, case, and_, cast, Float
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.accounts import account_clause, resolve_account_id
+from app.database import AsyncSessionLocal
+from app.models import Trade, AccountSummary, TradeStats, status_is
+
+logger = logging.getLogger(__name__)
+
+# 没有账户摘要时使用的默认起始资金（与收益曲线一致）
+DEFAULT_STARTING_BALANCE = 100000.0
+
+
+def safe_float(value, default=0.0) -> float:
+    """安全转换为 float，NULL 返回默认值"""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def effective_pl(realized_pl, entry_price, exit_price, units, direction) -> float:
+    """已实现盈亏；realized_pl 为 NULL 或 0 时用入场价和出场价估算"""
+    pl = safe_float(realized_pl, 0.0)
+    if pl == 0.0 and entry_price and exit_price:
+        entry_price = safe_float(entry_price, 0.0)
+        exit_price = safe_float(exit_price, 0.0)
+        units = safe_float(units, 0.0)
+        if (direction or "long") == "long":
+            pl = (exit_price - entry_price) * units
+        else:
+            pl = (entry_price - exit_price) * units
+    return pl
+
+
+def effective_pl_expr():
+    """effective_pl 的 SQL 版本，用于在数据库端汇总"""
+    realized = cast(func.coalesce(Trade.realized_pl, 0), Float)
+    entry = func.coalesce(Trade.entry_price, 0)
+    exit_ = func.coalesce(Trade.exit_price, 0)
+    units = func.coalesce(Trade.units, 0)
+    estimated = case(
+        (func.coalesce(Trade.direction, "long") == "long", (exit_ - entry) * units),
+        else_=(entry - exit_) * units
+    )
+    return case(
+        (and_(realized == 0, entry != 0, exit_ != 0), estimated),
+        else_=realized
+    )
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """有时区的时间转换为无时区 UTC，便于与 created_at 比较"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def holding_hours(created_at: Optional[datetime], close_time: Optional[datetime]) -> float:
+    """持仓时间（小时），created_at 无时区、close_time 有时区，统一按 UTC 计算"""
+    if not created_at or not close_time:
+        return 0.0
+    close_time = _utc_naive(close_time)
+    created_at = _utc_naive(created_at)
+    return max((close_time - created_at).total_seconds() / 3600, 0.0)
+
+
+def _reset(stats: TradeStats, starting_balance: float):
+    stats.starting_balance = starting_balance
+    stats.total_trades = 0
+    stats.winning_trades = 0
+    stats.losing_trades = 0
+    stats.total_profit = 0.0
+    stats.total_loss = 0.0
+    stats.long_total = 0
+    stats.long_wins = 0
+    stats.short_total = 0
+    stats.short_wins = 0
+    stats.cumulative_profit = 0.0
+    stats.peak_equity = starting_balance
+    stats.max_drawdown = 0.0
+    stats.current_win_streak = 0
+    stats.current_loss_streak = 0
+    stats.max_win_streak = 0
+    stats.max_loss_streak = 0
+    stats.total_holding_hours = 0.0
+
+
+def apply_trade(stats: TradeStats, pl: float, direction: Optional[str], hours: float):
+    """把一笔平仓交易计入聚合（按平仓顺序调用）"""
+    stats.total_trades += 1
+
+    if (direction or "long") == "long":
+        stats.long_total += 1
+        if pl > 0:
+            stats.long_wins += 1
+    else:
+        stats.short_total += 1
+        if pl > 0:
+            stats.short_wins += 1
+
+    # 回撤：权益 = 起始资金 + 累计盈亏
+    stats.cumulative_profit += pl
+    equity = stats.starting_balance + stats.cumulative_profit
+    if equity > stats.peak_equity:
+        stats.peak_equity = equity
+    drawdown = (stats.peak_equity - equity) / stats.peak_equity * 100 if stats.peak_equity > 0 else 0
+    if drawdown > stats.max_drawdown:
+        stats.max_drawdown = drawdown
+
+    # 盈亏与连胜 / 连亏
+    if pl > 0:
+        stats.winning_trades += 1
+        stats.total_profit += pl
+        stats.current_win_streak += 1
+        stats.current_loss_streak = 0
+        stats.max_win_streak = max(stats.max_win_streak, stats.current_win_streak)
+    elif pl < 0:
+        stats.losing_trades += 1
+        stats.total_loss += abs(pl)
+        stats.current_loss_streak += 1
+        stats.current_win_streak = 0
+        stats.max_loss_streak = max(stats.max_loss_streak, stats.current_loss_streak)
+
+    stats.total_holding_hours += hours
+    stats.updated_at = datetime.utcnow()
+
+
+async def _starting_balance(db: AsyncSession, account_id: str, cumulative_profit: float = 0.0) -> float:
+    """起始资金 = 当前余额 - 已实现累计盈亏"""
+    result = await db.execute(
+        select(AccountSummary.balance).where(AccountSummary.account_id == account_id)
+    )
+    balance = result.scalar_one_or_none()
+    if balance is None:
+        return DEFAULT_STARTING_BALANCE
+    return safe_float(balance) - cumulative_profit
+
+
+async def record_closed_trade(db: AsyncSession, trade: Trade, account_id: Optional[str] = None):
+    """
+    交易平仓时调用（trade 已标记为 closed），与平仓写入处于同一事务（由调用方 commit）
+    使用行锁避免并发平仓互相覆盖
+    """
+    await record_closed_trades(db, [trade], account_id)
+
+
+async def _lock_stats_row(db: AsyncSession, account_id: str) -> Tuple[TradeStats, bool]:
+    """
+    取得该账户聚合行的行锁，不存在时先插入空行；返回 (行, 是否本事务新建)
+    INSERT ... ON CONFLICT DO NOTHING：并发的首次写入不会主键冲突，
+    后到的一方等待先建行的事务提交后直接锁定该行
+    """
+    result = await db.execute(
+        insert(TradeStats)
+        .values(account_id=account_id)
+        .on_conflict_do_nothing(index_elements=["account_id"])
+        .returning(TradeStats.account_id)
+    )
+    created = result.scalar_one_or_none() is not None
+    result = await db.execute(
+        select(TradeStats)
+        .where(TradeStats.account_id == account_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one(), created
+
+
+def _copy_stats(target: TradeStats, source: TradeStats):
+    for column in TradeStats.__table__.columns:
+        if not column.primary_key:
+            setattr(target, column.key, getattr(source, column.key))
+
+
+async def record_closed_trades(db: AsyncSession, trades: List[Trade], account_id: Optional[str] = None):
+    """批量版本：整批只加一次行锁，按平仓时间顺序计入（trades 须属于同一账户）"""
+    if not trades:
+        return
+    account_id = resolve_account_id(account_id)
+    await db.flush()
+    stats, created = await _lock_stats_row(db, account_id)
+    if created:
+        # 聚合尚未建立：连同本批交易（已 flush）全量计算一次
+        _copy_stats(stats, await compute_trade_stats(db, account_id))
+        return
+
+    for trade in sorted(trades, key=lambda t: (_utc_naive(t.close_time) or datetime.max, t.id)):
+        apply_trade(
+            stats,
+            effective_pl(trade.realized_pl, trade.entry_price, trade.exit_price, trade.units, trade.direction),
+            trade.direction,
+            holding_hours(trade.created_at, trade.close_time)
+        )
+
+
+async def compute_trade_stats(db: AsyncSession, account_id: Optional[str] = None) -> TradeStats:
+    """按平仓时间顺序流式读取该账户全部已平仓交易，从头计算聚合（不写入）"""
+    account_id = resolve_account_id(account_id)
+    closed = and_(status_is(Trade.status, "closed"), account_clause(account_id))
+
+    # 起始资金依赖累计盈亏，先在数据库端汇总
+    total_pl = await db.scalar(select(func.coalesce(func.sum(effective_pl_expr()), 0)).where(closed))
+    stats = TradeStats(account_id=account_id)
+    _reset(stats, await _starting_balance(db, account_id, safe_float(total_pl)))
+
+    stmt = select(
+        Trade.realized_pl,
+        Trade.entry_price,
+        Trade.exit_price,
+        Trade.units,
+        Trade.direction,
+        Trade.created_at,
+        Trade.close_time
+    ).where(closed).order_by(Trade.close_time.asc().nulls_last(), Trade.id)
+
+    result = await db.stream(stmt)
+    async for row in result:
+        apply_trade(
+            stats,
+            effective_pl(row.realized_pl, row.entry_price, row.exit_price, row.units, row.direction),
+            row.direction,
+            holding_hours(row.created_at, row.close_time)
+        )
+    stats.updated_at = datetime.utcnow()
+    return stats
+
+
+async def rebuild_trade_stats(db: AsyncSession, account_id: Optional[str] = None) -> TradeStats:
+    """重新计算聚合并覆盖写入（持有聚合行的行锁，与并发的重建、平仓串行）"""
+    account_id = resolve_account_id(account_id)
+    stats, _ = await _lock_stats_row(db, account_id)
+    _copy_stats(stats, await compute_trade_stats(db, account_id))
+    await db.commit()
+    logger.info(f"交易统计已重建: {stats.total_trades} 笔")
+    return stats
+
+
+async def get_trade_stats(db: AsyncSession, account_id: Optional[str] = None) -> TradeStats:
+    """读取聚合结果，不存在时先在主库重建（db 可以是只读会话）"""
+    account_id = resolve_account_id(account_id)
+    result = await db.execute(select(TradeStats).where(TradeStats.account_id == account_id))
+    stats = result.scalar_one_or_none()
+    if stats is None:
+        async with AsyncSessionLocal() as write_db:
+            stats = await rebuild_trade_stats(write_db, account_id)
+    return stats
+
+
+async def _main(command: str):
+    """命令行重建全部账户的聚合：python -m app.trade_stats rebuild"""
+    from app.oanda import close_oanda_client, init_oanda_client, oanda_clients
+
+    if command != "rebuild":
+        print("用法: python -m app.trade_stats rebuild")
+        sys.exit(1)
+    await init_oanda_client()
+    try:
+        for account_id in oanda_clients.account_ids() or [None]:
+            async with AsyncSessionLocal() as db:
+                stats = await rebuild_trade_stats(db, account_id)
+                print(f"账户 {stats.account_id} 交易统计已重建: {stats.total_trades} 笔已平仓交易")
+    finally:
+        await close_oanda_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else ""))
@@ -0,0 +1,325 @@
+import asyncio
+import os
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.models import Trade, AccountSummary, status_is
+from app.accounts import account_clause, for_each_account
+from app.oanda import get_oanda_client, oanda_clients
+from app.response_cache import bump_version
+from app.trade_stats import record_closed_trades
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_SYNC_ENABLED = os.getenv("TRANSACTION_SYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSACTION_SYNC_INTERVAL = float(os.getenv("TRANSACTION_SYNC_INTERVAL", "30"))  # 后台增量同步间隔（秒）
+TRANSACTION_SYNC_BATCH_SIZE = int(os.getenv("TRANSACTION_SYNC_BATCH_SIZE", "500"))  # 每个数据库事务处理的交易记录数
+
+
+def safe_float(value, default=None):
+    """安全转换为 float"""
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def parse_oanda_time(value: Optional[str]) -> Optional[datetime]:
+    """解析 OANDA RFC3339 时间（纳秒精度，截断到微秒）"""
+    if not value:
+        return None
+    try:
+        value = value.replace("Z", "")
+        if "." in value:
+            seconds, fraction = value.split(".", 1)
+            value = f"{seconds}.{fraction[:6]}"
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _transaction_key(transaction: Dict[str, Any]) -> int:
+    return int(transaction.get("id", 0))
+
+
+def collect_changes(transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    把一批交易记录归并为三类变更（同一订单 / 交易以最后一条为准）
+    - opens：订单成交开仓，按 oanda_order_id
+    - closes：交易平仓（ORDER_FILL.tradesClosed 与 TRADE_CLOSE），按 oanda_trade_id
+    - cancels：订单取消，按 oanda_order_id
+    """
+    opens: Dict[str, Dict[str, Any]] = {}
+    closes: Dict[str, Dict[str, Any]] = {}
+    cancels: Set[str] = set()
+
+    for transaction in transactions:
+        kind = transaction.get("type")
+        at = parse_oanda_time(transaction.get("time"))
+
+        if kind == "ORDER_FILL":
+            opened = transaction.get("tradeOpened") or {}
+            order_id = transaction.get("orderID")
+            if order_id and opened.get("tradeID"):
+                opens[order_id] = {
+                    "b_order_id": order_id,
+                    "b_trade_id": opened["tradeID"],
+                    "b_entry_price": safe_float(opened.get("price"), safe_float(transaction.get("price"))),
+                }
+            for closed in transaction.get("tradesClosed") or []:
+                if closed.get("tradeID"):
+                    closes[closed["tradeID"]] = {
+                        "exit_price": safe_float(closed.get("price"), safe_float(transaction.get("price"))),
+                        "realized_pl": safe_float(closed.get("realizedPL"), 0.0),
+                        "financing": safe_float(closed.get("financing"), 0.0),
+                        "commission": safe_float(transaction.get("commission"), 0.0),
+                        "close_time": at,
+                        "close_reason": transaction.get("reason", ""),
+                    }
+
+        elif kind == "TRADE_CLOSE":
+            trade_id = transaction.get("tradeID")
+            if trade_id:
+                closes[trade_id] = {
+                    "exit_price": safe_float(transaction.get("price")),
+                    "realized_pl": safe_float(transaction.get("realizedPL"), 0.0),
+                    "financing": safe_float(transaction.get("financing"), 0.0),
+                    "commission": safe_float(transaction.get("commission"), 0.0),
+                    "close_time": at,
+                    "close_reason": transaction.get("reason", ""),
+                }
+
+        elif kind == "ORDER_CANCEL":
+            order_id = transaction.get("orderID")
+            if order_id:
+                cancels.add(order_id)
+
+    return {"opens": opens, "closes": closes, "cancels": cancels}
+
+
+async def apply_transactions(
+    db: AsyncSession,
+    account_id: str,
+    transactions: List[Dict[str, Any]],
+) -> Dict[str, int]:
+    """
+    在一个数据库事务中批量应用一批交易记录并推进游标
+    - OANDA 的订单 / 交易 ID 只在账户内唯一，所有更新都限定在该账户
+    - 只做状态前进（pending -> open / cancelled，open -> closed），重复应用无副作用
+    """
+    changes = collect_changes(transactions)
+    now = datetime.utcnow()
+    applied = {"opened": 0, "closed": 0, "cancelled": 0}
+
+    # 开仓：executemany，一条语句按订单 ID 批量更新
+    if changes["opens"]:
+        stmt = (
+            update(Trade.__table__)
+            .where(
+                Trade.oanda_order_id == bindparam("b_order_id"),
+                status_is(Trade.status, "pending"),
+                account_clause(account_id)
+            )
+            .values(
+                status="open",
+                oanda_trade_id=bindparam("b_trade_id"),
+                entry_price=bindparam("b_entry_price"),
+                updated_at=now,
+            )
+        )
+        result = await db.execute(stmt, list(changes["opens"].values()))
+        applied["opened"] = max(result.rowcount, 0)
+
+    # 平仓：一次查询取出尚未平仓的交易，修改后由 flush 批量写回，并整批计入统计
+    # 行锁（按 id 顺序加锁）防止 Webhook 同时平仓同一笔交易重复计入统计：
+    # 等锁的一方在对方提交后重新检查 status，已平仓的行不再返回
+    if changes["closes"]:
+        result = await db.execute(
+            select(Trade).where(
+                Trade.oanda_trade_id.in_(list(changes["closes"])),
+                Trade.status != "closed",
+                account_clause(account_id)
+            ).order_by(Trade.id).with_for_update().execution_options(populate_existing=True)
+        )
+        closed_trades = list(result.scalars().all())
+        for trade in closed_trades:
+            close = changes["closes"][trade.oanda_trade_id]
+            trade.status = "closed"
+            if close["exit_price"] is not None:
+                trade.exit_price = close["exit_price"]
+            trade.realized_pl = close["realized_pl"]
+            trade.financing = close["financing"]
+            trade.commission = close["commission"]
+            trade.close_time = close["close_time"] or now
+            trade.close_reason = close["close_reason"]
+            trade.updated_at = now
+        await record_closed_trades(db, closed_trades, account_id)
+        applied["closed"] = len(closed_trades)
+
+    # 撤单：只影响仍在挂单的订单
+    if changes["cancels"]:
+        result = await db.execute(
+            update(Trade.__table__)
+            .where(
+                Trade.oanda_order_id.in_(list(changes["cancels"])),
+                status_is(Trade.status, "pending"),
+                account_clause(account_id)
+            )
+            .values(status="cancelled", updated_at=now)
+        )
+        applied["cancelled"] = max(result.rowcount, 0)
+
+    # 推进游标，与本批变更同一事务提交
+    last_id = str(max(_transaction_key(t) for t in transactions))
+    await db.execute(
+        insert(AccountSummary)
+        .values(account_id=account_id, last_transaction_id=last_id, updated_at=now)
+        .on_conflict_do_update(
+            index_elements=["account_id"],
+            set_={"last_transaction_id": last_id}
+        )
+    )
+    await db.commit()
+    if any(applied.values()):
+        bump_version("trades")
+    return applied
+
+
+async def _load_cursor(db: AsyncSession, account_id: str) -> Optional[str]:
+    result = await db.execute(
+        select(AccountSummary.last_transaction_id).where(AccountSummary.account_id == account_id)
+    )
+    return result.scalar_one_or_none() or None
+
+
+async def sync_transactions(db: AsyncSession, account_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    从 last_transaction_id 增量同步一个账户（未指定时为默认账户）：调用 transactions/sinceid，按批应用
+    没有游标时以账户当前的 lastTransactionID 为起点（历史数据仍由 N8N 负责）
+    """
+    started = time.perf_counter()
+    client = get_oanda_client(account_id)
+    account_id = client.account_id
+    totals = {"transactions": 0, "batches": 0, "opened": 0, "closed": 0, "cancelled": 0}
+
+    cursor = await _load_cursor(db, account_id)
+    if cursor is None:
+        response = await client.get("/summary")
+        response.raise_for_status()
+        cursor = response.json().get("account", {}).get("lastTransactionID")
+        if cursor:
+            await db.execute(
+                insert(AccountSummary)
+                .values(account_id=account_id, last_transaction_id=cursor)
+                .on_conflict_do_update(index_elements=["account_id"], set_={"last_transaction_id": cursor})
+            )
+            await db.commit()
+        logger.info(f"交易流游标初始化为 {cursor}")
+        return {**totals, "last_transaction_id": cursor, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    while True:
+        response = await client.get("/transactions/sinceid", params={"id": cursor})
+        response.raise_for_status()
+        transactions = sorted(response.json().get("transactions", []), key=_transaction_key)
+        if not transactions:
+            break
+
+        for i in range(0, len(transactions), TRANSACTION_SYNC_BATCH_SIZE):
+            batch = transactions[i:i + TRANSACTION_SYNC_BATCH_SIZE]
+            applied = await apply_transactions(db, account_id, batch)
+            totals["batches"] += 1
+            totals["transactions"] += len(batch)
+            for key, count in applied.items():
+                totals[key] += count
+            cursor = str(_transaction_key(batch[-1]))
+
+    totals["last_transaction_id"] = cursor
+    totals["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if totals["transactions"]:
+        logger.info(f"增量同步完成: {totals}")
+    return totals
+
+
+SYNC_COUNTERS = ("transactions", "batches", "opened", "closed", "cancelled")
+
+
+class TransactionSyncer:
+    """
+    后台定期增量同步全部账户
+    - 账户之间并发执行，全局并发数受 ACCOUNT_SYNC_CONCURRENCY 限制
+    - 同一账户不会并发同步（手动触发与定时任务共用该账户的锁）
+    - 账户有交易变动时调用 on_change(account_id)（刷新价格流订阅、账户摘要等）
+    """
+
+    def __init__(self, on_change: Optional[Callable[[str], None]] = None, interval: float = TRANSACTION_SYNC_INTERVAL):
+        self.on_change = on_change
+        self.interval = interval
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if TRANSACTION_SYNC_ENABLED and oanda_clients.account_ids() and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sync_account(self, account_id: str) -> Dict[str, Any]:
+        """同步一个账户，异常向上抛出"""
+        lock = self._locks.setdefault(account_id, asyncio.Lock())
+        async with lock:
+            async with AsyncSessionLocal() as db:
+                result = await sync_transactions(db, account_id)
+        if self.on_change and result["opened"] + result["closed"] + result["cancelled"]:
+            self.on_change(account_id)
+        return result
+
+    async def run_once(self, account_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        指定账户时只同步该账户（异常向上抛出）
+        否则并发同步全部账户，返回合计和各账户结果，失败的账户记录在 errors 中
+        """
+        if account_id:
+            return await self.sync_account(get_oanda_client(account_id).account_id)
+
+        started = time.perf_counter()
+        outcomes = await for_each_account(self.sync_account)
+        result: Dict[str, Any] = {key: 0 for key in SYNC_COUNTERS}
+        result["accounts"] = {}
+        result["errors"] = {}
+        for account, outcome in outcomes.items():
+            if "error" in outcome:
+                result["errors"][account] = outcome["error"]
+                continue
+            result["accounts"][account] = outcome["result"]
+            for key in SYNC_COUNTERS:
+                result[key] += outcome["result"][key]
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.last_result = result
+        return result
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"增量同步失败: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,75 @@
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 进程内记住的最近交易 ID 数量
+WEBHOOK_DEDUP_CACHE_SIZE = int(os.getenv("WEBHOOK_DEDUP_CACHE_SIZE", "10000"))
+# processed_transactions 表的保留时间（小时），应覆盖 OANDA / N8N 的重投窗口
+WEBHOOK_DEDUP_RETENTION_HOURS = float(os.getenv("WEBHOOK_DEDUP_RETENTION_HOURS", "168"))
+
+
+def transaction_id_for(body: Dict[str, Any]) -> Optional[str]:
+    """
+    OANDA 交易 ID（transaction.id），没有时返回 None（不参与去重）
+    交易 ID 只在账户内唯一，带 accountID 的事件以 "{accountID}:{id}" 作为去重键
+    """
+    transaction = body.get("transaction") or {}
+    transaction_id = transaction.get("id")
+    if not transaction_id:
+        return None
+    account_id = body.get("accountID") or transaction.get("accountID")
+    return f"{account_id}:{transaction_id}" if account_id else str(transaction_id)
+
+
+class TransactionDeduplicator:
+    """
+    Webhook 去重的内存前端
+    - 最近见过的交易 ID 保存在 LRU 中，重复投递在入库前直接丢弃
+    - LRU 未命中时由 processed_transactions 表的唯一约束兜底（跨进程 / 重启后仍有效）
+    """
+
+    def __init__(self, max_size: int = WEBHOOK_DEDUP_CACHE_SIZE):
+        self.max_size = max_size
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.received = 0
+        self.duplicates_memory = 0
+        self.duplicates_db = 0
+
+    def seen(self, transaction_id: Optional[str]) -> bool:
+        """记一次接收；内存中已存在时返回 True"""
+        self.received += 1
+        if transaction_id is None or transaction_id not in self._seen:
+            return False
+        self._seen.move_to_end(transaction_id)
+        self.duplicates_memory += 1
+        return True
+
+    def remember(self, transaction_id: Optional[str]):
+        if transaction_id is None:
+            return
+        self._seen[transaction_id] = None
+        self._seen.move_to_end(transaction_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def record_db_duplicate(self, transaction_id: Optional[str]):
+        """数据库唯一约束判定为重复（其他进程或重启前已接收）"""
+        self.duplicates_db += 1
+        self.remember(transaction_id)
+
+    def stats(self) -> Dict[str, float]:
+        duplicates = self.duplicates_memory + self.duplicates_db
+        return {
+            "received": self.received,
+            "duplicates": duplicates,
+            "duplicates_memory": self.duplicates_memory,
+            "duplicates_db": self.duplicates_db,
+            "duplicate_rate": round(duplicates / self.received, 4) if self.received else 0.0,
+            "cache_size": len(self._seen),
+        }
+
+
+transaction_dedup = TransactionDeduplicator()
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import logging
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, func, exists
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.models import WebhookInbox, ProcessedTransaction, status_is
+from app.webhook_dedup import WEBHOOK_DEDUP_RETENTION_HOURS, transaction_id_for
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_RETRY_BASE = float(os.getenv("WEBHOOK_RETRY_BASE", "2"))  # 重试间隔基数（秒），按 2^n 递增
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "1"))  # 空闲时轮询收件箱的间隔
+WEBHOOK_INBOX_RETENTION_HOURS = float(os.getenv("WEBHOOK_INBOX_RETENTION_HOURS", "72"))  # 已完成事件的保留时间
+
+EventHandler = Callable[[Dict[str, Any], AsyncSession], Awaitable[None]]
+
+# 新事件入队后唤醒 worker
+_wakeup = asyncio.Event()
+
+
+def trade_key_for(body: Dict[str, Any]) -> str:
+    """
+    顺序键：优先使用交易 ID，其次订单 ID；同一键的事件严格按入队顺序处理
+    OANDA ID 只在账户内唯一，带 accountID 的事件在键前加上账户
+    """
+    transaction = body.get("transaction") or {}
+    account_id = body.get("accountID") or transaction.get("accountID")
+    prefix = f"{account_id}:" if account_id else ""
+    trade_id = transaction.get("tradeID") or (transaction.get("tradeOpened") or {}).get("tradeID")
+    if trade_id:
+        return f"{prefix}trade:{trade_id}"
+    order_id = transaction.get("orderID")
+    if order_id:
+        return f"{prefix}order:{order_id}"
+    return f"{prefix}account"
+
+
+async def enqueue_webhook_event(db: AsyncSession, body: Dict[str, Any]) -> Optional[int]:
+    """
+    把原始事件写入收件箱并提交，返回收件箱 ID
+    交易 ID 与收件箱事件在同一事务中写入；交易 ID 已存在（重复投递）时回滚并返回 None
+    """
+    event_type = body.get("type", "")
+    event = WebhookInbox(
+        event_type=event_type,
+        trade_key=trade_key_for(body),
+        payload=body,
+        status="pending",
+        attempts=0
+    )
+    db.add(event)
+
+    transaction_id = transaction_id_for(body)
+    if transaction_id is not None:
+        await db.flush()
+        inserted = await db.scalar(
+            insert(ProcessedTransaction).values(
+                transaction_id=transaction_id,
+                event_type=event_type,
+                inbox_id=event.id
+            ).on_conflict_do_nothing(index_elements=["transaction_id"])
+            .returning(ProcessedTransaction.transaction_id)
+        )
+        if inserted is None:
+            await db.rollback()
+            return None
+
+    await db.commit()
+    _wakeup.set()
+    return event.id
+
+
+async def _claim_next() -> Optional[WebhookInbox]:
+    """
+    领取一条可处理的事件并标记为 processing
+    - SKIP LOCKED：多个 worker 互不阻塞
+    - 同一顺序键存在更早的未完成事件时跳过，保证按交易有序
+    """
+    earlier = aliased(WebhookInbox)
+    async with AsyncSessionLocal() as db:
+        stmt = select(WebhookInbox).where(
+            status_is(WebhookInbox.status, "pending"),
+            WebhookInbox.available_at <= func.now(),
+            ~exists().where(
+                earlier.trade_key == WebhookInbox.trade_key,
+                earlier.id < WebhookInbox.id,
+                status_is(earlier.status, "pending", "processing")
+            )
+        ).order_by(WebhookInbox.id).limit(1).with_for_update(skip_locked=True)
+        result = await db.execute(stmt)
+        event = result.scalar_one_or_none()
+        if event is None:
+            await db.rollback()
+            return None
+        event.status = "processing"
+        event.attempts = (event.attempts or 0) + 1
+        await db.commit()
+        return event
+
+
+async def _finish(event: WebhookInbox, error: Optional[Exception]):
+    """记录处理结果：成功 -> done；失败 -> 退避后重试，超过次数 -> dead"""
+    if error is None:
+        values = {"status": "done", "processed_at": func.now(), "last_error": None}
+    elif event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+        values = {"status": "dead", "processed_at": func.now(), "last_error": repr(error)}
+        logger.error(f"Webhook 事件 {event.id} 重试 {event.attempts} 次仍失败，转入死信: {error!r}")
+    else:
+        delay = timedelta(seconds=WEBHOOK_RETRY_BASE * 2 ** (event.attempts - 1))
+        values = {"status": "pending", "available_at": func.now() + delay, "last_error": repr(error)}
+        logger.warning(f"Webhook 事件 {event.id} 处理失败（第 {event.attempts} 次），{delay.total_seconds():.0f} 秒后重试: {error!r}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(WebhookInbox).where(WebhookInbox.id == event.id).values(**values))
+        await db.commit()
+
+
+class InboxWorkerPool:
+    """后台 worker 池：持续领取收件箱事件并调用 handler 处理"""
+
+    def __init__(self, handler: EventHandler, workers: int = WEBHOOK_WORKERS):
+        self.handler = handler
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _recover(self):
+        """进程异常退出时遗留的 processing 事件重新入队"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(WebhookInbox).where(status_is(WebhookInbox.status, "processing")).values(status="pending")
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"恢复收件箱失败: {e}")
+
+    async def _purge_loop(self):
+        """定期清理超过保留时间的已完成事件和去重记录"""
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        delete(WebhookInbox).where(
+                            status_is(WebhookInbox.status, "done"),
+                            WebhookInbox.processed_at < func.now() - timedelta(hours=WEBHOOK_INBOX_RETENTION_HOURS)
+                        )
+                    )
+                    await db.execute(
+                        delete(ProcessedTransaction).where(
+                            ProcessedTransaction.created_at < func.now() - timedelta(hours=WEBHOOK_DEDUP_RETENTION_HOURS)
+                        )
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"清理收件箱失败: {e}")
+            await asyncio.sleep(3600)
+
+    async def _worker(self, n: int):
+        while True:
+            try:
+                event = await _claim_next()
+            except Exception as e:
+                logger.error(f"领取 Webhook 事件失败: {e}")
+                event = None
+
+            if event is None:
+                # 没有可处理的事件：等待新事件入队或轮询超时
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                _wakeup.clear()
+                continue
+
+            error = None
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.handler(event.payload, db)
+            except Exception as e:
+                error = e
+            try:
+                await _finish(event, error)
+            except Exception as e:
+                logger.error(f"更新 Webhook 事件 {event.id} 状态失败: {e}")
+
+
+async def inbox_stats(db: AsyncSession) -> Dict[str, int]:
+    """未完成与死信事件的数量"""
+    result = await db.execute(
+        select(WebhookInbox.status, func.count()).where(
+            status_is(WebhookInbox.status, "pending", "processing", "dead")
+        ).group_by(WebhookInbox.status)
+    )
+    return {status: count for status, count in result.all()}
+
+
+async def retry_dead_event(db: AsyncSession, event_id: int) -> bool:
+    """把死信事件重新入队"""
+    result = await db.execute(
+        update(WebhookInbox).where(
+            WebhookInbox.id == event_id,
+            status_is(WebhookInbox.status, "dead")
+        ).values(status="pending", attempts=0, available_at=func.now())
+    )
+    await db.commit()
+    if result.rowcount:
+        _wakeup.set()
+    return bool(result.rowcount)
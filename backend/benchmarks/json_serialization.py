@@ -0,0 +1,122 @@
+"""
+响应序列化基准：逐点构建 Pydantic 模型 + response_model 校验 + 标准库 json
+vs 直接构建字典 + FastJSONResponse（orjson），并对比 gzip 前后的传输字节数
+
+不依赖数据库，使用与接口相同结构的合成数据。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.json_serialization --points 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import gzip
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.main import GZIP_COMPRESS_LEVEL
+from app.responses import FastJSONResponse
+from app.schemas import EquityCurvePoint, EquityCurveResponse, PositionList, TradeHistoryPage
+
+
+def equity_dicts(n: int):
+    start = datetime(2024, 1, 1)
+    return [
+        {"date": start + timedelta(minutes=i), "cumulative_profit": round(i * 0.37, 2), "balance": round(100000 + i * 0.37, 2)}
+        for i in range(n)
+    ]
+
+
+def history_dicts(n: int):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "id": i, "intent_id": f"intent-{i}", "symbol": "EUR_USD", "direction": "long" if i % 2 else "short",
+            "units": 1000.0, "entry_price": 1.0812, "exit_price": 1.0855, "realized_pl": 4.3,
+            "financing": -0.12, "commission": 0.0, "created_at": start + timedelta(hours=i),
+            "close_time": start + timedelta(hours=i, minutes=30), "close_reason": "TAKE_PROFIT_ORDER"
+        }
+        for i in range(n)
+    ]
+
+
+def position_dicts(n: int):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "id": i, "intent_id": f"intent-{i}", "symbol": "USD_JPY", "direction": "long", "units": 1000.0,
+            "entry_price": 150.12, "stop_loss": 149.5, "take_profit": 151.0, "current_price": 150.4,
+            "unrealized_pl": 280.0, "margin": 3008.0, "created_at": start + timedelta(minutes=i)
+        }
+        for i in range(n)
+    ]
+
+
+async def fastapi_path(model, build: Callable[[], object]) -> bytes:
+    """改造前：构建模型，按 response_model 校验，jsonable_encoder + 标准库 json"""
+    field = create_response_field(name="response", type_=model)
+    content = await serialize_response(field=field, response_content=build())
+    return JSONResponse(content).body
+
+
+async def fast_path(build: Callable[[], object]) -> bytes:
+    """改造后：字典直接交给 FastJSONResponse"""
+    return FastJSONResponse(build()).body
+
+
+async def measure(fn, repeat: int):
+    await fn()
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), body
+
+
+async def run(points: int, history: int, positions: int, repeat: int):
+    cases = [
+        (
+            f"equity-curve ({points} 点)",
+            EquityCurveResponse,
+            lambda: EquityCurveResponse(data=[EquityCurvePoint(**p) for p in equity_dicts(points)]),
+            lambda: {"data": equity_dicts(points)},
+        ),
+        (
+            f"history ({history} 行)",
+            TradeHistoryPage,
+            lambda: TradeHistoryPage(items=history_dicts(history), next_cursor="abc"),
+            lambda: {"items": history_dicts(history), "next_cursor": "abc"},
+        ),
+        (
+            f"positions/open ({positions} 行)",
+            List[PositionList],
+            lambda: [PositionList(**p) for p in position_dicts(positions)],
+            lambda: position_dicts(positions),
+        ),
+    ]
+
+    for name, model, build_models, build_dicts in cases:
+        before_ms, before = await measure(lambda: fastapi_path(model, build_models), repeat)
+        after_ms, after = await measure(lambda: fast_path(build_dicts), repeat)
+        gz = len(gzip.compress(after, compresslevel=GZIP_COMPRESS_LEVEL))
+        print(f"{name}")
+        print(f"  序列化  改造前 {before_ms:8.1f} ms   改造后 {after_ms:8.1f} ms   ({before_ms / after_ms:.1f}x)")
+        print(f"  传输    改造前 {len(before) / 1024:8.0f} KiB  改造后 {gz / 1024:8.0f} KiB  (gzip {GZIP_COMPRESS_LEVEL}, {len(before) / gz:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化与压缩基准")
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--history", type=int, default=500)
+    parser.add_argument("--positions", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.points, args.history, args.positions, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+列表接口读取路径基准：ORM 实例 + Pydantic 模型 vs 按列查询的普通行 + 字典
+
+在一个事务中写入 N 条 open 状态的交易，分别用两种方式完成
+「查询 -> 构建响应 -> 按 response_model 校验并序列化」，结束后回滚，不留数据。
+
+用法（在 backend 目录下，使用 .env 中的 DATABASE_URL）：
+    python -m benchmarks.list_read_path --rows 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import select, insert
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.models import Trade
+from app.queries import open_positions_stmt
+from app.routers.positions import build_position, calculate_unrealized_pl, calculate_margin, safe_float, safe_str
+from app.schemas import PositionList
+
+SYMBOLS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD", "XAU_USD"]
+
+positions_adapter = TypeAdapter(List[PositionList])
+
+
+def _seed_rows(n: int):
+    now = datetime.utcnow()
+    return [
+        {
+            "intent_id": f"bench-list-{i}",
+            "symbol": SYMBOLS[i % len(SYMBOLS)],
+            "direction": "long" if i % 2 else "short",
+            "units": 1000 + i,
+            "entry_price": 1.1 + i * 1e-5,
+            "current_price": 1.1,
+            "stop_loss": 1.0,
+            "take_profit": 1.2,
+            "status": "open",
+            "ai_article": "# 分析\n" + "内容 " * 200,
+            "created_at": now - timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+
+def _orm_position(trade: Trade, prices) -> PositionList:
+    """改造前的做法：ORM 实例逐行构建 Pydantic 模型"""
+    current_price = prices.get(trade.symbol) or safe_float(trade.current_price, trade.entry_price)
+    return PositionList(
+        id=trade.id,
+        intent_id=safe_str(trade.intent_id, f"manual-{trade.id}"),
+        symbol=safe_str(trade.symbol, "UNKNOWN"),
+        direction=safe_str(trade.direction, "long"),
+        units=safe_float(trade.units, 0.0),
+        entry_price=safe_float(trade.entry_price, 0.0),
+        stop_loss=safe_float(trade.stop_loss),
+        take_profit=safe_float(trade.take_profit),
+        current_price=safe_float(current_price, 0.0),
+        unrealized_pl=calculate_unrealized_pl(trade.entry_price, current_price, trade.units, safe_str(trade.direction, "long")),
+        margin=calculate_margin(trade.units, current_price),
+        created_at=trade.created_at
+    )
+
+
+async def orm_path(session: AsyncSession, prices) -> bytes:
+    stmt = select(Trade).where(Trade.status == "open").options(
+        defer(Trade.ai_article), defer(Trade.analysisJson)
+    ).order_by(Trade.created_at.desc())
+    trades = [t for t in (await session.execute(stmt)).scalars().all() if t.symbol]
+    models = [_orm_position(t, prices) for t in trades]
+    # FastAPI 对返回的模型实例会先 dump 再按 response_model 校验
+    content = [m.model_dump() for m in models]
+    body = positions_adapter.dump_json(positions_adapter.validate_python(content))
+    session.expunge_all()
+    return body
+
+
+async def row_path(session: AsyncSession, prices) -> bytes:
+    rows = (await session.execute(open_positions_stmt())).all()
+    content = [build_position(row, prices) for row in rows]
+    return positions_adapter.dump_json(positions_adapter.validate_python(content))
+
+
+async def run(engine: AsyncEngine, rows: int, repeat: int):
+    prices = {symbol: 1.1005 for symbol in SYMBOLS}
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(insert(Trade.__table__), _seed_rows(rows))
+            session = AsyncSession(bind=conn)
+            results = {}
+            for name, path in (("orm", orm_path), ("rows", row_path)):
+                await path(session, prices)  # 预热
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    body = await path(session, prices)
+                    timings.append((time.perf_counter() - started) * 1000)
+                results[name] = (statistics.median(timings), min(timings), len(body))
+            await session.close()
+        finally:
+            await transaction.rollback()
+
+    print(f"open 持仓 {rows} 行，每种方式 {repeat} 次")
+    for name, (median, best, size) in results.items():
+        print(f"  {name:5s} 中位数 {median:8.1f} ms  最快 {best:8.1f} ms  响应 {size / 1024:.0f} KiB")
+    print(f"  加速比 {results['orm'][0] / results['rows'][0]:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口读取路径基准")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from app.database import engine
+    engine.echo = False
+    asyncio.run(run(engine, args.rows, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+端到端压测：以固定并发请求运行中的后端，覆盖 app/routers 下的每个路由模块，
+输出每个场景的 p50 / p95 / p99 延迟和吞吐，并可与保存的基线对比
+
+准备（在 backend 目录下）：
+    python -m benchmarks.seed --size 100k
+    python -m benchmarks.oanda_stub --port 8081 --latency-ms 40
+    OANDA_API_URL=http://127.0.0.1:8081 OANDA_STREAM_URL=http://127.0.0.1:8081 \\
+    OANDA_API_KEY=bench OANDA_ACCOUNT_ID=bench-account uvicorn app.main:app --port 8000
+
+用法：
+    python -m benchmarks.load --concurrency 20 --duration 15 --save benchmarks/baseline.json
+    python -m benchmarks.load --concurrency 20 --duration 15 --compare benchmarks/baseline.json
+    python -m benchmarks.load --only analytics --compare benchmarks/baseline.json
+
+与基线对比时，p95 变慢或吞吐下降超过 --threshold（默认 10%）的场景标记为回退，进程以状态码 1 退出。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+import httpx
+
+
+@dataclass
+class Scenario:
+    name: str  # "模块 场景"，--only 按前缀过滤
+    method: str
+    path: Callable[[], str]
+    body: Optional[Callable[[], Any]] = None
+    on_response: Optional[Callable[[httpx.Response], None]] = None  # 成功响应的回调（计时之后调用）
+
+
+@dataclass
+class Result:
+    latencies: List[float] = field(default_factory=list)  # 毫秒
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.latencies)
+        total = len(ordered) + self.errors
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "throughput": round(total / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50": percentile(ordered, 50),
+            "p95": percentile(ordered, 95),
+            "p99": percentile(ordered, 99),
+        }
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """最近秩百分位数（ordered 已升序）"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return round(ordered[rank - 1], 2)
+
+
+async def discover(client: httpx.AsyncClient) -> Dict[str, List[str]]:
+    """从列表接口取出详情场景使用的 intent_id 和报告地址"""
+    pending = (await client.get("/api/orders/pending")).json()
+    positions = (await client.get("/api/positions/open")).json()
+    ids = {
+        "pending": [row["intent_id"] for row in pending[:200]],
+        "open": [row["intent_id"] for row in positions[:200]],
+        "articles": [],
+        "article_html": [],
+    }
+    for intent_id in ids["open"][:20]:
+        detail = (await client.get(f"/api/positions/open/{intent_id}")).json()
+        if detail.get("article"):
+            ids["articles"].append(detail["article"]["url"])
+            ids["article_html"].append(detail["article"]["html_url"])
+    return ids
+
+
+class HistoryPager:
+    """
+    沿 next_cursor 翻页：每个请求取走一个游标，成功后放回下一页的游标；
+    翻到最后一页（或请求失败）后从第一页重新开始，覆盖深翻页的游标条件
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._cursors: List[str] = []
+
+    def path(self) -> str:
+        params = {"limit": self.limit}
+        if self._cursors:
+            params["cursor"] = self._cursors.pop()
+        return f"/api/analytics/history?{urlencode(params)}"
+
+    def on_response(self, response: httpx.Response):
+        cursor = response.json().get("next_cursor")
+        if cursor:
+            self._cursors.append(cursor)
+
+
+def build_scenarios(ids: Dict[str, List[str]]) -> List[Scenario]:
+    counter = itertools.count()
+    run_id = int(time.time())
+
+    def pick(values: List[str], fallback: str) -> Callable[[], str]:
+        return lambda: random.choice(values) if values else fallback
+
+    pending_id = pick(ids["pending"], "missing")
+    open_id = pick(ids["open"], "missing")
+    article = pick(ids["articles"], "/api/trades/missing/article")
+    article_html = pick(ids["article_html"], "/api/trades/missing/article?format=html")
+    pager = HistoryPager(limit=50)
+
+    def webhook_body():
+        # 每个请求使用新的交易 ID，避免被去重直接返回
+        n = next(counter)
+        return {
+            "type": "ORDER_FILL",
+            "transaction": {"id": f"bench-{run_id}-{n}", "type": "ORDER_FILL", "orderID": str(500_000 + n % 1000)},
+        }
+
+    return [
+        Scenario("orders pending", "GET", lambda: "/api/orders/pending"),
+        Scenario("orders detail", "GET", lambda: f"/api/orders/pending/{pending_id()}"),
+        Scenario("positions open", "GET", lambda: "/api/positions/open"),
+        Scenario("positions detail", "GET", lambda: f"/api/positions/open/{open_id()}"),
+        Scenario("analytics stats", "GET", lambda: "/api/analytics/stats"),
+        Scenario("analytics equity-curve", "GET", lambda: "/api/analytics/equity-curve?max_points=1000"),
+        Scenario("analytics history", "GET", lambda: "/api/analytics/history?limit=50"),
+        Scenario("analytics history-pages", "GET", pager.path, on_response=pager.on_response),
+        Scenario(
+            "analytics signals", "POST", lambda: "/api/analytics/signals",
+            lambda: {"contains": {"timeframe": random.choice(["M15", "H1", "H4", "D"])}, "group_by": "setup.type"},
+        ),
+        Scenario("trades article", "GET", article),
+        Scenario("trades article-html", "GET", article_html),
+        Scenario("webhook oanda", "POST", lambda: "/api/webhook/oanda", webhook_body),
+        Scenario("api_config active", "GET", lambda: "/api/config/active"),
+    ]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> Result:
+    """concurrency 个 worker 循环发送请求；预热阶段的请求不计入结果"""
+    result = Result()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        while True:
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            try:
+                response = await client.request(
+                    scenario.method, scenario.path(),
+                    json=scenario.body() if scenario.body else None,
+                )
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            elapsed_ms = (time.perf_counter() - sent) * 1000
+            if ok and scenario.on_response:
+                scenario.on_response(response)
+            if sent < measure_from:
+                continue
+            if ok:
+                result.latencies.append(elapsed_ms)
+            else:
+                result.errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - measure_from
+    return result
+
+
+def print_table(results: Dict[str, Dict[str, float]]):
+    print(f"{'场景':<26}{'请求':>8}{'错误':>6}{'吞吐/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, s in results.items():
+        print(f"{name:<26}{s['requests']:>8}{s['errors']:>6}{s['throughput']:>9}{s['p50']:>9}{s['p95']:>9}{s['p99']:>9}")
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """逐场景对比基线，返回回退的场景名"""
+    regressions = []
+    print(f"\n与基线对比（{baseline['meta']['time']}，阈值 {threshold:.0f}%）")
+    print(f"{'场景':<26}{'p50':>10}{'p95':>10}{'p99':>10}{'吞吐':>10}")
+    for name, s in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<26}{'（基线中没有）':>10}")
+            continue
+        p95 = _change(base["p95"], s["p95"])
+        throughput = _change(base["throughput"], s["throughput"])
+        regressed = p95 > threshold or throughput < -threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<26}{_change(base['p50'], s['p50']):>+9.1f}%{p95:>+9.1f}%"
+            f"{_change(base['p99'], s['p99']):>+9.1f}%{throughput:>+9.1f}%"
+            f"{'  回退' if regressed else ''}"
+        )
+    return regressions
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        scenarios = build_scenarios(await discover(client))
+        if args.only:
+            scenarios = [s for s in scenarios if any(s.name.startswith(prefix) for prefix in args.only)]
+        results = {}
+        for scenario in scenarios:
+            result = await run_scenario(client, scenario, args.concurrency, args.duration, args.warmup)
+            results[scenario.name] = result.summary()
+            print(f"  {scenario.name}: {results[scenario.name]['throughput']} req/s", file=sys.stderr)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的计时时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个场景的预热时长（秒），不计入结果")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--only", nargs="*", help="只运行名称以这些前缀开头的场景，如 analytics、orders pending")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与基线 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定回退的变化百分比")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"\n并发 {args.concurrency}，每个场景 {args.duration:.0f} 秒")
+    print_table(results)
+
+    if args.save:
+        meta = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n已保存基线: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("concurrency") != args.concurrency:
+            print(f"注意：基线并发为 {baseline['meta'].get('concurrency')}，本次为 {args.concurrency}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n回退场景: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
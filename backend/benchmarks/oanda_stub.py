@@ -0,0 +1,212 @@
+"""
+本地 OANDA v20 桩服务：基准测试时代替真实接口，响应延迟和错误率可配置
+
+覆盖后端用到的接口（/v3/accounts/{account_id} 下）：
+    /pricing  /pricing/stream  /orders/{id}  /trades/{id}  /openTrades  /pendingOrders
+    /summary  /transactions/sinceid
+每个请求先按 --latency-ms ± --jitter-ms 休眠，再按 --error-rate 概率返回 503。
+运行中可通过 POST /_stub/config 调整参数，GET /_stub/stats 查看各接口的请求数，
+POST /_stub/drop-streams 断开当前所有价格流（测试重连）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.oanda_stub --port 8081 --latency-ms 40 --jitter-ms 10 --error-rate 0.01
+
+后端指向桩服务：
+    OANDA_API_URL=http://127.0.0.1:8081 OANDA_STREAM_URL=http://127.0.0.1:8081 \\
+    OANDA_API_KEY=bench OANDA_ACCOUNT_ID=bench-account uvicorn app.main:app --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="OANDA stub")
+
+BASE_PRICES = {
+    "EUR_USD": 1.0850, "GBP_USD": 1.2650, "USD_JPY": 150.20, "AUD_USD": 0.6550,
+    "USD_CAD": 1.3550, "XAU_USD": 2350.0, "NZD_USD": 0.6050, "EUR_JPY": 163.00,
+}
+
+
+class StubConfig(BaseModel):
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    stream_interval_ms: float = 250.0  # 价格流推送间隔
+
+
+config = StubConfig()
+request_counts: Counter = Counter()
+# 每次 drop-streams 加一，已打开的价格流发现变化后结束
+stream_generation = 0
+
+
+def _now() -> str:
+    """RFC3339，纳秒精度（与 OANDA 一致），微秒为 0 时同样输出完整的小数位"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+def _price(instrument: str) -> float:
+    """围绕基准价小幅随机波动"""
+    base = BASE_PRICES.get(instrument)
+    if base is None:
+        # 未知品种按名称生成稳定的基准价
+        base = 1 + int(hashlib.md5(instrument.encode()).hexdigest()[:4], 16) / 65536
+    return round(base * (1 + random.uniform(-0.0005, 0.0005)), 5)
+
+
+def _quote(instrument: str) -> Dict:
+    mid = _price(instrument)
+    spread = mid * 0.00005
+    return {
+        "type": "PRICE",
+        "instrument": instrument,
+        "time": _now(),
+        "bids": [{"price": f"{mid - spread:.5f}", "liquidity": 1000000}],
+        "asks": [{"price": f"{mid + spread:.5f}", "liquidity": 1000000}],
+        "tradeable": True,
+    }
+
+
+@app.middleware("http")
+async def inject(request: Request, call_next):
+    """按配置注入延迟和错误（/_stub 管理接口除外）"""
+    path = request.url.path
+    if path.startswith("/_stub"):
+        return await call_next(request)
+    parts = path.split("/")
+    # /v3/accounts/{id}/orders/123 -> orders；ID 段不计入
+    endpoint = "/".join(p for p in parts[4:] if p and not p[0].isdigit()) or path
+    request_counts[endpoint] += 1
+
+    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if random.random() < config.error_rate:
+        request_counts[f"{endpoint}:error"] += 1
+        return JSONResponse({"errorMessage": "Service Unavailable (injected)"}, status_code=503)
+    return await call_next(request)
+
+
+@app.get("/v3/accounts/{account_id}/pricing")
+async def pricing(account_id: str, instruments: str = ""):
+    return {"time": _now(), "prices": [_quote(i) for i in instruments.split(",") if i]}
+
+
+@app.get("/v3/accounts/{account_id}/pricing/stream")
+async def pricing_stream(account_id: str, request: Request, instruments: str = ""):
+    """分块 JSON 流：每行一个 PRICE，每 5 秒一个 HEARTBEAT"""
+    symbols = [i for i in instruments.split(",") if i]
+
+    async def lines():
+        generation = stream_generation
+        last_heartbeat = time.monotonic()
+        while generation == stream_generation and not await request.is_disconnected():
+            for symbol in symbols:
+                yield orjson.dumps(_quote(symbol)) + b"\n"
+            if time.monotonic() - last_heartbeat >= 5:
+                last_heartbeat = time.monotonic()
+                yield orjson.dumps({"type": "HEARTBEAT", "time": _now()}) + b"\n"
+            await asyncio.sleep(config.stream_interval_ms / 1000)
+
+    return StreamingResponse(lines(), media_type="application/octet-stream")
+
+
+@app.get("/v3/accounts/{account_id}/orders/{order_id}")
+async def get_order(account_id: str, order_id: str):
+    return {"order": {
+        "id": order_id, "type": "LIMIT", "instrument": "EUR_USD", "units": "1000",
+        "price": f"{_price('EUR_USD'):.5f}", "state": "PENDING", "createTime": _now(),
+    }, "lastTransactionID": "1"}
+
+
+@app.get("/v3/accounts/{account_id}/trades/{trade_id}")
+async def get_trade(account_id: str, trade_id: str):
+    price = _price("EUR_USD")
+    return {"trade": {
+        "id": trade_id, "instrument": "EUR_USD", "price": f"{price:.5f}", "currentUnits": "1000",
+        "state": "OPEN", "unrealizedPL": f"{random.uniform(-50, 50):.2f}", "financing": "-0.10",
+        "openTime": _now(),
+    }, "lastTransactionID": "1"}
+
+
+@app.get("/v3/accounts/{account_id}/openTrades")
+async def open_trades(account_id: str):
+    return {"trades": [], "lastTransactionID": "1"}
+
+
+@app.get("/v3/accounts/{account_id}/pendingOrders")
+async def pending_orders(account_id: str):
+    return {"orders": [], "lastTransactionID": "1"}
+
+
+@app.get("/v3/accounts/{account_id}/summary")
+async def summary(account_id: str):
+    return {"account": {
+        "id": account_id, "currency": "USD", "balance": "100000.00", "NAV": "100250.00",
+        "unrealizedPL": "250.00", "pl": "0.00", "resettablePL": "0.00", "marginUsed": "2500.00",
+        "marginAvailable": "97750.00", "marginCallPercent": "0.02", "positionValue": "50000.00",
+        "openTradeCount": 5, "openPositionCount": 3, "lastTransactionID": "1",
+    }, "lastTransactionID": "1"}
+
+
+@app.get("/v3/accounts/{account_id}/transactions/sinceid")
+async def transactions_since(account_id: str, id: Optional[str] = None):
+    return {"transactions": [], "lastTransactionID": id or "1"}
+
+
+@app.post("/_stub/config")
+async def update_config(update: StubConfig):
+    global config
+    config = update
+    return config
+
+
+@app.get("/_stub/stats")
+async def stats():
+    return {"config": config, "requests": dict(request_counts)}
+
+
+@app.post("/_stub/drop-streams")
+async def drop_streams():
+    global stream_generation
+    stream_generation += 1
+    return Response(status_code=204)
+
+
+@app.post("/_stub/reset")
+async def reset():
+    request_counts.clear()
+    return Response(status_code=204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OANDA 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率（0-1）")
+    parser.add_argument("--stream-interval-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    global config
+    config = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, stream_interval_ms=args.stream_interval_ms,
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+基准数据生成：向 trades、trade_articles、account_summary 写入合成数据
+
+使用 asyncpg 的 COPY 分批写入，百万行级别也只需几十秒；生成的 intent_id 均以 bench- 开头，
+--clean 只删除这些行。写入后重建该账户的 trade_stats 并 ANALYZE。
+
+状态分布：90% closed、5% open、5% pending；open / pending 的交易带 AI 报告。
+
+用法（在 backend 目录下，使用 .env 中的 DATABASE_URL）：
+    python -m benchmarks.seed --size 100k
+    python -m benchmarks.seed --rows 250000 --account 101-001-0000000-001
+    python -m benchmarks.seed --clean
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, List, Tuple
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.models import AccountSummary, Trade, TradeArticle
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SYMBOLS = ["EUR_USD", "GBP_USD", "USD_JPY", "AUD_USD", "USD_CAD", "XAU_USD", "NZD_USD", "EUR_JPY"]
+TIMEFRAMES = ["M15", "H1", "H4", "D"]
+SETUPS = ["breakout", "pullback", "reversal", "range"]
+CLOSE_REASONS = ["TAKE_PROFIT_ORDER", "STOP_LOSS_ORDER", "MARKET_ORDER", "TRAILING_STOP_LOSS_ORDER"]
+PREFIX = "bench-"
+STARTING_BALANCE = 100000.0
+
+TRADE_COLUMNS = [
+    "intent_id", "account_id", "symbol", "direction", "units", "order_type", "entry_price", "current_price",
+    "exit_price", "stop_loss", "take_profit", "status", "analysisJson", "confidence", "oanda_order_id",
+    "oanda_trade_id", "created_at", "updated_at", "realized_pl", "financing", "commission", "close_time",
+    "close_reason",
+]
+ARTICLE_COLUMNS = ["intent_id", "content", "content_hash", "content_length", "updated_at"]
+
+
+def _money(value: float) -> Decimal:
+    return Decimal(str(round(value, 2)))
+
+
+def trade_record(i: int, account_id: str, now: datetime, rng: random.Random) -> Tuple[Any, ...]:
+    """第 i 笔合成交易；平仓时间按 i 递增，覆盖约一年"""
+    roll = i % 20
+    status = "pending" if roll == 0 else "open" if roll == 1 else "closed"
+    symbol = SYMBOLS[i % len(SYMBOLS)]
+    direction = "long" if rng.random() < 0.55 else "short"
+    units = float(rng.choice((1000, 2000, 5000, 10000)))
+    entry = round(rng.uniform(0.6, 1.9), 5)
+    created = now - timedelta(minutes=30 * (i % 17520), seconds=i % 60)
+    analysis = json.dumps({
+        "timeframe": TIMEFRAMES[i % len(TIMEFRAMES)],
+        "setup": {"type": SETUPS[(i // 7) % len(SETUPS)]},
+        "confidence": round(rng.random(), 2),
+        "indicators": {"rsi": round(rng.uniform(10, 90), 1)},
+    })
+
+    exit_price = realized = close_time = close_reason = financing = commission = None
+    trade_id = None
+    if status != "pending":
+        trade_id = str(1_000_000 + i)
+    if status == "closed":
+        move = rng.gauss(0.0003, 0.002)
+        exit_price = round(entry + move, 5)
+        pl = (exit_price - entry) * units * (1 if direction == "long" else -1)
+        realized = _money(pl)
+        financing = _money(-rng.random())
+        commission = _money(0)
+        close_time = (created + timedelta(hours=rng.uniform(0.1, 72))).replace(tzinfo=timezone.utc)
+        if i % 200 == 2:
+            # 少量没有平仓时间的行（N8N 直接写库的情况），历史翻页会翻到 close_time 为 NULL 的一段
+            close_time = None
+        close_reason = rng.choice(CLOSE_REASONS)
+
+    return (
+        f"{PREFIX}{i}", account_id, symbol, direction, units, "limit", entry, entry, exit_price,
+        round(entry * 0.99, 5), round(entry * 1.01, 5), status, analysis, round(rng.random(), 2),
+        str(500_000 + i), trade_id, created, created, realized, financing, commission, close_time, close_reason,
+    )
+
+
+def article_record(intent_id: str, symbol: str, now: datetime) -> Tuple[Any, ...]:
+    content = f"# {symbol} 分析\n\n" + "\n".join(f"- 要点 {n}：价格结构与成交量" for n in range(40))
+    return (intent_id, content, hashlib.md5(content.encode()).hexdigest(), len(content), now)
+
+
+async def _copy(conn, table: str, columns: List[str], records: List[Tuple[Any, ...]]):
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def seed(engine: AsyncEngine, rows: int, account_id: str, batch_size: int, seed_value: int):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    async with engine.connect() as conn:
+        for offset in range(0, rows, batch_size):
+            trades = [trade_record(i, account_id, now, rng) for i in range(offset, min(offset + batch_size, rows))]
+            articles = [article_record(t[0], t[2], now) for t in trades if t[11] != "closed"]
+            await _copy(conn, "trades", TRADE_COLUMNS, trades)
+            await _copy(conn, "trade_articles", ARTICLE_COLUMNS, articles)
+            await conn.commit()
+            print(f"  已写入 {min(offset + batch_size, rows):>9} / {rows} 行")
+
+        await conn.execute(
+            insert(AccountSummary).values(
+                account_id=account_id, currency="USD", balance=STARTING_BALANCE, nav=STARTING_BALANCE,
+                unrealized_pl=0, pl=0, margin_used=0, margin_available=STARTING_BALANCE,
+                open_trade_count=rows // 20, open_order_count=rows // 20, updated_at=now,
+            ).on_conflict_do_nothing(index_elements=["account_id"])
+        )
+        await conn.commit()
+        # 仅索引扫描依赖可见性映射，VACUUM 需在事务外执行
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("VACUUM ANALYZE trades")
+        await conn.exec_driver_sql("ANALYZE trade_articles")
+
+    from app.trade_stats import rebuild_trade_stats
+    async with AsyncSession(engine) as db:
+        stats = await rebuild_trade_stats(db, account_id)
+    print(f"写入 {rows} 行，耗时 {time.perf_counter() - started:.1f} 秒；已平仓 {stats.total_trades} 笔")
+
+
+async def clean(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        articles = await conn.execute(delete(TradeArticle).where(TradeArticle.intent_id.startswith(PREFIX)))
+        trades = await conn.execute(delete(Trade).where(Trade.intent_id.startswith(PREFIX)))
+    print(f"已删除 {trades.rowcount} 笔交易、{articles.rowcount} 篇报告（account_summary / trade_stats 保留）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基准数据生成")
+    parser.add_argument("--size", type=str.lower, choices=sorted(SIZES), default="1k", help="预设行数：1k / 100k / 1m")
+    parser.add_argument("--rows", type=int, help="自定义行数，优先于 --size")
+    parser.add_argument("--account", default=None, help="账户 ID，默认为 OANDA_ACCOUNT_ID")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子，相同参数生成相同数据")
+    parser.add_argument("--clean", action="store_true", help="删除之前生成的数据")
+    args = parser.parse_args()
+
+    from app.database import engine
+    from app.oanda import OANDA_ACCOUNT_ID
+    if args.clean:
+        asyncio.run(clean(engine))
+        return
+    account_id = args.account or OANDA_ACCOUNT_ID or "bench-account"
+    rows = args.rows or SIZES[args.size]
+    asyncio.run(seed(engine, rows, account_id, args.batch_size, args.seed))
+
+
+if __name__ == "__main__":
+    main()
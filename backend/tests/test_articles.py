@@ -0,0 +1,39 @@
+import pytest
+from app.articles import is_safe_url, render_markdown
+
+pytest.importorskip("markdown")
+
+
+@pytest.mark.parametrize("source", [
+    "[x](javascript:alert(1))",
+    "[x]( JaVaScRiPt:alert(1))",
+    "[x](<javascript:alert(1)>)",
+    "[x](javascript&#58;alert(1))",
+    "[x](&#106;avascript:alert(1))",
+    "[x][r]\n\n[r]: javascript:alert(1)",
+    "![i](javascript:alert(1))",
+    "![i](data:text/html;base64,PHNjcmlwdD4=)",
+])
+def test_unsafe_link_and_image_targets_are_removed(source):
+    rendered = render_markdown(source)
+    assert "href=" not in rendered
+    assert "src=" not in rendered
+    assert "javascript" not in rendered.lower()
+
+
+def test_safe_targets_are_kept():
+    rendered = render_markdown("[a](https://example.com/x?y=1) [b](/api/trades) [c](#top) [d](mailto:ops@example.com)")
+    assert 'href="https://example.com/x?y=1"' in rendered
+    assert 'href="/api/trades"' in rendered
+    assert 'href="#top"' in rendered
+    assert 'href="mailto:ops@example.com"' in rendered
+
+
+def test_raw_html_is_escaped():
+    assert "<script>" not in render_markdown("<script>alert(1)</script>")
+
+
+def test_is_safe_url_ignores_whitespace_and_control_characters():
+    assert not is_safe_url("java\tscript:alert(1)")
+    assert not is_safe_url("\x01javascript:alert(1)")
+    assert is_safe_url("reports/a:b")
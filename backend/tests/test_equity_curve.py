@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy.dialects.postgresql import asyncpg
+from app.routers.analytics import equity_curve_stmt
+
+
+def _buckets(stmt) -> int:
+    compiled = stmt.compile(dialect=asyncpg.dialect())
+    (name,) = [key for key in compiled.params if key.startswith("ntile")]
+    return compiled.params[name]
+
+
+@pytest.mark.parametrize("max_points", [10, 11, 1000, 10000])
+@pytest.mark.parametrize("date_from", [None, datetime(2024, 1, 1, tzinfo=timezone.utc)])
+def test_point_count_never_exceeds_max_points(max_points, date_from):
+    # 每桶最多 2 点（最小、最大）+ 首尾两点 + 未指定 from 时补的起始点
+    synthetic_start = 1 if date_from is None else 0
+    points = 2 * _buckets(equity_curve_stmt("acc", date_from, None, max_points)) + 2 + synthetic_start
+    assert points <= max_points
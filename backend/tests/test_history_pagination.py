@@ -0,0 +1,90 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.dialects.postgresql import asyncpg
+from app.queries import closed_history_page_stmt
+from app.routers.analytics import _trade_history, decode_history_cursor, encode_history_cursor
+
+# 设置 TEST_DATABASE_URL（postgresql+asyncpg://...）时对真实数据库翻页
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def _compile(stmt):
+    return stmt.compile(dialect=asyncpg.dialect())
+
+
+def test_cursor_round_trip_is_timezone_aware():
+    close_time = datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_history_cursor(encode_history_cursor(close_time, 42)) == (close_time, 42)
+    # 旧游标中不带时区的时间按 UTC 处理
+    naive = decode_history_cursor(encode_history_cursor(close_time.replace(tzinfo=None), 42))
+    assert naive == (close_time, 42)
+
+
+def test_page_two_binds_cursor_as_timestamptz():
+    after = decode_history_cursor(encode_history_cursor(datetime(2024, 3, 1, tzinfo=timezone.utc), 42))
+    compiled = _compile(closed_history_page_stmt("acc", 51, after))
+    sql = compiled.string
+    assert "(trades.close_time, trades.id) < (" in sql
+    assert "::TIMESTAMP WITH TIME ZONE" in sql
+    assert "WITHOUT TIME ZONE" not in sql
+    # 非 NULL 段不再用 OR 混入 close_time IS NULL，保持单一范围条件
+    assert " OR " not in sql
+    assert "trades.close_time IS NOT NULL" in sql
+
+
+def test_null_close_time_tail_is_separate_phase():
+    sql = _compile(closed_history_page_stmt("acc", 51, (None, 42), null_close_time=True)).string
+    assert "trades.close_time IS NULL" in sql
+    assert "trades.id < " in sql
+    assert " OR " not in sql
+    # 从非 NULL 段进入 NULL 段时从头开始
+    sql = _compile(closed_history_page_stmt("acc", 51, (datetime.now(timezone.utc), 42), null_close_time=True)).string
+    assert "trades.id < " not in sql
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="未设置 TEST_DATABASE_URL")
+def test_pages_through_real_database():
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from app.database import Base
+    from app.models import Trade
+
+    account_id = "test-history-pagination"
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # 包含相同平仓时间和 close_time 为 NULL 的行，验证跨越两段的游标
+    close_times = [base + timedelta(hours=h) for h in (5, 5, 4, 3, 3, 2)] + [None, None, None]
+
+    async def run():
+        engine = create_async_engine(TEST_DATABASE_URL)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSession(engine) as db:
+                db.add_all([
+                    Trade(intent_id=f"{account_id}-{n}", account_id=account_id, symbol="EUR_USD", status="closed",
+                          direction="long", units=1000, entry_price=1.1, exit_price=1.2, close_time=close_time)
+                    for n, close_time in enumerate(close_times)
+                ])
+                await db.commit()
+
+                pages, cursor = [], None
+                while True:
+                    page = await _trade_history(db, account_id, 2, cursor)
+                    pages.append([item["id"] for item in page["items"]])
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        break
+
+                expected = await _trade_history(db, account_id, 100, None)
+                return pages, [item["id"] for item in expected["items"]]
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(delete(Trade).where(Trade.account_id == account_id))
+            await engine.dispose()
+
+    pages, expected = asyncio.run(run())
+    assert len(pages) == 5
+    assert [trade_id for page in pages for trade_id in page] == expected
+    assert len(expected) == len(close_times)
@@ -0,0 +1,76 @@
+import asyncio
+import socket
+import time
+import pytest
+import uvicorn
+from app import price_stream
+from app.price_stream import PriceBook, PriceStreamer
+from benchmarks import oanda_stub
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.02)
+
+
+def _consume_tasks():
+    return [t for t in asyncio.all_tasks() if "PriceStreamer._consume" in repr(t.get_coro())]
+
+
+def test_streamer_against_stub(monkeypatch):
+    monkeypatch.setattr(price_stream, "PRICE_STREAM_BACKOFF_MIN", 0.05)
+    monkeypatch.setattr(oanda_stub, "config", oanda_stub.StubConfig(stream_interval_ms=20))
+    port = _free_port()
+
+    async def run():
+        server = uvicorn.Server(uvicorn.Config(oanda_stub.app, host="127.0.0.1", port=port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        await _until(lambda: server.started)
+
+        symbols = {"EUR_USD"}
+
+        async def load_symbols():
+            return set(symbols)
+
+        book = PriceBook()
+        streamer = PriceStreamer(book, stream_url=f"http://127.0.0.1:{port}", symbols_loader=load_symbols)
+        try:
+            # 连接
+            await streamer.start()
+            await _until(lambda: book.get("EUR_USD") is not None)
+
+            # 订阅变化：按新集合重连，旧品种移出价格簿
+            symbols.clear()
+            symbols.add("GBP_USD")
+            await streamer.refresh_subscriptions()
+            await _until(lambda: book.get("GBP_USD") is not None)
+            assert book.get("EUR_USD") is None
+            assert streamer.reconnects == 0
+
+            # 断线：退避后自动重连
+            oanda_stub.stream_generation += 1
+            await _until(lambda: streamer.reconnects == 1)
+            await _until(lambda: book.live)
+
+            # 停止：流连接和等待任务随之结束，价格簿不再续期
+            await streamer.stop()
+            assert not book.live
+            await asyncio.sleep(0.3)
+            assert not book.live
+            assert _consume_tasks() == []
+        finally:
+            await streamer.stop()
+            server.should_exit = True
+            # 没有遗留的流连接时桩服务可以正常退出
+            await asyncio.wait_for(serving, timeout=5)
+
+    asyncio.run(run())
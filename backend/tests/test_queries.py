@@ -0,0 +1,13 @@
+from sqlalchemy.dialects.postgresql import asyncpg
+from app.queries import closed_history_page_stmt, open_positions_stmt, pending_orders_stmt
+
+
+def _sql(stmt) -> str:
+    return stmt.compile(dialect=asyncpg.dialect()).string
+
+
+def test_status_is_rendered_as_constant_for_partial_indexes():
+    # 部分索引的 WHERE status = '...' 只能由常量条件匹配，不能是 $n 参数
+    assert "trades.status = 'pending'" in _sql(pending_orders_stmt("acc"))
+    assert "trades.status = 'open'" in _sql(open_positions_stmt("acc"))
+    assert "trades.status = 'closed'" in _sql(closed_history_page_stmt("acc", 51))
@@ -7,6 +7,13 @@ import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
 import { ArrowLeft, TrendingUp, TrendingDown, Clock, DollarSign } from 'lucide-react'
 
+interface ArticleRef {
+  url: string
+  html_url: string
+  version: string
+  length: number
+}
+
 interface OrderDetail {
   id: number
   intent_id: string
@@ -20,7 +27,7 @@ interface OrderDetail {
   stop_loss: number | null
   take_profit: number | null
   status: string
-  ai_article: string | null
+  article: ArticleRef | null
   analysisJson: any
   confidence: number | null
   oanda_order_id: string | null
@@ -40,6 +47,13 @@ export default function OrderDetailPage() {
     { refreshInterval: 5000 }
   )
 
+  // 报告单独加载：详情轮询不再重复传输报告，URL 带版本号，报告更新后才重新请求
+  const { data: article } = useSWR<string>(
+    order?.article?.url ?? null,
+    (url: string) => api.getTradeArticle(url),
+    { revalidateOnFocus: false }
+  )
+
   if (isLoading) {
     return (
       <div className="space-y-6 animate-pulse">
@@ -171,7 +185,7 @@ export default function OrderDetailPage() {
         )}
       </div>
 
-      {order.ai_article && (
+      {article && (
         <div className="glass-effect rounded-xl p-8">
           <h2 className="text-2xl font-bold mb-6 flex items-center space-x-2">
             <span className="bg-gradient-to-r from-blue-400 to-purple-500 bg-clip-text text-transparent">
@@ -180,7 +194,7 @@ export default function OrderDetailPage() {
           </h2>
           <div className="prose prose-invert prose-blue max-w-none overflow-hidden">
             <ReactMarkdown remarkPlugins={[remarkGfm]} className="markdown-content">
-              {order.ai_article}
+              {article}
             </ReactMarkdown>
           </div>
         </div>
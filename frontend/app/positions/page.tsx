@@ -1,5 +1,6 @@
 'use client'
 
+import { useEffect, useState } from 'react'
 import useSWR from 'swr'
 import { api } from '@/lib/api'
 import Link from 'next/link'
@@ -20,13 +21,45 @@ interface Position {
   created_at: string
 }
 
+type PositionDelta = Pick<Position, 'id' | 'current_price' | 'unrealized_pl' | 'margin'>
+
 export default function PositionsPage() {
-  const { data: positions, error, isLoading } = useSWR<Position[]>(
+  // 推送连接可用时停止轮询，断开后回退到每 3 秒轮询
+  const [streaming, setStreaming] = useState(false)
+  const { data: positions, error, isLoading, mutate } = useSWR<Position[]>(
     '/api/positions/open',
     api.getOpenPositions,
-    { refreshInterval: 3000 }
+    { refreshInterval: streaming ? 0 : 3000 }
   )
 
+  useEffect(() => {
+    const source = new EventSource(api.positionsStreamUrl)
+
+    source.onopen = () => setStreaming(true)
+    source.onerror = () => setStreaming(false)
+
+    // snapshot：完整持仓列表
+    source.addEventListener('snapshot', (event) => {
+      const snapshot: Position[] = JSON.parse((event as MessageEvent).data)
+      mutate(snapshot, { revalidate: false })
+    })
+
+    // delta：仅包含市价 / 盈亏 / 保证金有变化的持仓
+    source.addEventListener('delta', (event) => {
+      const deltas: PositionDelta[] = JSON.parse((event as MessageEvent).data)
+      const byId = new Map(deltas.map((delta) => [delta.id, delta]))
+      mutate(
+        (current) => current?.map((position) => {
+          const delta = byId.get(position.id)
+          return delta ? { ...position, ...delta } : position
+        }),
+        { revalidate: false }
+      )
+    })
+
+    return () => source.close()
+  }, [mutate])
+
   if (isLoading) {
     return (
       <div className="space-y-6 animate-pulse">
@@ -8,6 +8,15 @@ export const fetcher = async (url: string) => {
   return res.json()
 }
 
+// 文本响应（AI 分析报告等），带版本号的 URL 由浏览器长期缓存
+export const textFetcher = async (url: string) => {
+  const res = await fetch(`${API_URL}${url}`)
+  if (!res.ok) {
+    throw new Error('请求失败')
+  }
+  return res.text()
+}
+
 export const api = {
   // 挂单相关
   getPendingOrders: () => fetcher('/api/orders/pending'),
@@ -16,6 +25,10 @@ export const api = {
   // 头寸相关
   getOpenPositions: () => fetcher('/api/positions/open'),
   getPositionDetail: (intentId: string) => fetcher(`/api/positions/open/${intentId}`),
+  positionsStreamUrl: `${API_URL}/api/positions/stream`,
+  
+  // AI 分析报告（url 来自详情接口返回的 article.url）
+  getTradeArticle: (url: string) => textFetcher(url),
   
   // 分析相关
   getAccountStats: () => fetcher('/api/analytics/stats'),